@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+'''
+Benchmark harness for parameter balancing.
+
+Runs the complete wrapper pipeline on the example models that are shipped
+in files/example_files, collects the total and per-stage timings (see
+ParameterBalancing.stage) together with the peak memory and stores the
+results as JSON. A stored result can be used as baseline; the benchmark
+then fails if a model that worked in the baseline fails, or if a timing
+or a peak memory exceeds the baseline by more than the given threshold.
+
+With --scaling, synthetic models of the given sizes (see synthetic.py)
+are balanced instead and the stage timings and memory can be plotted
+against the model size. With --imports, the import time of the modules
+is measured in fresh interpreters.
+'''
+import argparse
+import contextlib
+import copy
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy
+
+try:
+    from . import balancer
+    from . import kineticizer
+    from . import misc
+    from . import parameter_balancing_core
+    from . import SBtab
+    from . import synthetic
+except:
+    import balancer
+    import kineticizer
+    import misc
+    import parameter_balancing_core
+    import SBtab
+    import synthetic
+
+example_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'files', 'example_files')
+
+# name: (SBML model, SBtab data file, SBtab prior file)
+example_models = {'ecoli_noor': ('ecoli/ecoli_noor_2016.xml',
+                                 'ecoli/ecoli_noor_2016_data.tsv', None),
+                  'ecoli_wortel': ('ecoli/ecoli_wortel_2018.xml',
+                                   'ecoli/ecoli_wortel_2018_data.tsv', None),
+                  'hynne': ('hynne/hynne.xml', 'hynne/hynne_data.tsv', None),
+                  'jiang': ('jiang/jiang.xml', 'jiang/jiang_data.tsv', None),
+                  'jol': ('jol/jol.xml', 'jol/jol.tsv', None),
+                  'pfk': ('pfk/pfk.xml', 'pfk/pfk_data.tsv', None),
+                  'teusink': ('teusink/teusink.xml', 'teusink/teusink_data.tsv',
+                              None)}
+
+percentiles = [10, 50, 90]
+import_modules = ['SBtab', 'validatorSBtab', 'misc', 'tablibIO', 'kineticizer',
+                  'balancer', 'parameter_balancing_core']
+
+
+def summarise(values):
+    '''
+    median, percentiles and extremes of a list of timings
+    '''
+    values = numpy.array(values, dtype=float)
+    summary = {'median': float(numpy.median(values)),
+               'min': float(values.min()),
+               'max': float(values.max())}
+    for p in percentiles:
+        summary['p%s' % p] = float(numpy.percentile(values, p))
+    return summary
+
+
+def run_wrapper(sbml, sbtab_data=None, sbtab_prior=None, profile_memory=False):
+    '''
+    runs the wrapper pipeline once in a temporary directory and returns the
+    total wall time and the per-stage profile
+    '''
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_name = os.path.join(tmp_dir, 'benchmark')
+        profile_name = os.path.join(tmp_dir, 'profile.json')
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            parameter_balancing_core.parameter_balancing_wrapper(sbml,
+                                                                 sbtab_data,
+                                                                 sbtab_prior,
+                                                                 output_name=output_name,
+                                                                 profile_name=profile_name,
+                                                                 profile_memory=profile_memory)
+        total = time.perf_counter() - start
+        with open(profile_name) as p_file:
+            profile = json.load(p_file)
+    return total, profile
+
+
+def benchmark_model(name, repeats=5, path=example_path):
+    '''
+    benchmarks one example model: repeats timed runs and one additional run
+    with memory tracing (tracemalloc distorts the timings)
+    '''
+    (sbml, data, prior) = example_models[name]
+    sbml = os.path.join(path, sbml)
+    if data: data = os.path.join(path, data)
+    if prior: prior = os.path.join(path, prior)
+
+    totals = []
+    stage_times = {}
+    for i in range(repeats):
+        (total, profile) = run_wrapper(sbml, data, prior)
+        totals.append(total)
+        for stage, entry in profile['stages'].items():
+            stage_times.setdefault(stage, []).append(entry['wall_time'])
+
+    (total, profile) = run_wrapper(sbml, data, prior, profile_memory=True)
+    stages = {}
+    for stage, times in stage_times.items():
+        stages[stage] = summarise(times)
+        entry = profile['stages'].get(stage, {})
+        stages[stage]['peak_memory'] = entry.get('peak_memory')
+        if 'sizes' in entry:
+            stages[stage]['sizes'] = entry['sizes']
+
+    peaks = [s['peak_memory'] for s in stages.values() if s['peak_memory']]
+    return {'reactions': profile['reactions'],
+            'species': profile['species'],
+            'total': summarise(totals),
+            'peak_memory': max(peaks) if peaks else None,
+            'stages': stages}
+
+
+def run_benchmarks(models=None, repeats=5, path=example_path):
+    '''
+    benchmarks the given example models (default: all); models that fail
+    are reported with their error message
+    '''
+    if not models: models = sorted(example_models.keys())
+    results = {'date': str(datetime.datetime.now()),
+               'python': platform.python_version(),
+               'numpy': numpy.__version__,
+               'repeats': repeats,
+               'models': {}}
+    for name in models:
+        try:
+            results['models'][name] = benchmark_model(name, repeats, path)
+        except (Exception, SystemExit) as e:
+            results['models'][name] = {'error': '%s: %s' % (type(e).__name__,
+                                                            e)}
+    return results
+
+
+def run_pipeline(sbml_model, sbtab_data, profile_memory=False):
+    '''
+    balances a model in memory with the default prior and options (the
+    wrapper refuses models with more than 250 reactions) and returns the
+    per-stage profile
+    '''
+    pb = balancer.ParameterBalancing(sbml_model, profile_memory=profile_memory)
+    default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'files', 'default_files')
+    with open(os.path.join(default_path, 'pb_prior.tsv')) as p_file:
+        sbtab_prior = SBtab.SBtabTable(p_file.read(), 'pb_prior.tsv')
+    with open(os.path.join(default_path, 'pb_options.tsv')) as o_file:
+        sbtab_options = SBtab.SBtabTable(o_file.read(), 'pb_options.tsv')
+    (pseudos, priors, pmin, pmax) = misc.extract_pseudos_priors(sbtab_prior)
+    (parameter_dict, log) = misc.readout_config(sbtab_options)
+    parameter_dict.pop('size_limit', None)
+    for quantity in balancer.name2index:
+        parameter_dict.setdefault(quantity, True)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sbtab = pb.make_sbtab(sbtab_data, sbtab_data.filename, 'All organisms',
+                              43, pmin, pmax, parameter_dict)
+        sbtab_new = pb.fill_sbtab(copy.deepcopy(sbtab), pseudos, priors)
+        sbtab_final = pb.make_balancing(sbtab_new, sbtab, pmin, pmax,
+                                        parameter_dict)[0]
+        with pb.stage('kineticize'):
+            kineticizer.KineticizerCS(sbml_model, sbtab_final, 'hal', True,
+                                      'complete_inh', 'complete_act', True)
+    return pb.profile
+
+
+def run_scaling(sizes, repeats=3, modifier_density=0.2, coverage=0.3, seed=1):
+    '''
+    balances synthetic models of the given numbers of reactions and
+    summarises the stage timings and peak memory per size
+    '''
+    results = {'date': str(datetime.datetime.now()),
+               'python': platform.python_version(),
+               'numpy': numpy.__version__,
+               'repeats': repeats,
+               'modifier_density': modifier_density,
+               'coverage': coverage,
+               'sizes': {}}
+    for size in sizes:
+        document = synthetic.make_model(size, modifier_density=modifier_density,
+                                        seed=seed)
+        sbtab_data = synthetic.make_data_sbtab(document.getModel(), coverage,
+                                               seed=seed)
+        stage_times = {}
+        totals = []
+        for i in range(repeats):
+            # the kineticizer alters the model, so every run gets a copy
+            run_document = document.clone()
+            start = time.perf_counter()
+            profile = run_pipeline(run_document.getModel(), sbtab_data)
+            totals.append(time.perf_counter() - start)
+            for stage, entry in profile.items():
+                stage_times.setdefault(stage, []).append(entry['wall_time'])
+        profile = run_pipeline(document.clone().getModel(), sbtab_data,
+                               profile_memory=True)
+        stages = {}
+        for stage, times in stage_times.items():
+            stages[stage] = summarise(times)
+            stages[stage]['peak_memory'] = profile[stage].get('peak_memory')
+            if 'sizes' in profile[stage]:
+                stages[stage]['sizes'] = profile[stage]['sizes']
+        results['sizes'][str(size)] = {'species': document.getModel().getNumSpecies(),
+                                       'total': summarise(totals),
+                                       'stages': stages}
+    return results
+
+
+def plot_scaling(results, filename):
+    '''
+    plots median time and peak memory of every stage against the model size
+    (requires matplotlib)
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    sizes = sorted(results['sizes'], key=int)
+    x = [int(size) for size in sizes]
+    stages = []
+    for size in sizes:
+        for stage in results['sizes'][size]['stages']:
+            if stage not in stages: stages.append(stage)
+
+    (fig, (ax_time, ax_memory)) = plt.subplots(1, 2, figsize=(12, 5))
+    ax_time.plot(x, [results['sizes'][s]['total']['median'] for s in sizes],
+                 'k-o', label='total')
+    for stage in stages:
+        entries = [results['sizes'][s]['stages'].get(stage) for s in sizes]
+        ax_time.plot(x, [e['median'] if e else numpy.nan for e in entries],
+                     '-o', label=stage)
+        ax_memory.plot(x, [e['peak_memory'] if e and e['peak_memory']
+                           else numpy.nan for e in entries], '-o', label=stage)
+    for (ax, label) in [(ax_time, 'median time (s)'),
+                        (ax_memory, 'peak memory (bytes)')]:
+        ax.set_xscale('log')
+        ax.set_yscale('log')
+        ax.set_xlabel('number of reactions')
+        ax.set_ylabel(label)
+    ax_time.legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(filename)
+
+
+def print_scaling(results):
+    for size in sorted(results['sizes'], key=int):
+        result = results['sizes'][size]
+        print('%6s reactions  median %.3fs' % (size, result['total']['median']))
+        for stage, entry in result['stages'].items():
+            print('    %-16s median %.4fs  peak %s bytes'
+                  % (stage, entry['median'], entry['peak_memory']))
+
+
+def measure_imports(modules=None, repeats=5):
+    '''
+    measures the time it takes to import each module in a fresh interpreter,
+    which is what every short-lived batch process pays on start-up
+    '''
+    if not modules: modules = import_modules
+    module_path = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([module_path] +
+                                        [p for p in [env.get('PYTHONPATH')] if p])
+    code = 'import time; t = time.perf_counter(); import %s; '\
+           'print(time.perf_counter() - t)'
+    results = {'date': str(datetime.datetime.now()),
+               'python': platform.python_version(),
+               'repeats': repeats,
+               'imports': {}}
+    for module in modules:
+        times = []
+        for i in range(repeats):
+            output = subprocess.check_output([sys.executable, '-c',
+                                              code % module], env=env)
+            times.append(float(output.decode().split()[-1]))
+        results['imports'][module] = summarise(times)
+    return results
+
+
+def compare_failures(results, baseline, models=None):
+    '''
+    returns the models (model, error message) that have a result in the
+    baseline, but fail in results or are missing from them; models limits
+    the check to the models that were benchmarked (default: all models of
+    the baseline)
+    '''
+    failures = []
+    for name, old in sorted(baseline.get('models', {}).items()):
+        if models and name not in models:
+            continue
+        if 'error' in old:
+            continue
+        current = results['models'].get(name)
+        if current is None:
+            failures.append((name, 'no result'))
+        elif 'error' in current:
+            failures.append((name, current['error']))
+    return failures
+
+
+def compare(results, baseline, threshold=0.2, min_time=0.01):
+    '''
+    compares the median timings of results with a baseline; returns a list
+    of regressions (model, stage, baseline median, current median). stages
+    with a baseline median below min_time seconds are ignored as noise;
+    models that fail are reported by compare_failures.
+    '''
+    regressions = []
+    for name, current in results['models'].items():
+        old = baseline.get('models', {}).get(name)
+        if not old or 'error' in old or 'error' in current:
+            continue
+        pairs = [('total', old['total'], current['total'])]
+        for stage, entry in current['stages'].items():
+            if stage in old['stages']:
+                pairs.append((stage, old['stages'][stage], entry))
+        for (stage, old_entry, new_entry) in pairs:
+            if old_entry['median'] < min_time:
+                continue
+            if new_entry['median'] > old_entry['median'] * (1 + threshold):
+                regressions.append((name, stage, old_entry['median'],
+                                    new_entry['median']))
+    return regressions
+
+
+def compare_memory(results, baseline, threshold=0.2, min_memory=65536):
+    '''
+    compares the peak memory of results with a baseline; returns a list of
+    regressions (model, stage, baseline peak, current peak) in bytes; the
+    stage 'total' is the peak of the whole run. peaks below min_memory
+    bytes in the baseline are ignored as noise; models that fail are
+    reported by compare_failures.
+    '''
+    regressions = []
+    for name, current in results['models'].items():
+        old = baseline.get('models', {}).get(name)
+        if not old or 'error' in old or 'error' in current:
+            continue
+        pairs = [('total', old.get('peak_memory'), current.get('peak_memory'))]
+        for stage, entry in current['stages'].items():
+            if stage in old['stages']:
+                pairs.append((stage, old['stages'][stage].get('peak_memory'),
+                              entry.get('peak_memory')))
+        for (stage, old_peak, new_peak) in pairs:
+            if old_peak is None or new_peak is None or old_peak < min_memory:
+                continue
+            if new_peak > old_peak * (1 + threshold):
+                regressions.append((name, stage, old_peak, new_peak))
+    return regressions
+
+
+def print_results(results):
+    for name, result in sorted(results['models'].items()):
+        if 'error' in result:
+            print('%-16s failed (%s)' % (name, result['error']))
+            continue
+        print('%-16s %4s reactions  median %.3fs  p90 %.3fs  peak %s bytes'
+              % (name, result['reactions'], result['total']['median'],
+                 result['total']['p90'], result['peak_memory']))
+        for stage, entry in result['stages'].items():
+            print('    %-16s median %.4fs  p90 %.4fs'
+                  % (stage, entry['median'], entry['p90']))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('models', nargs='*', help='Names of the example models to benchmark (default: all).')
+    parser.add_argument('-r', '--repeats', type=int, default=5, help='Number of timed runs per model.')
+    parser.add_argument('-o', '--output', help='Path for the JSON results.')
+    parser.add_argument('-b', '--baseline', help='Path to JSON results of an earlier run to compare with.')
+    parser.add_argument('-t', '--threshold', type=float, default=0.2, help='Allowed relative slowdown against the baseline.')
+    parser.add_argument('-m', '--memory_threshold', type=float, default=0.2, help='Allowed relative increase of the peak memory against the baseline.')
+    parser.add_argument('--scaling', help='Comma-separated numbers of reactions of synthetic models to benchmark instead of the examples.')
+    parser.add_argument('--modifier_density', type=float, default=0.2, help='Expected number of regulators per synthetic reaction.')
+    parser.add_argument('--plot', help='Path for a plot of the scaling benchmark (requires matplotlib).')
+    parser.add_argument('--imports', action='store_true', help='Measure the import time of the modules instead.')
+
+    args = parser.parse_args()
+
+    if args.imports:
+        results = measure_imports(repeats=args.repeats)
+        for module, summary in results['imports'].items():
+            print('%-26s median %.3fs  p90 %.3fs' % (module, summary['median'],
+                                                     summary['p90']))
+        if args.output:
+            with open(args.output, 'w') as o_file:
+                json.dump(results, o_file, indent=2)
+        sys.exit()
+
+    if args.scaling:
+        sizes = [int(size) for size in args.scaling.split(',')]
+        results = run_scaling(sizes, args.repeats, args.modifier_density)
+        print_scaling(results)
+        if args.output:
+            with open(args.output, 'w') as o_file:
+                json.dump(results, o_file, indent=2)
+        if args.plot:
+            try: plot_scaling(results, args.plot)
+            except ImportError:
+                print('The plot requires matplotlib, which is not installed.')
+        sys.exit()
+
+    for name in args.models:
+        if name not in example_models:
+            parser.error('unknown model %s; choose from %s'
+                         % (name, ', '.join(sorted(example_models))))
+
+    results = run_benchmarks(args.models, args.repeats)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as o_file:
+            json.dump(results, o_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as b_file:
+            baseline = json.load(b_file)
+        failures = compare_failures(results, baseline, args.models)
+        for (name, error) in failures:
+            print('REGRESSION %s: failed (%s)' % (name, error))
+        regressions = compare(results, baseline, args.threshold)
+        for (name, stage, old, new) in regressions:
+            print('REGRESSION %s/%s: %.4fs -> %.4fs' % (name, stage, old, new))
+        memory_regressions = compare_memory(results, baseline,
+                                            args.memory_threshold)
+        for (name, stage, old, new) in memory_regressions:
+            print('MEMORY REGRESSION %s/%s: %s -> %s bytes' % (name, stage,
+                                                               old, new))
+        if failures or regressions or memory_regressions:
+            sys.exit(1)
+        print('No regressions against %s.' % args.baseline)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+import argparse
+
+try: from . import parameter_balancing_core
+except: import parameter_balancing_core
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('sbml', help='Path to an SBML file.')
+    parser.add_argument('--sbtab_data', help='Path to an SBtab data file.')
+    parser.add_argument('--sbtab_prior', help='Path to an SBtab prior file.')
+    parser.add_argument('--sbtab_options', help='Path to an SBtab options file.')
+    parser.add_argument('--output_name', help='Choose a name for the output files.')
+    parser.add_argument('-l', '--pb_log', help='Flag to print a log file.', action='store_true')
+    parser.add_argument('-c', '--concat', help='Flag to print a file with concatenated input/output file.', action='store_true')
+    parser.add_argument('-p', '--no_pseudo_values', help='Flag for disabling the usage of pseudo values.', action='store_true')
+    parser.add_argument('-v', '--verbose', help='Flag to display script messages.', action='store_true')
+    parser.add_argument('--profile', help='Path for a JSON report with timing, peak memory and matrix sizes of each stage.')
+    parser.add_argument('--cache', help='Directory of a structural cache that speeds up repeated balancing of the same model.')
+    parser.add_argument('--rate_laws', nargs='+', choices=['MS', 'DS', 'FD', 'RP'], help='Further rate law classes; each one is written to an extra SBML file (the main output uses CS).')
+
+    parser.add_argument('--sweep', nargs='+', metavar='T:pH', help='Further conditions (temperature in K and pH, e.g. 310:7.5); the balanced parameters of each one are written to an extra SBtab file.')
+
+    args = parser.parse_args()
+    conditions = None
+    if args.sweep:
+        try:
+            conditions = [tuple(float(value) for value in condition.split(':'))
+                          for condition in args.sweep]
+        except ValueError:
+            parser.error('Conditions of --sweep must read T:pH, e.g. 310:7.5.')
+        if not all(len(condition) == 2 for condition in conditions):
+            parser.error('Conditions of --sweep must read T:pH, e.g. 310:7.5.')
+    parameter_balancing_core.parameter_balancing_wrapper(args.sbml,
+                                                         args.sbtab_data,
+                                                         args.sbtab_prior,
+                                                         args.sbtab_options,
+                                                         args.verbose,
+                                                         args.no_pseudo_values,
+                                                         args.output_name,
+                                                         args.pb_log,
+                                                         args.concat,
+                                                         args.profile,
+                                                         rate_laws=args.rate_laws,
+                                                         cache_directory=args.cache,
+                                                         conditions=conditions)
+
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import copy
+import json
 import libsbml
 import os
 import re
@@ -10,16 +11,18 @@ try:
     from . import kineticizer
     from . import misc
     from . import SBtab
+    from . import structcache
     from . import validatorSBtab
 except:
     import balancer
     import kineticizer
     import misc
     import SBtab
+    import structcache
     import validatorSBtab
 
 
-def parameter_balancing_wrapper(sbml, sbtab_data_name=None, sbtab_prior_name=None, sbtab_options_name=None, verbose=False, no_pseudo_values=False, output_name=None, pb_log=False, concat=False):
+def parameter_balancing_wrapper(sbml, sbtab_data_name=None, sbtab_prior_name=None, sbtab_options_name=None, verbose=False, no_pseudo_values=False, output_name=None, pb_log=False, concat=False, profile_name=None, profile_memory=True, rate_laws=None, cache_directory=None, conditions=None):
     '''
     wrapper for parameter balancing.
 
@@ -34,6 +37,18 @@ def parameter_balancing_wrapper(sbml, sbtab_data_name=None, sbtab_prior_name=Non
     output_name: string (name for the output files)
     pb_log: Boolean (enable writing of a log file)
     concat: Boolean (enable writing of concatenation input/output file)
+    profile_name: string (path for a JSON report of the per-stage timing,
+                  peak memory and matrix sizes)
+    profile_memory: Boolean (trace the peak memory in the profile; this
+                    slows down the balancing)
+    rate_laws: list (further rate law classes ('MS', 'DS', 'FD', 'RP');
+               each one is written to an extra SBML file)
+    cache_directory: string (directory of the structural cache; models
+                     that have been balanced before skip the rebuild of
+                     the model structure and the dependence matrix)
+    conditions: list (pairs (temperature in K, pH); the model is balanced
+                for each of them as well and every result is written to an
+                extra SBtab file)
     '''
     model_name = sbml
     parameter_dict = {}
@@ -64,7 +79,13 @@ def parameter_balancing_wrapper(sbml, sbtab_data_name=None, sbtab_prior_name=Non
               'parameter balancing.')
         sys.exit()
 
-    pb = balancer.ParameterBalancing(sbml_model)
+    if cache_directory:
+        structure_cache = structcache.StructureCache(cache_directory)
+    else: structure_cache = None
+    pb = balancer.ParameterBalancing(sbml_model,
+                                     profile_memory=bool(profile_name and
+                                                         profile_memory),
+                                     structure_cache=structure_cache)
 
     ###########################
     # 1.2: open and prepare the optional SBtab data file
@@ -244,7 +265,7 @@ def parameter_balancing_wrapper(sbml, sbtab_data_name=None, sbtab_prior_name=Non
     if sbtab_data_name:
         sbtab = pb.make_sbtab(sbtab_data, sbtab_data_name, 'All organisms', 43,
                               pmin, pmax, parameter_dict)
-        sbtabid2sbmlid = misc.id_checker(sbtab, sbml_model)
+        sbtabid2sbmlid = misc.id_checker(sbtab, pb.get_snapshot())
         if sbtabid2sbmlid != []:
             warn_flag = True
             log_file += 'Log warnings for SBtab data file: '\
@@ -313,6 +334,8 @@ def parameter_balancing_wrapper(sbml, sbtab_data_name=None, sbtab_prior_name=Non
                                                  sbtab, pmin,
                                                  pmax,
                                                  parameter_dict)
+    if conditions:
+        sweep_results = pb.sweep(conditions)
 
     #for row in sbtab_final.value_rows:
     #    print(row)
@@ -335,9 +358,13 @@ def parameter_balancing_wrapper(sbml, sbtab_data_name=None, sbtab_prior_name=Non
     except: def_act = 'complete_act'
     try: overwrite = parameter_dict['overwrite']
     except: overwrite = True
-    kineticizer_cs = kineticizer.KineticizerCS(sbml_model, sbtab_final, mode,
-                                               enzyme_prefac, def_inh,
-                                               def_act, True)
+    variants = ['CS'] + [rl for rl in rate_laws or [] if rl != 'CS']
+    with pb.stage('kineticize'):
+        sbml_models = kineticizer.kineticize_all(sbml_model, sbtab_final,
+                                                 variants, mode,
+                                                 enzyme_prefac, def_inh,
+                                                 def_act, True,
+                                                 snapshot=pb.get_snapshot())
 
     if output_name:
         output_name = output_name
@@ -371,6 +398,18 @@ def parameter_balancing_wrapper(sbml, sbtab_data_name=None, sbtab_prior_name=Non
         if verbose:
             print('The concat file %s has been written.' % (output_name + '_concat.tsv'))
 
+    # 5c: If requested write the per-stage profile of the balancing
+    if profile_name:
+        report = {'model': model_name,
+                  'reactions': sbml_model.getNumReactions(),
+                  'species': sbml_model.getNumSpecies(),
+                  'stages': pb.profile}
+        p_file = open(profile_name, 'w')
+        json.dump(report, p_file, indent=2)
+        p_file.close()
+        if verbose:
+            print('The profile %s has been written.' % (profile_name))
+
     # 6: Write SBtab and SBML model
     sbtab_file_new = open(output_name + '.tsv', 'w')
     sbtab_file_new.write(sbtab_final.to_str())
@@ -384,6 +423,26 @@ def parameter_balancing_wrapper(sbml, sbtab_data_name=None, sbtab_prior_name=Non
     sbml_model_new.close()
     if verbose:
         print('The SBML file %s has been written.' % (output_name + '.xml'))
+
+    if conditions:
+        for (temperature, ph), results in zip(conditions, sweep_results):
+            condition_name = '%s_T%g_pH%g.tsv' % (output_name, temperature, ph)
+            sbtab_condition = open(condition_name, 'w')
+            sbtab_condition.write(results[0].to_str())
+            sbtab_condition.close()
+            if verbose:
+                print('The SBtab file %s has been written.' % (condition_name))
+
+    for rate_law in variants[1:]:
+        variant_name = '%s_%s.xml' % (output_name, rate_law)
+        sbml_code = '<?xml version="1.0" encoding="UTF-8"?>\n' + \
+                    sbml_models[rate_law].toSBML()
+        sbml_variant = open(variant_name, 'w')
+        sbml_variant.write(sbml_code)
+        sbml_variant.close()
+        if verbose:
+            print('The SBML file %s has been written.' % (variant_name))
+    if verbose:
         print('>> Goodbye.')
 
     return (sbml_model_new, sbtab_final)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+'''
+Vectorised evaluation of the kinetic laws that the Kineticizer writes.
+
+The rate law structure of a model (rate law class, parametrisation and
+regulation) is compiled once, together with the balanced parameters, into
+index and parameter arrays. The rates of all reactions can then be
+evaluated for a whole batch of concentration vectors with a few NumPy
+operations, e.g. to check the flux directions of a balanced model at the
+measured concentrations or to score posterior samples.
+'''
+import argparse
+import io
+import numpy
+
+try:
+    from . import kineticizer
+except:
+    import kineticizer
+
+rate_law_classes = ['CS', 'MS', 'DS', 'FD', 'RP']
+
+
+class RateLaws:
+    '''
+    Kinetic laws of a model compiled to NumPy arrays.
+    '''
+    def __init__(self, sbml_model, sbtab, mode='hal', rate_law='CS',
+                 enzyme_prefac=True, default_inh='complete_inh',
+                 default_act='complete_act'):
+        '''
+        Compiles the kinetic laws; the arguments are the ones of the
+        Kineticizer, which is run on a copy of the model.
+
+        Parameters
+        ----------
+        sbml_model: libsbml.Model
+            SBML model (it is not altered).
+        sbtab: SBtab.SBtabTable
+            Balanced parameters.
+        mode: str
+            Parametrisation ('cat', 'hal' or 'weg').
+        rate_law: str
+            Rate law class ('CS', 'MS', 'DS', 'FD' or 'RP').
+        enzyme_prefac: Boolean
+            Include the enzyme concentrations as prefactors.
+        default_inh, default_act: str
+            Regulation types of modifiers without SBO term.
+        '''
+        if rate_law not in rate_law_classes:
+            raise Exception('Unknown rate law %s.' % rate_law)
+        if mode not in kineticizer.Kineticizer.mode2params:
+            raise Exception('Unknown parametrisation %s.' % mode)
+        self.mode = mode
+        self.rate_law = rate_law
+
+        # the Kineticizer determines the parameters and regulation types
+        model = sbml_model.clone()
+        writer = io.StringIO()
+        kin = getattr(kineticizer, 'Kineticizer' + rate_law)(model, sbtab,
+                                                             mode,
+                                                             enzyme_prefac,
+                                                             default_inh,
+                                                             default_act,
+                                                             True, writer)
+        self.warnings = writer.getvalue().splitlines()
+
+        self.species = [s.getId() for s in model.getListOfSpecies()]
+        self.reactions = [r.getId() for r in model.getListOfReactions()]
+        self.initial_concentrations = numpy.array(
+            [s.getInitialConcentration() for s in model.getListOfSpecies()])
+        self._compile(model, kin, enzyme_prefac)
+
+    def _compile(self, model, kin, enzyme_prefac):
+        '''
+        collects the participants, modifiers and parameters of all reactions
+        '''
+        index = dict((s_id, i) for i, s_id in enumerate(self.species))
+        options = kineticizer.Kineticizer.param2options
+
+        def local(reaction, p_type, s_id=''):
+            p_id = options[p_type][2].replace('$REAC$',
+                                              reaction.getId()).replace('$SPECIES$',
+                                                                        s_id)
+            parameter = reaction.getKineticLaw().getParameter(p_id)
+            if parameter is None: return numpy.nan
+            return parameter.getValue()
+
+        def glob(p_id, default=numpy.nan):
+            parameter = model.getParameter(p_id)
+            if parameter is None: return default
+            return parameter.getValue()
+
+        # one entry per reactant and product, sorted by reaction
+        participants = {'reaction': [], 'species': [], 'stoich': [],
+                        'km': [], 'mu': [], 'reactant': []}
+        # one entry per regulating modifier, sorted by reaction
+        modifiers = {'reaction': [], 'species': [], 'k': [], 'ratio': [],
+                     'act': [], 'specific': []}
+        reaction_params = {'kf': [], 'kb': [], 'kv': [], 'keq': [],
+                           'hill_coeff': [], 'enzyme': []}
+
+        for j, reaction in enumerate(model.getListOfReactions()):
+            for is_reactant, refs in ((True, reaction.getListOfReactants()),
+                                      (False, reaction.getListOfProducts())):
+                for ref in refs:
+                    s_id = ref.getSpecies()
+                    participants['reaction'].append(j)
+                    participants['species'].append(index[s_id])
+                    participants['stoich'].append(ref.getStoichiometry())
+                    participants['km'].append(local(reaction, 'km_vec', s_id))
+                    participants['mu'].append(glob(options['mu_vec'][2].replace('$SPECIES$', s_id)))
+                    participants['reactant'].append(is_reactant)
+
+            for m, reg_type in kin._get_regulation_types(reaction):
+                s_id = m.getSpecies()
+                act = 'act' in reg_type
+                modifiers['reaction'].append(j)
+                modifiers['species'].append(index[s_id])
+                modifiers['k'].append(local(reaction, act and 'k_a_vec' or
+                                            'k_i_vec', s_id))
+                if reg_type.startswith('partial'):
+                    modifiers['ratio'].append(local(reaction, act and
+                                                    'act_ratio_vec' or
+                                                    'inh_ratio_vec', s_id))
+                else: modifiers['ratio'].append(0.)
+                modifiers['act'].append(act)
+                modifiers['specific'].append(reg_type.startswith('specific'))
+
+            for p_type in ['kf', 'kb', 'kv', 'keq', 'hill_coeff']:
+                reaction_params[p_type].append(local(reaction, p_type))
+            if enzyme_prefac:
+                enzyme = kin._get_sbtab_entry('enz_conc', reaction)
+                if enzyme is None: enzyme = numpy.nan
+            else: enzyme = 1.
+            reaction_params['enzyme'].append(enzyme)
+
+        self.participants = dict((key, numpy.array(value))
+                                 for key, value in participants.items())
+        self.participants['reaction'] = self.participants['reaction'].astype(int)
+        self.participants['species'] = self.participants['species'].astype(int)
+        self.participants['reactant'] = self.participants['reactant'].astype(bool)
+        self.modifiers = dict((key, numpy.array(value))
+                              for key, value in modifiers.items())
+        self.modifiers['reaction'] = self.modifiers['reaction'].astype(int)
+        self.modifiers['species'] = self.modifiers['species'].astype(int)
+        self.modifiers['act'] = self.modifiers['act'].astype(bool)
+        self.modifiers['specific'] = self.modifiers['specific'].astype(bool)
+        for key, value in reaction_params.items():
+            setattr(self, key, numpy.array(value, dtype=float))
+
+        # groups of entries whose values are multiplied or summed per
+        # reaction
+        reactant = self.participants['reactant']
+        specific = self.modifiers['specific']
+        self._groups = {'reactant': self._group(self.participants['reaction'], reactant),
+                        'product': self._group(self.participants['reaction'], ~reactant),
+                        'participant': self._group(self.participants['reaction']),
+                        'prefactor': self._group(self.modifiers['reaction'], ~specific),
+                        'specific': self._group(self.modifiers['reaction'], specific)}
+        self.has_reactants = self._groups['reactant'][2]
+        self.has_products = self._groups['product'][2]
+
+        # the numerator is a * forward term - b * backward term with
+        # concentration independent factors a and b
+        n = self.participants['stoich'][numpy.newaxis, :]
+        km = self.participants['km'][numpy.newaxis, :]
+        mu = self.participants['mu'][numpy.newaxis, :]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            if self.mode == 'cat':
+                self._forward = self.kf
+                self._backward = self.kb
+            else:
+                sqrt_km = numpy.sqrt(self._reduce(numpy.multiply, km ** n,
+                                                  'participant', 1.)[0])
+                h = self.hill_coeff
+                if self.mode == 'hal':
+                    self._forward = self.kv * self.keq ** (h / 2.) / sqrt_km
+                    self._backward = self.kv * self.keq ** (-h / 2.) / sqrt_km
+                else:
+                    rt = 2 * glob('R', 8.31) * glob('temp', 300)
+                    d_mu = self._reduce(numpy.add, n * mu, 'product', 0.)[0] - \
+                           self._reduce(numpy.add, n * mu, 'reactant', 0.)[0]
+                    self._forward = self.kv * numpy.exp(-h * d_mu / rt) / sqrt_km
+                    self._backward = self.kv * numpy.exp(h * d_mu / rt) / sqrt_km
+
+    def _group(self, owner, mask=None):
+        '''
+        returns the entries of a group (sorted by reaction), the first
+        position of every reaction with entries, and a mask of these
+        reactions
+        '''
+        select = numpy.arange(len(owner))
+        if mask is not None: select = select[mask]
+        owner = owner[select]
+        has = numpy.zeros(len(self.reactions), dtype=bool)
+        has[owner] = True
+        starts = numpy.searchsorted(owner, numpy.flatnonzero(has))
+        return (select, starts, has)
+
+    def _reduce(self, ufunc, values, group, empty):
+        '''
+        multiplies or sums the entry values of each reaction in a group;
+        reactions without entries get the empty value
+        '''
+        select, starts, has = self._groups[group]
+        out = numpy.full((values.shape[0], len(self.reactions)), empty)
+        if len(starts):
+            out[:, has] = ufunc.reduceat(values[:, select], starts, axis=1)
+        return out
+
+    def __call__(self, concentrations):
+        '''
+        Evaluates the rates of all reactions.
+
+        Parameters
+        ----------
+        concentrations: numpy.array
+            Species concentrations in the order of self.species; one vector
+            or one row per sample.
+
+        Returns: numpy.array
+            Reaction rates in the order of self.reactions; one vector or one
+            row per sample.
+        '''
+        c = numpy.asarray(concentrations, dtype=float)
+        single = c.ndim == 1
+        c = numpy.atleast_2d(c)
+        with numpy.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            rates = self._rates(c)
+        if single: return rates[0]
+        return rates
+
+    def _rates(self, c):
+        '''
+        evaluates the rate laws for a matrix of concentrations
+        '''
+        p = self.participants
+        x = c[:, p['species']]
+        n = p['stoich']
+        scaled = x / p['km']
+
+        # numerator
+        if self.mode == 'cat': terms = scaled ** n
+        else: terms = x ** n
+        forward = self._reduce(numpy.multiply, terms, 'reactant', 0.)
+        backward = self._reduce(numpy.multiply, terms, 'product', 0.)
+        numerator = self._forward * forward - self._backward * backward
+
+        # denominator
+        if self.rate_law == 'CS':
+            denominator = self._reduce(numpy.multiply, 1 + scaled ** n, 'reactant', 0.) + \
+                          self._reduce(numpy.multiply, 1 + scaled ** n, 'product', 0.) - 1
+        elif self.rate_law == 'MS':
+            denominator = self._reduce(numpy.multiply, (1 + scaled) ** n, 'participant', 1.)
+        elif self.rate_law == 'DS':
+            denominator = 1 + self._reduce(numpy.multiply, scaled ** n, 'reactant', 0.) + \
+                          self._reduce(numpy.multiply, scaled ** n, 'product', 0.)
+        elif self.rate_law == 'FD':
+            denominator = self._reduce(numpy.multiply, numpy.sqrt(scaled), 'participant', 1.)
+        else:
+            denominator = numpy.ones((c.shape[0], len(self.reactions)))
+
+        # regulation
+        m = self.modifiers
+        u = c[:, m['species']] / m['k']
+        base = numpy.where(m['act'], u / (1 + u), 1 / (1 + u))
+        prefactor = self._reduce(numpy.multiply, m['ratio'] + (1 - m['ratio']) * base,
+                                 'prefactor', 1.)
+        denominator = denominator + \
+            self._reduce(numpy.add, numpy.where(m['act'], 1 / u, u), 'specific', 0.)
+
+        return self.enzyme * prefactor * numerator / denominator
+
+
+if __name__ == '__main__':
+    import libsbml
+
+    try:
+        from . import SBtab
+    except:
+        import SBtab
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('sbml', help='Path to an SBML model.')
+    parser.add_argument('sbtab', help='Path to the balanced SBtab parameter file.')
+    parser.add_argument('-m', '--mode', choices=['cat', 'hal', 'weg'], default='hal', help='Parametrisation of the rate laws.')
+    parser.add_argument('-r', '--rate_law', choices=rate_law_classes, default='CS', help='Rate law class.')
+
+    args = parser.parse_args()
+
+    model = libsbml.SBMLReader().readSBML(args.sbml).getModel()
+    sbtab = SBtab.SBtabTable(open(args.sbtab, 'r').read(), args.sbtab)
+    rate_laws = RateLaws(model, sbtab, args.mode, args.rate_law)
+    rates = rate_laws(rate_laws.initial_concentrations)
+    for reaction, rate in zip(rate_laws.reactions, rates):
+        print('%s\t%s' % (reaction, rate))
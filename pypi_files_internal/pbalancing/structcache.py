@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+'''
+On-disk cache for the structural products of the parameter balancing.
+
+Balancing the same SBML model against new data rebuilds products that only
+depend on the model, the prior and the balanced quantities: the snapshot
+of the model structure (species, reactions, participants and modifiers)
+and the layout of the balancing problem (the order of the parameter vector
+theta and the dependence matrix Q). The cache stores them as .npz arrays
+plus JSON metadata, keyed by hashes of these inputs, so that the balancing
+can skip straight to the data-dependent steps.
+'''
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import numpy
+
+try:
+    from . import balancer
+    from . import misc
+except:
+    import balancer
+    import misc
+
+# version of the file format; part of every key
+cache_format = 1
+snapshot_arrays = ['species_sbo', 'entry_stoich', 'entry_ptr',
+                   'num_reactants', 'modifier_sbo', 'modifier_ptr']
+snapshot_lists = ['species_ids', 'species_names', 'reaction_ids',
+                  'reaction_names', 'entry_species', 'modifier_species']
+
+
+def _to_key(entry):
+    '''
+    converts an identifier from JSON (lists for (reaction, species) pairs)
+    back to the tuples used by the balancing
+    '''
+    if isinstance(entry, list): return tuple(_to_key(e) for e in entry)
+    return entry
+
+
+class StructureCache:
+    '''
+    Directory of cached model snapshots and balancing layouts.
+    '''
+    def __init__(self, directory):
+        '''
+        Parameters
+        ----------
+        directory: str
+            Directory of the cache files (created if it does not exist).
+        '''
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+    def _write(self, key, arrays, metadata):
+        '''
+        writes the arrays and the metadata of an entry; the metadata file is
+        written last, so that an entry is only visible once it is complete
+        '''
+        for extension, write in (('.npz', lambda f: numpy.savez(f, **arrays)),
+                                 ('.json', lambda f: f.write(json.dumps(metadata).encode('utf-8')))):
+            (handle, temp_path) = tempfile.mkstemp(dir=self.directory,
+                                                   suffix='.tmp')
+            with os.fdopen(handle, 'wb') as f:
+                write(f)
+            os.replace(temp_path, self._path(key, extension))
+
+    def _read(self, key):
+        '''
+        returns the arrays and the metadata of an entry (None if the entry
+        does not exist or cannot be read)
+        '''
+        try:
+            with open(self._path(key, '.json'), 'r') as f:
+                metadata = json.load(f)
+            with numpy.load(self._path(key, '.npz')) as data:
+                arrays = dict((name, data[name]) for name in data.files)
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+        if metadata.get('format') != cache_format: return None
+        return (arrays, metadata)
+
+    def model_key(self, sbml_model):
+        '''
+        Returns the hash of the SBML content of a model.
+        '''
+        content = '%s\n%s' % (cache_format, sbml_model.toSBML())
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def layout_key(self, pb):
+        '''
+        Returns the hash of the inputs of the balancing layout: the model,
+        the prior structure, the balanced quantities, the use of pseudo
+        values and the sheet of the dependence matrix.
+
+        Parameters
+        ----------
+        pb: balancer.ParameterBalancing
+            Balancing whose data has been collected (see make_balancing).
+        '''
+        inputs = [self.model_key(pb.model),
+                  pb.prior_list, pb.pseudo_list, pb.species_parameters,
+                  pb.reaction_parameters, pb.reaction_species_parameters,
+                  pb.matrix_info,
+                  sorted((quantity, bool(pb.parameter_dict.get(quantity)))
+                         for quantity in balancer.name2index),
+                  pb.pseudo_used,
+                  repr(sorted(pb.sheet.items()))]
+        content = json.dumps(inputs, sort_keys=True)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def snapshot(self, sbml_model):
+        '''
+        Returns the snapshot of the model structure (see misc.ModelSnapshot)
+        from the cache; it is read from the model and stored if it is not
+        cached yet.
+        '''
+        key = 'snapshot_' + self.model_key(sbml_model)
+        entry = self._read(key)
+        if entry is not None:
+            (arrays, metadata) = entry
+            snapshot = misc.ModelSnapshot.__new__(misc.ModelSnapshot)
+            for name in snapshot_arrays:
+                setattr(snapshot, name, arrays[name])
+            for name in snapshot_lists:
+                setattr(snapshot, name, metadata[name])
+            snapshot.species_index = dict((s_id, i) for i, s_id in
+                                          enumerate(snapshot.species_ids))
+            snapshot.reaction_index = dict((r_id, j) for j, r_id in
+                                           enumerate(snapshot.reaction_ids))
+            return snapshot
+
+        snapshot = misc.ModelSnapshot(sbml_model)
+        metadata = dict((name, getattr(snapshot, name))
+                        for name in snapshot_lists)
+        metadata['format'] = cache_format
+        self._write(key, dict((name, getattr(snapshot, name))
+                              for name in snapshot_arrays), metadata)
+        return snapshot
+
+    def load_layout(self, pb):
+        '''
+        Returns the cached layout of a balancing (None if it is not cached);
+        see ParameterBalancing.get_layout.
+        '''
+        entry = self._read('layout_' + self.layout_key(pb))
+        if entry is None: return None
+        (arrays, metadata) = entry
+        Q = numpy.zeros(tuple(arrays['q_shape']))
+        Q[arrays['q_rows'], arrays['q_columns']] = arrays['q_values']
+        return {'theta': [_to_key(e) for e in metadata['theta']],
+                'basic': metadata['basic'],
+                'rows': [_to_key(e) for e in metadata['rows']],
+                'Q': Q}
+
+    def store_layout(self, pb):
+        '''
+        Stores the layout of a balancing (see ParameterBalancing.get_layout).
+        '''
+        layout = pb.get_layout()
+        Q = numpy.atleast_2d(layout['Q'])
+        (rows, columns) = numpy.nonzero(Q)
+        arrays = {'q_shape': numpy.array(Q.shape),
+                  'q_rows': rows, 'q_columns': columns,
+                  'q_values': Q[rows, columns]}
+        metadata = {'format': cache_format,
+                    'theta': layout['theta'],
+                    'basic': layout['basic'],
+                    'rows': layout['rows']}
+        self._write('layout_' + self.layout_key(pb), arrays, metadata)
+
+    def clear(self):
+        '''
+        Removes all cache files.
+
+        Returns: int
+            Number of removed files.
+        '''
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(('.npz', '.json', '.tmp')):
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError: pass
+        return removed
+
+
+if __name__ == '__main__':
+    # usage: python structcache.py <directory>  (clears the cache)
+    if len(sys.argv) < 2:
+        print('Please provide the cache directory.')
+        sys.exit()
+    removed = StructureCache(sys.argv[1]).clear()
+    print('Removed %s cache file(s).' % removed)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+'''
+Generator for synthetic, scalable SBML models and matching SBtab data files.
+
+The networks are random but chemically plausible: every reaction has one
+to two reactants and products with stoichiometric coefficients of 1 or 2,
+metabolites are reused across reactions (hub metabolites such as cofactors
+are chosen preferentially), and a configurable share of the reactions is
+regulated by inhibitors and activators that carry the SBO terms parameter
+balancing uses to identify them. The data files draw their values from
+the prior distributions, so that balancing them is well-behaved.
+'''
+import argparse
+import os
+import random
+import libsbml
+import numpy
+
+try:
+    from . import balancer
+    from . import SBtab
+except:
+    import balancer
+    import SBtab
+
+inhibitor_sbo = 20
+activator_sbo = 459
+data_header = ['!QuantityType', '!Reaction:SBML:reaction:id',
+               '!Compound:SBML:species:id', '!Mean', '!Std', '!Unit']
+
+
+def make_model(n_reactions, n_species=None, modifier_density=0.2,
+               inhibitor_fraction=0.5, seed=None):
+    '''
+    builds a random SBML network
+
+    Parameters
+    ----------
+    n_reactions: int
+        Number of reactions.
+    n_species: int
+        Number of species (default: roughly one per reaction); at least 4,
+        the number of distinct participants a reaction can have.
+    modifier_density: float
+        Expected number of regulating modifiers per reaction.
+    inhibitor_fraction: float
+        Share of the modifiers that are inhibitors (SBO:0000020); the
+        others are activators (SBO:0000459).
+    seed: int
+        Seed of the random number generator.
+
+    Returns: libsbml.SBMLDocument
+    '''
+    rng = random.Random(seed)
+    numpy_rng = numpy.random.RandomState(seed)
+    if not n_species:
+        n_species = max(4, int(n_reactions * 1.1))
+    elif n_species < 4:
+        raise ValueError('A synthetic model needs at least 4 species.')
+
+    document = libsbml.SBMLDocument(2, 4)
+    model = document.createModel()
+    model.setId('synthetic_%s' % n_reactions)
+    model.setName('Synthetic network with %s reactions' % n_reactions)
+    compartment = model.createCompartment()
+    compartment.setId('cell')
+    compartment.setSize(1)
+
+    species_ids = ['S%s' % (i + 1) for i in range(n_species)]
+    for species_id in species_ids:
+        species = model.createSpecies()
+        species.setId(species_id)
+        species.setName('Metabolite %s' % species_id[1:])
+        species.setCompartment('cell')
+        species.setInitialConcentration(1.0)
+
+    # preferential attachment: metabolites that are already used are more
+    # likely to be reused, which yields a few hubs like in real networks
+    usage = [1] * n_species
+    unused = list(range(n_species))
+    rng.shuffle(unused)
+
+    def pick(exclude):
+        if unused:
+            index = unused.pop()
+        else:
+            index = None
+            while index is None or index in exclude:
+                index = rng.choices(range(n_species), weights=usage)[0]
+        usage[index] += 1
+        return index
+
+    for i in range(n_reactions):
+        reaction = model.createReaction()
+        reaction.setId('R%s' % (i + 1))
+        reaction.setName('Reaction %s' % (i + 1))
+        reaction.setReversible(True)
+        participants = []
+        for (create, count) in [(reaction.createReactant, rng.choice([1, 1, 2])),
+                                (reaction.createProduct, rng.choice([1, 1, 2]))]:
+            for j in range(count):
+                index = pick(participants)
+                participants.append(index)
+                reference = create()
+                reference.setSpecies(species_ids[index])
+                reference.setStoichiometry(rng.choice([1, 1, 1, 2]))
+
+        # regulation by metabolites that do not take part in the reaction
+        n_modifiers = numpy_rng.poisson(modifier_density)
+        for j in range(min(n_modifiers, n_species - len(participants))):
+            index = None
+            while index is None or index in participants:
+                index = rng.randrange(n_species)
+            participants.append(index)
+            modifier = reaction.createModifier()
+            modifier.setSpecies(species_ids[index])
+            if rng.random() < inhibitor_fraction:
+                modifier.setSBOTerm(inhibitor_sbo)
+            else:
+                modifier.setSBOTerm(activator_sbo)
+
+    return document
+
+
+def make_data_sbtab(sbml_model, coverage=0.3, seed=None, sbtab_prior=None,
+                    filename='synthetic_data.tsv'):
+    '''
+    builds an SBtab data file for a model with values drawn around the
+    prior medians
+
+    Parameters
+    ----------
+    sbml_model: libsbml.Model
+        Model the data refers to.
+    coverage: float
+        Share of the basic and derived model parameters that obtain a
+        data value.
+    seed: int
+        Seed of the random number generator.
+    sbtab_prior: SBtab.SBtabTable
+        Prior table (default: the pb_prior.tsv of this package).
+
+    Returns: SBtab.SBtabTable
+    '''
+    rng = random.Random(seed)
+    pb = balancer.ParameterBalancing(sbml_model)
+    if sbtab_prior:
+        pb.get_parameter_information(sbtab_prior)
+
+    candidates = []
+    for quantity in ['standard chemical potential', 'concentration']:
+        for species_id in pb.species_list:
+            candidates.append((quantity, '', species_id))
+    for quantity in ['catalytic rate constant geometric mean',
+                     'equilibrium constant', 'concentration of enzyme',
+                     'substrate catalytic rate constant',
+                     'product catalytic rate constant']:
+        for reaction_id in pb.reaction_list:
+            candidates.append((quantity, reaction_id, ''))
+    for (quantity, reaction_id, species_id) in pb.model_specific:
+        candidates.append((quantity, reaction_id, species_id))
+
+    rows = []
+    for (quantity, reaction_id, species_id) in candidates:
+        if quantity not in pb.quantity_type2unit or rng.random() > coverage:
+            continue
+        if quantity in pb.quantity_type2mean_std:
+            (mean, std) = pb.quantity_type2mean_std[quantity]
+            value = rng.gauss(mean, std / 5.)
+            value_std = 10.
+        else:
+            (median, geom_std) = pb.quantity_type2median_std[quantity]
+            value = median * numpy.exp(rng.gauss(0, numpy.log(geom_std) / 3.))
+            value_std = value * 0.5
+        rows.append([quantity, reaction_id, species_id, '%.6g' % value,
+                     '%.6g' % value_std, pb.quantity_type2unit[quantity]])
+
+    return SBtab.SBtabTable.from_rows([('TableID', 'ParameterData'),
+                                       ('TableType', 'Quantity'),
+                                       ('TableName', 'Synthetic data')],
+                                      data_header, rows, filename)
+
+
+def write_files(n_reactions, output_name, coverage=0.3, **kwargs):
+    '''
+    writes a synthetic SBML model and its SBtab data file to
+    <output_name>.xml and <output_name>_data.tsv
+    '''
+    document = make_model(n_reactions, **kwargs)
+    libsbml.writeSBMLToFile(document, output_name + '.xml')
+    sbtab = make_data_sbtab(document.getModel(), coverage,
+                            seed=kwargs.get('seed'),
+                            filename=os.path.basename(output_name) +
+                            '_data.tsv')
+    sbtab.write(output_name + '_data.tsv')
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('reactions', type=int, help='Number of reactions.')
+    parser.add_argument('output_name', help='Name of the output files (without extension).')
+    parser.add_argument('--species', type=int, help='Number of species.')
+    parser.add_argument('--modifier_density', type=float, default=0.2, help='Expected number of regulators per reaction.')
+    parser.add_argument('--inhibitor_fraction', type=float, default=0.5, help='Share of inhibitors among the regulators.')
+    parser.add_argument('--coverage', type=float, default=0.3, help='Share of the parameters that obtain a data value.')
+    parser.add_argument('--seed', type=int, help='Seed of the random number generator.')
+
+    args = parser.parse_args()
+    if args.species is not None and args.species < 4:
+        parser.error('A synthetic model needs at least 4 species.')
+    write_files(args.reactions, args.output_name, args.coverage,
+                n_species=args.species, modifier_density=args.modifier_density,
+                inhibitor_fraction=args.inhibitor_fraction, seed=args.seed)
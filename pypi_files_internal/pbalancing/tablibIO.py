@@ -2,11 +2,8 @@
 
 import mimetypes
 import sys
-import tablib
-import tablib.core
 import csv
 import os
-import tablib
 try: from . import misc
 except: import misc
 
@@ -15,10 +12,23 @@ except: import misc
 
 def sheets(self):  # Added to excess sheets of Databook
     return self._datasets
-try:
-    tablib.Databook.sheets
-except:
-    tablib.Databook.sheets = sheets
+
+
+class _LazyTablib:
+    '''
+    stands in for the tablib module, which is only imported on first use
+    '''
+    def __getattr__(self, name):
+        global tablib
+        import tablib as tablib_module
+        try:
+            tablib_module.Databook.sheets
+        except:
+            tablib_module.Databook.sheets = sheets
+        tablib = tablib_module
+        return getattr(tablib_module, name)
+
+tablib = _LazyTablib()
 
 def importSetNew(sbtabfile,filename,separator=None):
     mimetypes.init()
@@ -495,13 +495,21 @@ class SBtabTable():
         Returns: str
             The SBtab table in form of a string.
         '''
-        table_string = [self.header_row]
-        table_string.append('\t'.join(self.columns))
+        return '\n'.join(self.iter_lines())
+
+    def iter_lines(self):
+        '''
+        Yields the lines of the SBtab table one by one (without line breaks),
+        so that large tables can be written or sent without building the
+        whole string.
+
+        Returns: generator
+            Header row, column row and value rows in string representation.
+        '''
+        yield self.header_row
+        yield '\t'.join(self.columns)
         for row in self.value_rows:
-            row = '\t'.join(row)
-            table_string.append(row)
-            
-        return '\n'.join(table_string)
+            yield '\t'.join(row)
     
     def change_attribute(self, attribute, value):
         '''
@@ -935,6 +943,68 @@ class SBtabTable():
 
         return sbtab
 
+    @staticmethod
+    def from_rows(header_attrs, columns, rows, filename=None) -> "SBtabTable":
+        '''
+        Creates SBtab table object directly from its rows, without writing
+        and parsing a table string. Declaration row, columns and value rows
+        are the same as in the parsed table.
+
+        Parameters
+        ----------
+        header_attrs: list, dict or str
+            Table attributes as (name, value) pairs, or the complete
+            declaration row. A missing TableID, TableName or Date is
+            added as by the parser.
+        columns: list
+            Column names.
+        rows: list
+            Value rows as lists of strings; they are copied and padded or
+            cut to the number of columns.
+        filename: str
+            Optional filename with extension.
+
+        Returns: SBtab.SBtabTable
+            SBtab table object created from the rows.
+        '''
+        sbtab = SBtabTable(filename=filename)
+
+        if isinstance(header_attrs, str):
+            header_row = header_attrs.rstrip('\n')
+        else:
+            if isinstance(header_attrs, dict):
+                header_attrs = header_attrs.items()
+            header_row = ' '.join(['!!SBtab'] +
+                                  ["%s='%s'" % pair for pair in header_attrs])
+
+        sbtab.delimiter = '\t'
+        sbtab.doc_row = None
+        sbtab.header_row = sbtab._dequote(header_row)
+        if '!!ObjTables' in sbtab.header_row:
+            sbtab.table_format = 'ObjTables'
+        elif '!!SBtab' in sbtab.header_row:
+            sbtab.table_format = 'SBtab'
+        else:
+            raise SBtabError('''This is not a valid SBtab table, please use
+            validator to check format or have a look in the specification!''')
+
+        (sbtab.table_id,
+         sbtab.table_type,
+         sbtab.table_name,
+         sbtab.table_document,
+         sbtab.table_version,
+         sbtab.standard_concentration) = sbtab._get_table_information()
+
+        sbtab.columns = [column for column in columns if column != '']
+        sbtab.columns_dict = dict(map(reversed, enumerate(sbtab.columns)))
+        width = len(sbtab.columns)
+        sbtab.value_rows = [list(row)[:width] + [''] * (width - len(row))
+                            for row in rows]
+        sbtab.comments = []
+        sbtab.table = [[sbtab.header_row], sbtab.columns] + sbtab.value_rows
+
+        return sbtab
+
     
 class SBtabDocument:
     '''
@@ -1,10 +1,14 @@
 #!/usr/bin/env python
 try: from . import SBtab
 except: import SBtab
+try: from . import misc
+except: import misc
 import numpy
-import scipy.linalg
+import concurrent.futures
+import contextlib
 import copy
 import time
+import tracemalloc
 import datetime
 import os
 import sys
@@ -31,6 +35,11 @@ header_names = ['!QuantityType', '!Reaction:SBML:reaction:id',
                 '!Organism', '!Reference']
 inhibitory_sbos = [20, 206, 207, 536, 537]
 activation_sbos = [13, 21, 459, 461, 462]
+# gas constant in kJ/(mol K)
+gas_constant = 8.314462618e-3
+# quantities with one value per condition in a joint balancing; the
+# basic parameters of all other quantities are shared by the conditions
+condition_specific = ['concentration', 'concentration of enzyme']
 
 
 class ParameterBalancingError(Exception):
@@ -48,17 +57,28 @@ class ParameterBalancing:
     '''
     class for the handling of parameter balancing
     '''
-    def __init__(self, sbml_model, req=True):
+    def __init__(self, sbml_model, req=True, profile_memory=False,
+                 structure_cache=None):
         '''
-        initialise pb class
+        initialise pb class; the optional structure_cache
+        (structcache.StructureCache) provides the model snapshot and the
+        balancing layout of models that have been balanced before
         '''
         self.model = sbml_model
+        self.structure_cache = structure_cache
 
         # initialise log file
         self.log = '%s\n\n' % (time.asctime())
 
         # get time stamp
         self.starting_time = time.time()
+
+        # per-stage instrumentation (see function stage)
+        self.profile = {}
+        self.profile_memory = profile_memory
+
+        # structure of the model, see get_snapshot
+        self.snapshot = None
         
         # rudimentary validity check and model initialisation
         if req:
@@ -67,14 +87,54 @@ class ParameterBalancing:
                 raise ParameterBalancingError('You have not used a valid SBML model.')
             self.gain_model_information()
 
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        records wall time, peak memory (only if profile_memory is set) and
+        matrix sizes of a pipeline stage in self.profile[name]; the yielded
+        dictionary takes the sizes. stages that run several times are
+        accumulated.
+        '''
+        sizes = {}
+        if self.profile_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+        time_start = time.perf_counter()
+        try:
+            yield sizes
+        finally:
+            entry = self.profile.setdefault(name, {'calls': 0,
+                                                   'wall_time': 0.0})
+            entry['calls'] += 1
+            entry['wall_time'] += time.perf_counter() - time_start
+            if self.profile_memory:
+                peak = tracemalloc.get_traced_memory()[1] - memory_start
+                entry['peak_memory'] = max(entry.get('peak_memory', 0), peak)
+            if sizes:
+                entry.setdefault('sizes', {}).update(sizes)
+
+    def get_snapshot(self):
+        '''
+        returns the compact snapshot of the model structure (see
+        misc.ModelSnapshot); the model is read on first use
+        '''
+        if self.snapshot is None:
+            if self.structure_cache is not None:
+                self.snapshot = self.structure_cache.snapshot(self.model)
+            else: self.snapshot = misc.ModelSnapshot(self.model)
+        return self.snapshot
+
     def check_biomass(self):
         '''
         if the model appears to have a biomass function, we add a warning to
         the log file; biomass reactions should not have a reversible convenience
         kinetic and should be treated differently.
         '''
-        for species in self.model.getListOfSpecies():
-            if 'biomass' in species.getName().lower():
+        snapshot = self.get_snapshot()
+        for s_id, name in zip(snapshot.species_ids, snapshot.species_names):
+            if 'biomass' in name.lower():
                 self.log += '### Warning about apparent biomass reaction: '\
                             '### \nIt appears that the model has a biomass '\
                             'reaction (SBML ID %s). The convenience kinetics '\
@@ -82,10 +142,10 @@ class ParameterBalancing:
                             'appropriate for biomass reactions. We suggest '\
                             'you replace the kinetics with something more '\
                             'appropriate like the one proposed by Hofmeyr et '\
-                            'al. (2013). \n\n' % (species.getId())
+                            'al. (2013). \n\n' % (s_id)
 
-        for reaction in self.model.getListOfReactions():
-            if 'biomass' in reaction.getName().lower():
+        for j, r_id in enumerate(snapshot.reaction_ids):
+            if 'biomass' in snapshot.reaction_names[j].lower():
                 self.log += '### Warning about apparent biomass reaction: '\
                             '### \nIt appears that the model has a biomass '\
                             'reaction (SBML ID %s). The convenience kinetics '\
@@ -93,10 +153,10 @@ class ParameterBalancing:
                             'appropriate for biomass reactions. We suggest '\
                             'you replace the kinetics with something more '\
                             'appropriate like the one proposed by Hofmeyr et '\
-                            'al. (2013). \n\n' % (reaction.getId())
+                            'al. (2013). \n\n' % (r_id)
                 continue
 
-            if reaction.getNumReactants() > 4:
+            if snapshot.num_reactants[j] > 4:
                 self.log += '### Warning about apparent biomass reaction: '\
                             '### \nThere is a reaction with an usually high '\
                             'amount of reactants (SBML ID %s). It may be a '\
@@ -105,7 +165,7 @@ class ParameterBalancing:
                             'appropriate for these reactions. We suggest you '\
                             'replace the kinetics with something more '\
                             'appropriate like the one proposed by Hofmeyr et '\
-                            'al. (2013). \n\n''' % (reaction.getId())
+                            'al. (2013). \n\n''' % (r_id)
 
     def check_enzyme_species(self):
         '''
@@ -116,26 +176,22 @@ class ParameterBalancing:
         for this, we search for modifiers which do not appear in any reaction
         as reactant or product.
         '''
-        involved_species = []
-        modifiers = []
-
-        for reaction in self.model.getListOfReactions():
-            for species in reaction.getListOfReactants():
-                involved_species.append(species.getId())
-            for species in reaction.getListOfProducts():
-                involved_species.append(species.getId())
-            for species in reaction.getListOfModifiers():
-                modifiers.append(species.getSpecies())
-            if reaction.getNumReactants() == 0:
+        snapshot = self.get_snapshot()
+        involved_species = set(snapshot.entry_species)
+        modifiers = snapshot.modifier_species
+
+        for j, r_id in enumerate(snapshot.reaction_ids):
+            num_participants = snapshot.entry_ptr[j + 1] - snapshot.entry_ptr[j]
+            if snapshot.num_reactants[j] == 0:
                 self.log += ('Warning: The reaction %s has no reactants. '
                              'Parameter balancing is not appropriate for thes'\
                              'e kinds of reactions. Please choose another kin'\
-                             'etic for this reaction.\n' % reaction.getId())
-            if reaction.getNumProducts() == 0:
+                             'etic for this reaction.\n' % r_id)
+            if num_participants == snapshot.num_reactants[j]:
                 self.log += ('Warning: The reaction %s has no products. '
                              'Parameter balancing is not appropriate for thes'\
                              'e kinds of reactions. Please choose another kin'\
-                             'etic for this reaction.\n' % reaction.getId())
+                             'etic for this reaction.\n' % r_id)
 
         for m_id in modifiers:
             if m_id not in involved_species:
@@ -152,19 +208,14 @@ class ParameterBalancing:
         '''
         self.get_parameter_information()
 
-        self.species_list = []
-        self.reaction_list = []
-        self.species2number = {}
-        self.reaction2number = {}
-
         # collect species and reactions from the SBML model
-        for i, species in enumerate(self.model.getListOfSpecies()):
-            self.species_list.append(species.getId())
-            self.species2number[species.getId()] = i + 1
-
-        for i, reaction in enumerate(self.model.getListOfReactions()):
-            self.reaction_list.append(reaction.getId())
-            self.reaction2number[reaction.getId()] = i + 1
+        snapshot = self.get_snapshot()
+        self.species_list = list(snapshot.species_ids)
+        self.reaction_list = list(snapshot.reaction_ids)
+        self.species2number = dict((s_id, i + 1) for i, s_id in
+                                   enumerate(self.species_list))
+        self.reaction2number = dict((r_id, i + 1) for i, r_id in
+                                    enumerate(self.reaction_list))
 
         (self.model_michaelis,
          self.model_inhibition,
@@ -194,8 +245,8 @@ class ParameterBalancing:
         # add some information for the log file
         self.log += '### Model information ###\n'
         self.log += 'The SBML model has a total of %s Reaction/s and %s '\
-                    'Species.\n\n' % (self.model.getNumReactions(),
-                                    self.model.getNumSpecies())
+                    'Species.\n\n' % (len(self.reaction_list),
+                                    len(self.species_list))
 
     def get_parameter_information(self, alternate_prior = None):
         '''
@@ -296,24 +347,19 @@ class ParameterBalancing:
         inhibitors = []
         activators = []
 
-        for reaction in self.model.getListOfReactions():
+        snapshot = self.get_snapshot()
+        for j, r_id in enumerate(snapshot.reaction_ids):
             # first: inhibitory and activation constants
             # (only identifiable by SBO terms)
-            for modifier in reaction.getListOfModifiers():
-                if modifier.getSBOTerm() in inhibitory_sbos:
-                    inhibitors.append(['inhibitory constant', reaction.getId(),
-                                       modifier.getSpecies()])
-                elif modifier.getSBOTerm() in activation_sbos:
-                    activators.append(['activation constant', reaction.getId(),
-                                       modifier.getSpecies()])
+            for s_id, sbo in snapshot.modifiers(j):
+                if sbo in inhibitory_sbos:
+                    inhibitors.append(['inhibitory constant', r_id, s_id])
+                elif sbo in activation_sbos:
+                    activators.append(['activation constant', r_id, s_id])
 
             # second: Michaelis constants
-            for reactant in reaction.getListOfReactants():
-                Michaelis.append(['Michaelis constant', reaction.getId(),
-                                  reactant.getSpecies()])
-            for product in reaction.getListOfProducts():
-                Michaelis.append(['Michaelis constant', reaction.getId(),
-                                  product.getSpecies()])
+            for s_id, stoich in snapshot.participants(j):
+                Michaelis.append(['Michaelis constant', r_id, s_id])
 
         self.model_specific = Michaelis + inhibitors + activators
         return Michaelis, inhibitors, activators
@@ -326,36 +372,31 @@ class ParameterBalancing:
         self.reactions_reactants = {}
         self.reactions_products = {}
 
-        for i, reaction in enumerate(self.model.getListOfReactions()):
+        snapshot = self.get_snapshot()
+        for j, r_id in enumerate(snapshot.reaction_ids):
             reactants = []
             stoich = []
-            for reactant in reaction.getListOfReactants():
-                reactants.append(reactant.getSpecies())
-                this_stoich = reactant.getStoichiometry()
+            for s_id, this_stoich in snapshot.reactants(j):
+                reactants.append(s_id)
                 if this_stoich != 2.0 and this_stoich != 1.0:
                     self.log += 'The stoichiometric coefficient %s of reactan'\
                                 't %s in reaction %s was set '\
-                                'to 1.\n' % (this_stoich,
-                                             reactant.getSpecies(),
-                                             reaction.getId())
+                                'to 1.\n' % (this_stoich, s_id, r_id)
                     this_stoich = 1
                 stoich.append(this_stoich * (-1.0))
-            self.reactions_reactants[reaction.getId()] = (reactants, stoich)
+            self.reactions_reactants[r_id] = (reactants, stoich)
 
             products = []
             stoich = []
-            for product in reaction.getListOfProducts():
-                products.append(product.getSpecies())
-                this_stoich = product.getStoichiometry()
+            for s_id, this_stoich in snapshot.products(j):
+                products.append(s_id)
                 if this_stoich != 2.0 and this_stoich != 1.0:
-                    self.log += 'The stoichiometric coefficient %s of reactan'\
+                    self.log += 'The stoichiometric coefficient %s of produc'\
                                 't %s in reaction %s was set '\
-                                'to 1.\n' % (this_stoich,
-                                             reactant.getSpecies(),
-                                             reaction.getId())
+                                'to 1.\n' % (this_stoich, s_id, r_id)
                     this_stoich = 1
                 stoich.append(this_stoich)
-            self.reactions_products[reaction.getId()] = (products, stoich)
+            self.reactions_products[r_id] = (products, stoich)
     
     def _check_max_reactions(self):
         '''
@@ -371,11 +412,17 @@ class ParameterBalancing:
         if no SBtab is given, create an empty SBtab for the model using
         function make_sbtab and some default parameters
         '''
-        sbtab_string = '!!SBtab TableID="ParameterData" TableType="Quantity" Version="0.1" Level="1.0"'\
-                       ' TableName="EmptyParameterFile"\n'\
-                       '!QuantityType\t!Reaction:SBML:reaction:id\t'\
-                       '!Compound:SBML:species:id\t!Mean\t!Std\t!Unit\t!GeometricStd\n'
-        empty_sbtab = SBtab.SBtabTable(sbtab_string, 'empty.csv')
+        empty_sbtab = SBtab.SBtabTable.from_rows([('TableID', 'ParameterData'),
+                                                  ('TableType', 'Quantity'),
+                                                  ('Version', '0.1'),
+                                                  ('Level', '1.0'),
+                                                  ('TableName', 'EmptyParameterFile')],
+                                                 ['!QuantityType',
+                                                  '!Reaction:SBML:reaction:id',
+                                                  '!Compound:SBML:species:id',
+                                                  '!Mean', '!Std', '!Unit',
+                                                  '!GeometricStd'], [],
+                                                 'empty.csv')
         value_rows = self.make_sbtab(empty_sbtab, 'empty.csv',
                                      'All organisms', 43, pmin, pmax,
                                      parameter_dict)
@@ -408,7 +455,9 @@ class ParameterBalancing:
             self._check_max_reactions()
 
         # the possibly messy user file needs to be tidied before computation
-        self.rows = self.tidy_up_sbtab(False)
+        with self.stage('tidy') as sizes:
+            self.rows = self.tidy_up_sbtab(False)
+            sizes['data_rows'] = len(self.rows)
 
         # build a list of all parameters provided by the user
         self.available_parameters = []
@@ -469,13 +518,15 @@ class ParameterBalancing:
                             self.model.getNumSpecies(), nr)
 
         # create new SBtab file from the collected information
-        sbtab_string = '!!SBtab TableID="ParameterData" TableType="Quantity" Version="0.1" Level="1.0" '\
-                       'TableName="%s"\n' % (file_name) + \
-                       '\t'.join(self.new_header) + '\n'
-
-        for row in self.new_rows:
-            sbtab_string += '\t'.join(row) + '\n'
-        new_sbtab = SBtab.SBtabTable(sbtab_string, file_name)
+        with self.stage('sbtab_build') as sizes:
+            new_sbtab = SBtab.SBtabTable.from_rows([('TableID', 'ParameterData'),
+                                                    ('TableType', 'Quantity'),
+                                                    ('Version', '0.1'),
+                                                    ('Level', '1.0'),
+                                                    ('TableName', file_name)],
+                                                   self.new_header,
+                                                   self.new_rows, file_name)
+            sizes['parameter_rows'] = len(self.new_rows)
 
         return new_sbtab
 
@@ -787,13 +838,12 @@ class ParameterBalancing:
         # build the mean
         if quantity in self.quantity_type2median_std:
             # geometric mean for all multiplicative quantities
-            import scipy.stats
             denominator = 0
             for std in stds:
                 if std != 0.0: denominator = denominator + (1 / std ** 2)
                 else: denominator = denominator + (1 / numpy.log(2) ** 2)
-            mean = scipy.mean(means)
-            std = scipy.mean(stds)
+            mean = numpy.mean(means)
+            std = numpy.mean(stds)
             if quantity not in self.thermodynamics:
                 median = numpy.exp(self.normal_to_log([mean],
                                                       [std],
@@ -829,42 +879,45 @@ class ParameterBalancing:
         '''
         fills the values in the given SBtabfile
         '''
-        self.pseudo_used = False
-        self.make_default_table()
-        sbtab_strings = [sbtab.header_row, '\t'.join(sbtab.columns)]
+        with self.stage('fill'):
+            self.pseudo_used = False
+            self.make_default_table()
+            pseudo_rows = []
 
-        if pseudos:
-            # first fill parameter rows that have no value
-            self.pseudo_used = True
-            for i, row in enumerate(sbtab.value_rows):
-                if row[sbtab.columns_dict['!QuantityType']] in self.pseudo_list:
-                    try:
-                        row[sbtab.columns_dict['!Mode']] = \
-                                                        str(pseudos[row[0]][0])
-                        row[sbtab.columns_dict['!UnconstrainedGeometricMean']] = \
-                                                        str(pseudos[row[0]][0])
-                        row[sbtab.columns_dict['!UnconstrainedGeometricStd']] = \
-                                                        str(pseudos[row[0]][1])
-                        sbtab_strings.append('\t'.join(row))
-                    except: pass
+            if pseudos:
+                # first fill parameter rows that have no value
+                self.pseudo_used = True
+                for i, row in enumerate(sbtab.value_rows):
+                    if row[sbtab.columns_dict['!QuantityType']] in self.pseudo_list:
+                        try:
+                            row[sbtab.columns_dict['!Mode']] = \
+                                                            str(pseudos[row[0]][0])
+                            row[sbtab.columns_dict['!UnconstrainedGeometricMean']] = \
+                                                            str(pseudos[row[0]][0])
+                            row[sbtab.columns_dict['!UnconstrainedGeometricStd']] = \
+                                                            str(pseudos[row[0]][1])
+                            pseudo_rows.append(row)
+                        except: pass
 
-            # then construct required variables
-            means = []
-            stds = []
-            for i, quantity in enumerate(self.pseudo_list):
-                means.append(pseudos[quantity][0])
-                stds.append(pseudos[quantity][1])
+                # then construct required variables
+                means = []
+                stds = []
+                for i, quantity in enumerate(self.pseudo_list):
+                    means.append(pseudos[quantity][0])
+                    stds.append(pseudos[quantity][1])
 
-            (self.log_means,
-             self.log_stds) = self.med10_std_to_log(means,
-                                                    stds,
-                                                    self.pseudo_list)
+                (self.log_means,
+                 self.log_stds) = self.med10_std_to_log(means,
+                                                        stds,
+                                                        self.pseudo_list)
 
-            sbtab_pseudo = SBtab.SBtabTable('\n'.join(sbtab_strings),
-                                            'sbtab_pseudo.csv')
-            return sbtab_pseudo
+                sbtab_pseudo = SBtab.SBtabTable.from_rows(sbtab.header_row,
+                                                          sbtab.columns,
+                                                          pseudo_rows,
+                                                          'sbtab_pseudo.csv')
+                return sbtab_pseudo
 
-        return sbtab
+            return sbtab
 
     def make_default_table(self):
         '''
@@ -988,6 +1041,18 @@ class ParameterBalancing:
         '''
         generates the values for the parameter balancing
         '''
+        self.prepare_balancing(sbtab, sbtab_old, pmin, pmax, parameter_dict)
+        return self.finish_balancing()
+
+    def prepare_balancing(self, sbtab, sbtab_old, pmin, pmax, parameter_dict,
+                          prior=None):
+        '''
+        builds the parts of the balancing that do not depend on the
+        temperature: the data vector, theta, the covariance matrices and
+        their inverses. the layout and the prior covariance of a balancing
+        of the same model and prior (see get_prior) can be given, so that
+        only the data specific parts are built
+        '''
         self.sbtab = sbtab_old
         self.sbtab_new = sbtab
 
@@ -1004,24 +1069,65 @@ class ParameterBalancing:
         new_rows = self.sbtab_new.value_rows
         self.new_rows = self.sort_list(new_rows)
 
-        # get matrix information from hardcoded sheet
-        self.sheet = self.get_sheet()
-        self.temperature = float(self.parameter_dict['temperature'])
-        self.pH = float(self.parameter_dict['ph'])
+        # get matrix information from the sheet for the given temperature
+        self.sheet = self.get_sheet(self.parameter_dict['temperature'])
 
         # build needed vectors and matrices
         self.desired_parameters = self.build_desired_parameters()
-        self.x_vector = self.collect_available_values()
-        self.theta_vector = self.build_theta_vector()
-        (self.C_prior, self.C_x) = self.build_covariance_matrices()
+        with self.stage('collect') as sizes:
+            self.x_vector = self.collect_available_values()
+            sizes['x'] = len(self.x_vector)
+
+        # the layout of theta and D only depends on the model, the prior and
+        # the balanced quantities; it may be cached from an earlier run
+        self.layout = None
+        if prior is not None:
+            self.layout = prior['layout']
+        elif self.structure_cache is not None:
+            self.layout = self.structure_cache.load_layout(self)
+
+        with self.stage('theta') as sizes:
+            self.theta_vector = self.build_theta_vector(self.layout)
+            sizes['theta'] = len(self.theta_vector)
+        with self.stage('covariance') as sizes:
+            if prior is None:
+                (self.C_prior, self.C_x) = self.build_covariance_matrices()
+            else:
+                self.C_prior = prior['C_prior']
+                self.C_prior_inv = prior['C_prior_inv']
+                self.C_x = self.build_data_covariance()
+            sizes['C_prior'] = list(numpy.shape(self.C_prior))
+            sizes['C_x'] = list(numpy.shape(self.C_x))
+            self.invert_covariance_matrices(prior is None)
+
+    def get_prior(self):
+        '''
+        returns the parts of a prepared balancing that only depend on the
+        model, the prior and the balanced quantities: the layout (see
+        get_layout) and the prior covariance matrix with its inverse
+        '''
+        return {'layout': self.get_layout(),
+                'C_prior': self.C_prior,
+                'C_prior_inv': self.C_prior_inv}
+
+    def finish_balancing(self, Q=None, posterior=None):
+        '''
+        builds the dependence matrix D (unless it is given), computes the
+        posterior and the balanced SBtab; requires prepare_balancing. a
+        posterior (C_post, C_xpost, q_post) that has been solved for a batch
+        of data sets (see balance_batch) requires build_dependence_matrices
+        '''
+        self.temperature = float(self.parameter_dict['temperature'])
+        self.pH = float(self.parameter_dict['ph'])
 
-        # build the dependence matrix D and the data specific D_x
-        self.Q = self.build_dependence_matrix()
-        self.Q_star = self.build_specific_dependence_matrix()
+        if posterior is None:
+            self.build_dependence_matrices(Q)
 
         # KEY PART: calculating the posteriori covariance matrix C_post and the
         #           posteriori mean vector mean_post
-        self.calculate_posteriori()
+        with self.stage('posterior_solve') as sizes:
+            self.calculate_posteriori(posterior)
+            sizes['C_post'] = list(numpy.shape(self.C_post))
 
         # make normal values again
         (self.mean_post,
@@ -1031,139 +1137,131 @@ class ParameterBalancing:
 
         ################################################################
         # generating minimization problem
-        self.optimized = False
-        if self.bounds_inc.count((None, None)) != len(self.bounds_inc):  # and False:
-            # generating the medians to bound them
-            print('in optimiser')
-            medians = []
-            medstds = []
-
-            (self.means_inc,
-             self.stds_inc) = self.log_to_normal(self.means_post_inc,
-                                                 self.stds_log_inc,
-                                                 self.quantities_inc)
-
-            for i, value in enumerate(self.means_inc):
-                if self.quantities_inc[i] not in self.thermodynamics:
-                    (log_mean,
-                     log_std) = self.normal_to_log([self.means_inc[i]],
-                                                   [self.stds_inc[i]],
-                                                   self.quantities_inc[i])
-                    medians.append(numpy.exp(log_mean[0]))
-                else:
-                    medians.append(self.means_inc[i])
-                medstds.append(max(self.stds_inc[i], 10))
-
-            # optimisation function
-            def log_mean_post_func(q):
-                return numpy.dot(((q - medians).transpose()),
-                                 (numpy.dot(numpy.linalg.inv(self.C_post),
-                                            (q - medians))))
-
-            # setting proper boundaries for parameters that have no boundaries
-            # set in SBtab
-            new_boundaries = []
-            is_logarithmic = []
-            for i, bound in enumerate(self.bounds_inc):
-                if bound == ('', '') or bound == (None, None):
-                    # setting boundaries for thermodynamic parameters (kJ/mol)
-                    # THIS NEEDS TO BE REWRITTEN;
-                    # NO USAGE OF NAME2INDEX OR THERMODYNAMIC_INDICES;
-                    if name2index[self.quantities_inc[i]] in thermodynamic_indices:
-                        is_logarithmic.append(False)
-                        if (max(medians[i] - medstds[i] * 2, -3000)) < \
-                           (min(3000, medians[i] + medstds[i] * 2)):
-                            new_boundaries.append((max(medians[i] - medstds[i] * 2, -3000),
-                                                   min(3000, medians[i] + medstds[i] * 2)))
+        with self.stage('optimisation'):
+            self.optimized = False
+            if self.bounds_inc.count((None, None)) != len(self.bounds_inc):  # and False:
+                # generating the medians to bound them
+                print('in optimiser')
+                medians = []
+                medstds = []
+
+                (self.means_inc,
+                 self.stds_inc) = self.log_to_normal(self.means_post_inc,
+                                                     self.stds_log_inc,
+                                                     self.quantities_inc)
+
+                for i, value in enumerate(self.means_inc):
+                    if self.quantities_inc[i] not in self.thermodynamics:
+                        (log_mean,
+                         log_std) = self.normal_to_log([self.means_inc[i]],
+                                                       [self.stds_inc[i]],
+                                                       self.quantities_inc[i])
+                        medians.append(numpy.exp(log_mean[0]))
+                    else:
+                        medians.append(self.means_inc[i])
+                    medstds.append(max(self.stds_inc[i], 10))
+
+                # optimisation function; the precision matrix is inverted only
+                # once and the whole population is rated in one matrix product
+                medians = numpy.array(medians)
+                precision_post = numpy.linalg.inv(self.C_post)
+
+                def log_mean_post_func(q):
+                    return numpy.dot((q - medians),
+                                     numpy.dot(precision_post, (q - medians)))
+
+                def log_mean_post_population(population):
+                    deviations = population - medians
+                    return numpy.einsum('ij,ij->i',
+                                        numpy.dot(deviations, precision_post),
+                                        deviations)
+
+                # setting proper boundaries for parameters that have no boundaries
+                # set in SBtab
+                new_boundaries = []
+                is_logarithmic = []
+                for i, bound in enumerate(self.bounds_inc):
+                    if bound == ('', '') or bound == (None, None):
+                        # setting boundaries for thermodynamic parameters (kJ/mol)
+                        if self.quantities_inc[i] in self.thermodynamics:
+                            is_logarithmic.append(False)
+                            if (max(medians[i] - medstds[i] * 2, -3000)) < \
+                               (min(3000, medians[i] + medstds[i] * 2)):
+                                new_boundaries.append((max(medians[i] - medstds[i] * 2, -3000),
+                                                       min(3000, medians[i] + medstds[i] * 2)))
+                            else:
+                                new_boundaries.append((medians[i] + medstds[i] * 2,
+                                                       medians[i] - medstds[i] * 2))
+                        # setting boundaries for all other parameters
                         else:
-                            new_boundaries.append((medians[i] + medstds[i] * 2,
-                                                   medians[i] - medstds[i] * 2))
-                    # setting boundaries for all other parameters
+                            is_logarithmic.append(True)
+                            if (medians[i] - medstds[i] * 4) < \
+                               (medians[i] + medstds[i] * 4):
+                                new_boundaries.append((max(medians[i] - medstds[i] * 4,
+                                                           0.00001),
+                                                       medians[i] + medstds[i] * 4))
+                            else:
+                                new_boundaries.append((medians[i] + medstds[i] * 4,
+                                                       medians[i] - medstds[i] * 4))
                     else:
                         is_logarithmic.append(True)
-                        if (medians[i] - medstds[i] * 4) < \
-                           (medians[i] + medstds[i] * 4):
-                            new_boundaries.append((max(medians[i] - medstds[i] * 4,
-                                                       0.00001),
-                                                   medians[i] + medstds[i] * 4))
-                        else:
-                            new_boundaries.append((medians[i] + medstds[i] * 4,
-                                                   medians[i] - medstds[i] * 4))
-                else:
-                    is_logarithmic.append(True)
-                    new_boundaries.append((float(bound[0]), float(bound[1])))
-
-            proper_boundaries = []
-            for boundaries in new_boundaries:
-                new_bound = []
-                if boundaries[0] == float(0.0):
-                    new_bound.append(0.00001)
-                else:
-                    new_bound.append(boundaries[0])
-                if boundaries[1] == float(0.0):
-                    new_bound.append(0.00001)
-                else:
-                    new_bound.append(boundaries[1])
-                proper_boundaries.append(new_bound)
+                        new_boundaries.append((float(bound[0]), float(bound[1])))
 
-            f = open('medians.txt', 'w')
-            for i, element in enumerate(medians):
-                if not i == len(medians) - 1:
-                    f.write(str(element) + ',')
-                else:
-                    f.write(str(element))
-            f.close()
-
-            g = open('cpost.txt', 'w')
-            for line in self.C_post:
-                for i, element in enumerate(line):
-                    if not i == len(line) - 1:
-                        g.write(str(element) + ',')
+                proper_boundaries = []
+                for boundaries in new_boundaries:
+                    new_bound = []
+                    if boundaries[0] == float(0.0):
+                        new_bound.append(0.00001)
                     else:
-                        g.write(str(element))
-                g.write('\n')
-            g.close()
-
-            # generating optimization and updating responsible mean vector
-            new_medians = misc.fmin_gen(log_mean_post_func,
-                                        numpy.array(medians),
-                                        population_size=20,
-                                        survivors=5, generations=500,
-                                        bounds=proper_boundaries, use_pp=False,
-                                        variable_is_logarithmic=is_logarithmic,
-                                        disp=1)
-            for i, value in enumerate(new_medians):
-                if value + 0.001 < proper_boundaries[i][0] or \
-                   value - 0.001 > proper_boundaries[i][1]:
-                    self.quantities_inc[i]
-                    print('NEW_MODE value out of bound: ',
-                          value,
-                          ' [bounds: ', proper_boundaries[i], ']')
-
-            (new_medians_log,
-             new_stds_log) = self.normal_to_log(new_medians,
-                                                self.stds_inc,
-                                                self.quantities_inc)
-            self.C_xpost = numpy.dot((numpy.dot(self.Q, self.C_post)),
-                                     self.Q.transpose())
-            self.x_post = numpy.dot(self.Q, new_medians_log)
-            self.stds_log_post = self.extract_cpost()
-
-            (self.mean_post_opt,
-             self.stds_post_opt) = self.log_to_normal(self.x_post,
-                                                      self.stds_log_post,
-                                                      self.quantities)
-            self.optimized = True
+                        new_bound.append(boundaries[0])
+                    if boundaries[1] == float(0.0):
+                        new_bound.append(0.00001)
+                    else:
+                        new_bound.append(boundaries[1])
+                    proper_boundaries.append(new_bound)
+
+                # generating optimization and updating responsible mean vector
+                new_medians = misc.fmin_gen(log_mean_post_func,
+                                            numpy.array(medians),
+                                            population_size=20,
+                                            survivors=5, generations=500,
+                                            bounds=proper_boundaries,
+                                            variable_is_logarithmic=is_logarithmic,
+                                            f_population=log_mean_post_population,
+                                            tol=1e-8, patience=25, disp=1)
+                for i, value in enumerate(new_medians):
+                    if value + 0.001 < proper_boundaries[i][0] or \
+                       value - 0.001 > proper_boundaries[i][1]:
+                        self.quantities_inc[i]
+                        print('NEW_MODE value out of bound: ',
+                              value,
+                              ' [bounds: ', proper_boundaries[i], ']')
+
+                (new_medians_log,
+                 new_stds_log) = self.normal_to_log(new_medians,
+                                                    self.stds_inc,
+                                                    self.quantities_inc)
+                self.C_xpost = numpy.dot((numpy.dot(self.Q, self.C_post)),
+                                         self.Q.transpose())
+                self.x_post = numpy.dot(self.Q, new_medians_log)
+                self.stds_log_post = self.extract_cpost()
+
+                (self.mean_post_opt,
+                 self.stds_post_opt) = self.log_to_normal(self.x_post,
+                                                          self.stds_log_post,
+                                                          self.quantities)
+                self.optimized = True
 
         #################################################################
         # make value-dictionaries to realize the insertion of the computed
         # values into the SBtab-file in GUI
-        balanced_sbtab = self.build_new_sbtab()
-        sbtab_string = []
-        for entry in balanced_sbtab:
-            sbtab_string.append('\t'.join(entry))
-
-        sbtab_new = SBtab.SBtabTable('\n'.join(sbtab_string), 'sbtab_new.csv')
+        with self.stage('sbtab_build') as sizes:
+            balanced_sbtab = self.build_new_sbtab()
+            sbtab_new = SBtab.SBtabTable.from_rows(balanced_sbtab[0][0],
+                                                   balanced_sbtab[1],
+                                                   balanced_sbtab[2:],
+                                                   'sbtab_new.csv')
+            sizes['balanced_rows'] = len(balanced_sbtab) - 2
         C_string = self.make_cpost_string()
         shannons = self.get_shannons()
 
@@ -1174,6 +1272,26 @@ class ParameterBalancing:
         return (sbtab_new, self.mean_post, self.q_post, C_string, self.C_post,
                 self.Q, shannons, self.log, concatenated_results)
 
+    def build_dependence_matrices(self, Q=None):
+        '''
+        builds the dependence matrix D (unless it is given) and the data
+        specific D_x
+        '''
+        with self.stage('q_build') as sizes:
+            if Q is None:
+                self.Q = self.build_dependence_matrix(self.layout)
+            else:
+                self.Q = Q
+                self.parameter2row = dict((row_identifier, Q[i]) for
+                                          row_identifier, i in
+                                          self.id_order.items())
+            self.Q_star = self.build_specific_dependence_matrix()
+            sizes['Q'] = list(numpy.shape(self.Q))
+            sizes['Q_star'] = list(numpy.shape(self.Q_star))
+        if self.structure_cache is not None and self.layout is None and \
+           Q is None:
+            self.structure_cache.store_layout(self)
+
     def compute_concatenated_results(self, sbtab_new):
         '''
         computes a file with concatenated results
@@ -1192,26 +1310,364 @@ class ParameterBalancing:
         running_time = end_time - self.starting_time
         self.log += 'Total running time (s): %s\n' % running_time        
     
-    def get_sheet(self):
+    def get_sheet(self, temperature):
+        '''
+        get the sheet that tells us, how to build up which matrix; the
+        factors RT are computed for the given temperature (K)
+        '''
+        rt = gas_constant * float(temperature)
+        return self.make_sheet(rt, rt)
+
+    def make_sheet(self, rt, rt_potential):
         '''
-        get the sheet that tells us, how to build up which matrix
+        builds the sheet for the factor RT (kJ/mol) of the thermodynamic
+        quantities and the factor of the chemical potential
         '''
-        sheet = {"equilibrium constant": ((-1 / 2.4790, "A"),
+        sheet = {"equilibrium constant": ((-1 / rt, "A"),
                                           0, 0, 0, 0, 0, 0),
-                 "substrate catalytic rate constant": ((-0.5 / 2.4790, "A"), 1,
+                 "substrate catalytic rate constant": ((-0.5 / rt, "A"), 1,
                                                        (-0.5, "Z"), 0, 0, 0, 0),
-                 "product catalytic rate constant": ((0.5 / 2.4790, "A"), 1,
+                 "product catalytic rate constant": ((0.5 / rt, "A"), 1,
                                                      (0.5, "Z"), 0, 0, 0, 0),
-                 "forward maximal velocity": ((-0.5 / 2.4790, "A"), 1,
+                 "forward maximal velocity": ((-0.5 / rt, "A"), 1,
                                               (-0.5, "Z"), 0, 0, 1, 0),
-                 "reverse maximal velocity": ((0.5 / 2.4790, "A"), 1,
+                 "reverse maximal velocity": ((0.5 / rt, "A"), 1,
                                               (0.5, "Z"), 0, 0, 1, 0),
-                 "chemical potential": (1, 0, 0, 0, 0, 0, (2.790, '1')),
+                 "chemical potential": (1, 0, 0, 0, 0, 0, (rt_potential, '1')),
                  "reaction affinity": ((-1, "A"), 0, 0, 0, 0, 0,
-                                       (-2.4790, "AB"))}
+                                       (-rt, "AB"))}
 
         return sheet
 
+    def temperature_dependence(self):
+        '''
+        splits the dependence matrix D into the parts D_0, D_inv and D_rt
+        with D = D_0 + D_inv / RT + D_rt * RT for every temperature. every
+        entry of D is either constant or proportional to 1/RT or RT, so
+        the parts follow from D built for RT = 1 and RT = 2 (both exact in
+        floating point). both are built on a copy, so that the row
+        information of this balancing is left untouched. returns None if
+        an entry does not fit.
+        '''
+        pb = copy.copy(self)
+        pb.sheet = pb.make_sheet(1., 1.)
+        D_1 = pb.build_dependence_matrix()
+        pb.sheet = pb.make_sheet(2., 2.)
+        D_2 = pb.build_dependence_matrix()
+
+        constant = D_2 == D_1
+        inverse = (D_2 * 2 == D_1) & ~constant
+        proportional = (D_2 == D_1 * 2) & ~constant
+        if not numpy.all(constant | inverse | proportional): return None
+        return (numpy.where(constant, D_1, 0.), numpy.where(inverse, D_1, 0.),
+                numpy.where(proportional, D_1, 0.))
+
+    def sweep(self, conditions, workers=None):
+        '''
+        balances the prepared model (see prepare_balancing or make_balancing)
+        for several conditions. the temperature dependent rows of D are
+        derived for every temperature; theta, the data and the inverse
+        covariance matrices are shared. the conditions are balanced in
+        parallel threads. the stages of the sweep are profiled with the
+        prefix sweep_; the peak memory is only traced for the whole sweep,
+        since the threads share one tracemalloc.
+
+        Parameters
+        ----------
+        conditions: list
+            Pairs (temperature in K, pH).
+        workers: int
+            Number of threads (default of concurrent.futures if None).
+
+        Returns: list
+            Results of make_balancing for every condition.
+        '''
+        with self.stage('sweep_q_build'):
+            parts = self.temperature_dependence()
+
+        def balance(condition):
+            (temperature, ph) = condition
+            pb = copy.copy(self)
+            pb.profile = {}
+            pb.profile_memory = False
+            pb.parameter_dict = dict(self.parameter_dict,
+                                     temperature=temperature, ph=ph)
+            pb.sheet = pb.get_sheet(temperature)
+            pb.new_rows = [list(row) for row in self.new_rows]
+            pb.log += 'Condition: temperature %s K, pH %s\n' % (temperature,
+                                                                  ph)
+            if parts is None:
+                return (pb, pb.finish_balancing(pb.build_dependence_matrix()))
+            rt = gas_constant * float(temperature)
+            Q = parts[0] + parts[1] / rt + parts[2] * rt
+            return (pb, pb.finish_balancing(Q))
+
+        with self.stage('sweep'):
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                balanced = list(executor.map(balance, conditions))
+
+        # accumulate the stages of all conditions
+        for (pb, results) in balanced:
+            for name, stage in pb.profile.items():
+                entry = self.profile.setdefault('sweep_' + name,
+                                                {'calls': 0,
+                                                 'wall_time': 0.0})
+                entry['calls'] += stage['calls']
+                entry['wall_time'] += stage['wall_time']
+                if 'sizes' in stage:
+                    entry.setdefault('sizes', {}).update(stage['sizes'])
+
+        return [results for (pb, results) in balanced]
+
+    def _prepare_data_sets(self, datasets, pmin, pmax, parameter_dict,
+                           pseudos, priors):
+        '''
+        prepares one copy of the balancing per data SBtab up to the
+        dependence matrices; the first data set builds the structure that
+        all others share
+        '''
+        balancings = []
+        prior = None
+        for sbtab_data in datasets:
+            pb = copy.copy(self)
+            sbtab = pb.make_sbtab(sbtab_data, sbtab_data.filename,
+                                  'All organisms', 43, pmin, pmax,
+                                  parameter_dict)
+            sbtab_new = pb.fill_sbtab(copy.deepcopy(sbtab), pseudos, priors)
+            pb.prepare_balancing(sbtab_new, sbtab, pmin, pmax, parameter_dict,
+                                 prior)
+            pb.build_dependence_matrices()
+            if prior is None: prior = pb.get_prior()
+            balancings.append(pb)
+        return balancings
+
+    def balance_batch(self, datasets, pmin, pmax, parameter_dict,
+                      pseudos=None, priors=None, workers=None):
+        '''
+        balances the model against several data SBtabs. theta, D and the
+        prior precision are built once; the data specific terms (D_x, C_x
+        and x) are assembled per data set. data sets with the same measured
+        parameters and standard deviations share the posterior covariance
+        and are solved together, with their right-hand sides stacked into
+        one matrix; these groups are solved in parallel threads.
+
+        Parameters
+        ----------
+        datasets: list
+            SBtab.SBtabTable data tables.
+        pmin, pmax: dict
+            Bounds of the quantities (see misc.extract_pseudos_priors).
+        parameter_dict: dict
+            Options of the balancing (see misc.readout_config).
+        pseudos, priors: dict
+            Pseudo values and priors (see misc.extract_pseudos_priors);
+            the pseudo values are used if they are given.
+        workers: int
+            Number of threads (default of concurrent.futures if None).
+
+        Returns: list
+            Results of make_balancing for every data set.
+        '''
+        balancings = self._prepare_data_sets(datasets, pmin, pmax,
+                                             parameter_dict, pseudos, priors)
+        if not balancings: return []
+
+        with self.stage('posterior_solve') as sizes:
+            # prior precision and prior part of the right-hand side
+            first = balancings[0]
+            Q = first.Q
+            if first.pseudo_used:
+                Q_trans_prior = numpy.dot(Q.transpose(), first.C_prior_inv)
+                precision = numpy.dot(Q_trans_prior, Q)
+                shift = numpy.dot(Q_trans_prior, first.q_prior)
+            else:
+                precision = first.C_prior_inv
+                shift = numpy.dot(first.C_prior_inv, first.q_prior)
+
+            # data sets with the same D_x and C_x
+            groups = {}
+            for pb in balancings:
+                key = (tuple(tuple(x[:3]) for x in pb.x_vector),
+                       numpy.asarray(pb.C_x, dtype=float).tobytes())
+                groups.setdefault(key, []).append(pb)
+            sizes['data_sets'] = len(balancings)
+            sizes['groups'] = len(groups)
+
+            def solve(group):
+                pb = group[0]
+                try: Q_star_trans = pb.Q_star.transpose()
+                except: Q_star_trans = 0
+                data_trans = numpy.dot(Q_star_trans, pb.C_x_inv)
+                C_post = numpy.linalg.inv(precision +
+                                          numpy.dot(data_trans, pb.Q_star))
+                C_xpost = numpy.dot(numpy.dot(Q, C_post), Q.transpose())
+                if numpy.ndim(data_trans):
+                    x_stars = numpy.column_stack([member.x_star for member
+                                                  in group])
+                    rhs = shift[:, numpy.newaxis] + numpy.dot(data_trans,
+                                                              x_stars)
+                else:
+                    rhs = numpy.tile(shift[:, numpy.newaxis], (1, len(group)))
+                q_posts = numpy.dot(C_post, rhs)
+                return [(C_post, C_xpost, q_posts[:, k])
+                        for k in range(len(group))]
+
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                solutions = list(executor.map(solve, groups.values()))
+
+        posteriors = {}
+        for group, solution in zip(groups.values(), solutions):
+            for pb, posterior in zip(group, solution):
+                posteriors[id(pb)] = posterior
+
+        return [pb.finish_balancing(posterior=posteriors[id(pb)])
+                for pb in balancings]
+
+    def balance_joint(self, datasets, pmin, pmax, parameter_dict,
+                      pseudos=None, priors=None, specific=None):
+        '''
+        balances the model for several conditions at once, with one data
+        SBtab per condition. the basic parameters of the specific quantities
+        get one value per condition; all other basic parameters (the kinetic
+        constants) are shared. the precision matrix of the parameter vector
+        (shared, condition 1, ..., condition K) has arrowhead form and is
+        solved through the Schur complement of the shared block, so that the
+        cost grows linearly with the number of conditions. the prior and the
+        data covariance matrices C_prior and C_x must be diagonal, as built by
+        build_covariance_matrices; check_joint.py compares the result with
+        make_balancing and with a dense solve of the joint system.
+
+        Parameters
+        ----------
+        datasets: list
+            SBtab.SBtabTable data tables, one per condition.
+        pmin, pmax: dict
+            Bounds of the quantities (see misc.extract_pseudos_priors).
+        parameter_dict: dict
+            Options of the balancing (see misc.readout_config).
+        pseudos, priors: dict
+            Pseudo values and priors (see misc.extract_pseudos_priors);
+            the pseudo values are used if they are given.
+        specific: list
+            Quantities with one value per condition (default:
+            condition_specific).
+
+        Returns: list
+            Results of make_balancing for every condition; the shared
+            parameters and the quantities derived from them only are the
+            same in all of them.
+        '''
+        if specific is None: specific = condition_specific
+        balancings = self._prepare_data_sets(datasets, pmin, pmax,
+                                             parameter_dict, pseudos, priors)
+        if not balancings: return []
+        for pb in balancings:
+            for matrix in (pb.C_prior_inv, pb.C_x_inv):
+                if numpy.ndim(matrix) and numpy.count_nonzero(
+                        matrix - numpy.diag(numpy.diag(matrix))):
+                    raise ParameterBalancingError('The joint balancing '
+                                                  'requires diagonal covariance'
+                                                  ' matrices.')
+
+        with self.stage('posterior_solve') as sizes:
+            first = balancings[0]
+            Q = first.Q
+            is_specific = numpy.array([theta[0] in specific for theta in
+                                       first.theta_basic], dtype=bool)
+            shared = numpy.flatnonzero(~is_specific)
+            own = numpy.flatnonzero(is_specific)
+            sizes['conditions'] = len(balancings)
+            sizes['shared'] = len(shared)
+            sizes['specific'] = len(own)
+
+            # the prior (the rows of D with pseudo values, else the basic
+            # parameters) enters once for the shared rows and once per
+            # condition for the condition specific rows
+            if first.pseudo_used: prior_rows = Q
+            else: prior_rows = numpy.identity(len(first.theta_basic))
+            (prior_shared,
+             prior_own) = self._arrowhead_blocks(prior_rows,
+                                                 numpy.diag(first.C_prior_inv),
+                                                 first.q_prior, shared, own)
+            conditions = len(balancings)
+            A = prior_shared[0] + conditions * prior_own[0]
+            r_shared = prior_shared[1] + conditions * prior_own[3]
+            blocks = []
+            for pb in balancings:
+                (B, D, r_own) = (prior_own[1], prior_own[2], prior_own[4])
+                if numpy.ndim(pb.Q_star):
+                    (data_shared,
+                     data_own) = self._arrowhead_blocks(pb.Q_star,
+                                                        numpy.diag(pb.C_x_inv),
+                                                        pb.x_star, shared, own)
+                    A = A + data_shared[0] + data_own[0]
+                    r_shared = r_shared + data_shared[1] + data_own[3]
+                    (B, D, r_own) = (B + data_own[1], D + data_own[2],
+                                     r_own + data_own[4])
+                D_inv = numpy.linalg.inv(D)
+                blocks.append((B, D_inv, numpy.dot(B, D_inv), r_own))
+
+            # Schur complement of the shared block
+            S = A
+            rhs = r_shared
+            for (B, D_inv, B_D_inv, r_own) in blocks:
+                S = S - numpy.dot(B_D_inv, B.transpose())
+                rhs = rhs - numpy.dot(B_D_inv, r_own)
+            S_inv = numpy.linalg.inv(S)
+            q_shared = numpy.dot(S_inv, rhs)
+
+            # posterior of every condition: the shared and its own block
+            posteriors = []
+            for (B, D_inv, B_D_inv, r_own) in blocks:
+                q_post = numpy.zeros(len(first.theta_basic))
+                q_post[shared] = q_shared
+                q_post[own] = numpy.dot(D_inv, r_own -
+                                        numpy.dot(B.transpose(), q_shared))
+                C_cross = -numpy.dot(S_inv, B_D_inv)
+                C_post = numpy.zeros((len(q_post), len(q_post)))
+                C_post[numpy.ix_(shared, shared)] = S_inv
+                C_post[numpy.ix_(shared, own)] = C_cross
+                C_post[numpy.ix_(own, shared)] = C_cross.transpose()
+                C_post[numpy.ix_(own, own)] = D_inv - \
+                    numpy.dot(B_D_inv.transpose(), C_cross)
+                C_xpost = numpy.dot(numpy.dot(Q, C_post), Q.transpose())
+                posteriors.append((C_post, C_xpost, q_post))
+
+        results = []
+        for pb, posterior in zip(balancings, posteriors):
+            pb.log += 'Joint balancing of %s conditions; condition specific '\
+                      'quantities: %s.\n' % (conditions, ', '.join(specific))
+            results.append(pb.finish_balancing(posterior=posterior))
+        return results
+
+    def _arrowhead_blocks(self, matrix, weights, values, shared, own):
+        '''
+        splits M^T W M and M^T W v of measurement rows M (diagonal weights
+        W, values v) into the blocks of the shared and the condition
+        specific parameters. returns the blocks (A, r) of the rows that only
+        depend on shared parameters and the blocks (A, B, D, r, r_own) of
+        the other rows
+        '''
+        matrix = numpy.asarray(matrix, dtype=float)
+        values = numpy.asarray(values, dtype=float)
+        weighted = matrix * weights[:, numpy.newaxis]
+        depends = numpy.any(matrix[:, own] != 0, axis=1)
+
+        rows = ~depends
+        W_shared = weighted[rows][:, shared].transpose()
+        shared_blocks = (numpy.dot(W_shared, matrix[rows][:, shared]),
+                         numpy.dot(W_shared, values[rows]))
+
+        rows = depends
+        W_shared = weighted[rows][:, shared].transpose()
+        W_own = weighted[rows][:, own].transpose()
+        own_blocks = (numpy.dot(W_shared, matrix[rows][:, shared]),
+                      numpy.dot(W_shared, matrix[rows][:, own]),
+                      numpy.dot(W_own, matrix[rows][:, own]),
+                      numpy.dot(W_shared, values[rows]),
+                      numpy.dot(W_own, values[rows]))
+        return (shared_blocks, own_blocks)
+
     def build_desired_parameters(self):
         '''
         builds up a dictionary of identifiers for those parameters that are
@@ -1454,6 +1910,7 @@ class ParameterBalancing:
         calculate the shannon entropies of the prior and the posterior
         covariance matrices
         '''
+        import scipy.linalg
         shannons = []
         # first, shannon entropy of prior matrix self.C_prior
         shannon_prior = 0.5 * numpy.log((2 * numpy.pi * numpy.exp(2)) * \
@@ -1483,6 +1940,7 @@ class ParameterBalancing:
         from the posterior distribution
         '''
         # first, get the matrix root of the posterior covariance matrix
+        import scipy.linalg
         C_root = scipy.linalg.matfuncs.sqrtm(c_matrix_inc)
         list_of_SBtab_strings = []
 
@@ -1504,10 +1962,10 @@ class ParameterBalancing:
 
         return list_of_SBtab_strings
 
-    def build_dependence_matrix(self):
+    def build_dependence_matrix(self, layout=None):
         '''
         builds the dependence matrix D from all the submatrices needed for the
-        balancing
+        balancing; if a layout (see get_layout) is given, D is taken from it
         '''
         # the dependence matrix consists of two major parts: the unit matrix
         # on top and the rows below the unit matrix
@@ -1515,6 +1973,9 @@ class ParameterBalancing:
         self.parameter2row = {}
         self.quantities = []
 
+        if layout is not None:
+            return self.dependence_matrix_from_layout(layout)
+
         # first, we build up the unit matrix
         unit_matrix = self.build_unit_matrix()
         for row in unit_matrix:
@@ -1530,6 +1991,43 @@ class ParameterBalancing:
         matrix = numpy.array(D_matrix)
         return matrix
 
+    def dependence_matrix_from_layout(self, layout):
+        '''
+        takes the dependence matrix D from a layout and restores the row
+        information that build_unit_matrix and build_bottom_row collect
+        '''
+        self.bounds = []
+        self.id_order = {}
+        self.remember_links = {}
+        matrix = layout['Q']
+        bounds_new = '!Min' in self.sbtab_new.columns_dict
+        bounds_old = '!Min' in self.sbtab.columns_dict and \
+                     '!Max' in self.sbtab.columns_dict
+
+        for i, row_identifier in enumerate(layout['rows']):
+            self.parameter2row[row_identifier] = matrix[i]
+            self.quantities.append(row_identifier[0])
+            self.id_order[row_identifier] = i
+            if i < layout['basic']:
+                if bounds_new:
+                    self.bounds.append(self.parameter2bounds[row_identifier])
+            elif bounds_old:
+                self.bounds.append(self.parameter2bounds[row_identifier])
+
+        self.matrix_row_counter = len(self.id_order)
+        return matrix
+
+    def get_layout(self):
+        '''
+        returns the structural layout of the balancing: the identifiers
+        (quantity, reaction/species) of theta and of the rows of D, the
+        number of basic parameters, and D itself
+        '''
+        return {'theta': [(theta[0], theta[2]) for theta in self.theta_vector],
+                'basic': len(self.theta_basic),
+                'rows': sorted(self.id_order, key=self.id_order.get),
+                'Q': self.Q}
+
     def build_unit_matrix(self):
         '''
         builds up the unit matrix as a first part of the dependence matrix D
@@ -1711,10 +2209,11 @@ class ParameterBalancing:
 
         return matrix
 
-    def build_theta_vector(self):
+    def build_theta_vector(self, layout=None):
         '''
         generates the theta_vector (default prior means for every parameter
-        in model)
+        in model); if a layout (see get_layout) is given, the parameters are
+        taken from it in its order
         '''
         self.parameter2row = {}
         theta = []
@@ -1726,6 +2225,21 @@ class ParameterBalancing:
         self.quantities_inc = []
         self.bounds_inc = []
 
+        if layout is not None:
+            for i, (quantity, identifier) in enumerate(layout['theta']):
+                (prior_mean, prior_std) = self.prior_values[quantity][0]
+                theta.append((quantity, prior_mean, identifier))
+                if i < layout['basic']:
+                    self.theta_basic.append(theta[-1])
+                    self.log_stds_prior.append(prior_std)
+                self.q_prior.append(prior_mean)
+                self.quantities_inc.append(quantity)
+                if (quantity, identifier) in self.parameter2bounds.keys():
+                    if self.min_column:
+                        self.bounds_inc.append(self.parameter2bounds[(quantity,
+                                                                      identifier)])
+            return theta
+
         for quantity in self.prior_list:
             if self.parameter_dict[quantity]:
                 if quantity in self.species_parameters:
@@ -1859,6 +2373,14 @@ class ParameterBalancing:
         C_prior = numpy.array(C_prior_rows)
         # second, generate covariance matrix according to the input values in
         # the x-vector
+        C_x = self.build_data_covariance()
+
+        return C_prior, C_x
+
+    def build_data_covariance(self):
+        '''
+        generate covariance matrix C_x for the measured values x
+        '''
         C_x_rows = []
 
         for i, x_entry in enumerate(self.x_vector):
@@ -1876,7 +2398,7 @@ class ParameterBalancing:
         if C_x_rows == []: C_x = 0
         else: C_x = numpy.array(C_x_rows)
 
-        return C_prior, C_x
+        return C_x
 
     def get_default_std(self, quantity):
         '''
@@ -1884,20 +2406,17 @@ class ParameterBalancing:
         '''
         return self.prior_values[quantity][0][1]
 
-    def calculate_posteriori(self):
+    def invert_covariance_matrices(self, prior=True):
         '''
-        calculates the posteriori values
+        inverts the covariance matrices of the data and (if prior is set) of
+        the prior; they do not depend on the temperature and are shared by
+        all conditions of a sweep
         '''
-        # if no data is given, these variables are zero
-        if self.x_star == []: self.x_star = 0
-       
         try: self.C_x_inv = numpy.linalg.inv(self.C_x)
         except:
             #print("C_x is not invertible\n")
             self.C_x_inv = 0
-
-        try: Q_star_trans = self.Q_star.transpose()
-        except: Q_star_trans = 0
+        if not prior: return
 
         # matrix inverse
         try: self.C_prior_inv = numpy.linalg.inv(self.C_prior)
@@ -1905,6 +2424,24 @@ class ParameterBalancing:
             print("C_prior is not invertible\n")
             sys.exit()
 
+    def calculate_posteriori(self, posterior=None):
+        '''
+        calculates the posteriori values; a posterior (C_post, C_xpost,
+        q_post) that has been solved for a batch of data sets is taken over
+        '''
+        # if no data is given, these variables are zero
+        if self.x_star == []: self.x_star = 0
+
+        if posterior is not None:
+            (self.C_post, self.C_xpost, self.q_post) = posterior
+            self.stds_log_inc = self.extract_cpost_inc()
+            self.stds_log_post = self.extract_cpost()
+            self.x_post = numpy.dot(self.Q, self.q_post)
+            return
+       
+        try: Q_star_trans = self.Q_star.transpose()
+        except: Q_star_trans = 0
+
         # for i, row in enumerate(self.C_prior):
         #     print(self.quantities_inc[i], ',', list(row))
 
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+'''
+Consistency check of the joint multi-condition balancing.
+
+ParameterBalancing.balance_joint solves the arrowhead system of shared and
+condition specific parameters through the Schur complement of the shared
+block. This script balances an example model (see benchmark.py) and
+compares
+
+  - one condition with the ordinary balancing (make_balancing) and
+  - two conditions (the data file and a copy with scaled concentrations)
+    with a dense solve of the full joint system,
+
+by the largest deviation of the posterior means and covariances, relative
+to the largest entry of the reference. The script fails if a deviation
+exceeds the tolerance.
+'''
+import argparse
+import contextlib
+import copy
+import io
+import os
+import sys
+import numpy
+
+try:
+    from . import balancer
+    from . import benchmark
+    from . import misc
+    from . import SBtab
+except:
+    import balancer
+    import benchmark
+    import misc
+    import SBtab
+
+
+def load_example(name, path=benchmark.example_path):
+    '''
+    reads the SBML model, the data SBtab and the prior of an example model
+    together with the default options
+    '''
+    import libsbml
+    (sbml, data, prior) = benchmark.example_models[name]
+    default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'files', 'default_files')
+    if prior: prior = os.path.join(path, prior)
+    else: prior = os.path.join(default_path, 'pb_prior.tsv')
+
+    sbml_model = libsbml.readSBMLFromFile(os.path.join(path,
+                                                       sbml)).getModel()
+    with open(os.path.join(path, data)) as d_file:
+        sbtab_data = SBtab.SBtabTable(d_file.read(), os.path.basename(data))
+    with open(prior) as p_file:
+        sbtab_prior = SBtab.SBtabTable(p_file.read(), 'pb_prior.tsv')
+    with open(os.path.join(default_path, 'pb_options.tsv')) as o_file:
+        sbtab_options = SBtab.SBtabTable(o_file.read(), 'pb_options.tsv')
+    (pseudos, priors, pmin, pmax) = misc.extract_pseudos_priors(sbtab_prior)
+    (parameter_dict, log) = misc.readout_config(sbtab_options)
+    parameter_dict.pop('size_limit', None)
+    for quantity in balancer.name2index:
+        parameter_dict.setdefault(quantity, True)
+    if parameter_dict.get('use_pseudo_values') != 'True':
+        pseudos = priors = None
+    return (sbml_model, sbtab_data, (pseudos, priors, pmin, pmax),
+            parameter_dict)
+
+
+def scale_data(sbtab_data, quantities, factor):
+    '''
+    returns a copy of a data SBtab with the mean values of the given
+    quantities multiplied by factor
+    '''
+    sbtab_data = copy.deepcopy(sbtab_data)
+    types = sbtab_data.columns_dict['!QuantityType']
+    means = sbtab_data.columns_dict['!Mean']
+    rows = [list(row) for row in sbtab_data.value_rows]
+    for row in rows:
+        if row[types] in quantities:
+            try: row[means] = str(float(row[means]) * factor)
+            except ValueError: pass
+    return SBtab.SBtabTable.from_rows(sbtab_data.header_row,
+                                      sbtab_data.columns, rows,
+                                      'scaled_' + sbtab_data.filename)
+
+
+def deviation(value, reference):
+    '''
+    largest absolute deviation relative to the largest reference entry
+    '''
+    reference = numpy.asarray(reference, dtype=float)
+    return numpy.abs(numpy.asarray(value, dtype=float) -
+                     reference).max() / max(numpy.abs(reference).max(), 1.)
+
+
+def dense_joint(balancings, specific):
+    '''
+    solves the joint balancing of prepared data sets (see
+    ParameterBalancing._prepare_data_sets) with the full precision matrix
+    of the parameter vector (shared, condition 1, ..., condition K); returns
+    the posterior mean and covariance of the basic parameters per condition
+    '''
+    first = balancings[0]
+    conditions = len(balancings)
+    is_specific = numpy.array([theta[0] in specific for theta in
+                               first.theta_basic], dtype=bool)
+    shared = numpy.flatnonzero(~is_specific)
+    own = numpy.flatnonzero(is_specific)
+    size = len(shared) + conditions * len(own)
+
+    def expand(matrix, k):
+        matrix = numpy.atleast_2d(numpy.asarray(matrix, dtype=float))
+        joint = numpy.zeros((matrix.shape[0], size))
+        joint[:, :len(shared)] = matrix[:, shared]
+        start = len(shared) + k * len(own)
+        joint[:, start:start + len(own)] = matrix[:, own]
+        return joint
+
+    # the prior enters once for the shared rows and once per condition for
+    # the condition specific rows, the data once per condition
+    if first.pseudo_used: prior_rows = first.Q
+    else: prior_rows = numpy.identity(len(first.theta_basic))
+    prior_weights = numpy.diag(first.C_prior_inv)
+    prior_values = numpy.asarray(first.q_prior, dtype=float)
+    depends = numpy.any(prior_rows[:, own] != 0, axis=1)
+    rows = [expand(prior_rows[~depends], 0)] + \
+           [expand(prior_rows[depends], k) for k in range(conditions)]
+    weights = [prior_weights[~depends]] + [prior_weights[depends]] * conditions
+    values = [prior_values[~depends]] + [prior_values[depends]] * conditions
+    for k, pb in enumerate(balancings):
+        if not numpy.ndim(pb.Q_star): continue
+        rows.append(expand(pb.Q_star, k))
+        weights.append(numpy.diag(pb.C_x_inv))
+        values.append(numpy.asarray(pb.x_star, dtype=float))
+    rows = numpy.vstack(rows)
+    weights = numpy.concatenate(weights)
+    values = numpy.concatenate(values)
+
+    C_post = numpy.linalg.inv(numpy.dot(rows.transpose(),
+                                        weights[:, numpy.newaxis] * rows))
+    q_post = numpy.dot(C_post, numpy.dot(rows.transpose(), weights * values))
+
+    order = numpy.concatenate([shared, own])
+    posteriors = []
+    for k in range(conditions):
+        index = numpy.concatenate([numpy.arange(len(shared)),
+                                   len(shared) + k * len(own) +
+                                   numpy.arange(len(own))])
+        q_k = numpy.zeros(len(first.theta_basic))
+        q_k[order] = q_post[index]
+        C_k = numpy.zeros((len(q_k), len(q_k)))
+        C_k[numpy.ix_(order, order)] = C_post[numpy.ix_(index, index)]
+        posteriors.append((q_k, C_k))
+    return posteriors
+
+
+def check_joint(name='teusink', factor=2.):
+    '''
+    returns the deviations (check, mean deviation, covariance deviation) of
+    the joint balancing of an example model from the references
+    '''
+    (sbml_model, sbtab_data, (pseudos, priors, pmin, pmax),
+     parameter_dict) = load_example(name)
+    specific = balancer.condition_specific
+    datasets = [sbtab_data, scale_data(sbtab_data, specific, factor)]
+    deviations = []
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        # one condition: the ordinary balancing
+        pb = balancer.ParameterBalancing(sbml_model)
+        options = copy.deepcopy(parameter_dict)
+        sbtab = pb.make_sbtab(copy.deepcopy(sbtab_data), sbtab_data.filename,
+                              'All organisms', 43, pmin, pmax, options)
+        sbtab_new = pb.fill_sbtab(copy.deepcopy(sbtab), pseudos, priors)
+        reference = pb.make_balancing(sbtab_new, sbtab, pmin, pmax, options)
+        joint = balancer.ParameterBalancing(sbml_model).balance_joint(
+            copy.deepcopy(datasets[:1]), pmin, pmax,
+            copy.deepcopy(parameter_dict), pseudos, priors)[0]
+        deviations.append(('1 condition vs. make_balancing',
+                           deviation(joint[2], reference[2]),
+                           deviation(joint[4], reference[4])))
+
+        # two conditions: the dense joint solve
+        joint = balancer.ParameterBalancing(sbml_model).balance_joint(
+            copy.deepcopy(datasets), pmin, pmax,
+            copy.deepcopy(parameter_dict), pseudos, priors)
+        balancings = balancer.ParameterBalancing(sbml_model).\
+            _prepare_data_sets(copy.deepcopy(datasets), pmin, pmax,
+                               copy.deepcopy(parameter_dict), pseudos, priors)
+    for k, (q_post, C_post) in enumerate(dense_joint(balancings, specific)):
+        deviations.append(('2 conditions vs. dense solve, condition %s'
+                           % (k + 1), deviation(joint[k][2], q_post),
+                           deviation(joint[k][4], C_post)))
+    return deviations
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('model', nargs='?', default='teusink', help='Name of the example model (see benchmark.py; default: teusink).')
+    parser.add_argument('-f', '--factor', type=float, default=2., help='Factor of the concentrations in the data of the second condition.')
+    parser.add_argument('-t', '--tolerance', type=float, default=1e-3, help='Allowed relative deviation from the references.')
+
+    args = parser.parse_args()
+
+    if args.model not in benchmark.example_models:
+        parser.error('unknown model %s; choose from %s'
+                     % (args.model, ', '.join(sorted(benchmark.example_models))))
+
+    failed = False
+    for (check, mean, covariance) in check_joint(args.model, args.factor):
+        status = 'ok'
+        if max(mean, covariance) > args.tolerance:
+            status = 'FAILED'
+            failed = True
+        print('%-46s mean %.1e  covariance %.1e  %s' % (check, mean,
+                                                         covariance, status))
+    if failed: sys.exit(1)
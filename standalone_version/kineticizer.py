@@ -1,5 +1,5 @@
 #!/usr/bin/env python
-import libsbml
+import re
 import sys
 try: from . import misc
 except: import misc
@@ -67,6 +67,11 @@ class Kineticizer(object):
                      'met_conc': ('', '', '', 'opt'),
                      'enz_conc': ('', '', '', 'opt')}
 
+    # names in the kinetic laws that do not belong to a reaction: the
+    # constants and the functions of the formulas
+    formula_constants = ('R', 'temp', 'exp', 'sqrt', 'pow', 'ln', 'log',
+                         'abs')
+
     sbo_inh = [20, 206, 207, 536, 537]
     sbo_act = [13, 21, 459, 461, 462]
 
@@ -108,6 +113,13 @@ class Kineticizer(object):
     @type  writer: class
     @param writer: writer class providing the write function. default
                    is sys.stderr
+    @type  use_templates: boolean
+    @param use_templates: build the kinetic law formulas from templates
+                          that are cached per reaction shape instead of
+                          assembling every formula from its terms
+    @type  snapshot: misc.ModelSnapshot
+    @param snapshot: structure of the model, if it has been read already
+                     (e.g. by the parameter balancing)
     '''
     def __init__(self, model,
                      sbtab=None,
@@ -116,7 +128,9 @@ class Kineticizer(object):
                      default_inh='complete_inh',
                      default_act='complete_act',
                      overwrite_existing=True,
-                     writer=sys.stderr):
+                     writer=sys.stderr,
+                     use_templates=True,
+                     snapshot=None):
 
         self._model = model
         self._writer = writer
@@ -126,6 +140,10 @@ class Kineticizer(object):
 SBO Terms not supported for this document.\n')
         self._sbtab = sbtab
         self._enzyme_prefac = enzyme_prefac
+        self._use_templates = use_templates
+        # kinetic law templates per reaction shape, see
+        # _get_formula_from_template
+        self._templates = {}
 
         if default_inh not in ['partial_inh', 'complete_inh', 'specific_inh']:
             raise Exception('Unknown inhibition')
@@ -137,6 +155,22 @@ SBO Terms not supported for this document.\n')
 
         self.sbo2type = dict(zip(self.type2sbo.values(), self.type2sbo.keys()))
 
+        # IDs of the parameters in the model (key None) and in the kinetic
+        # laws (key: reaction ID), see _get_param_ids
+        self._param_ids = {}
+        # enzyme prefactors per reaction ID and the IDs of the reactions
+        # that got a kinetic law; variant rewrites these kinetic laws
+        self._enzyme_factors = {}
+        self._kineticized = []
+        self._mode = mode
+
+        # structure of the model and rows of the sbtab by their IDs, see
+        # _get_sbtab_value
+        if snapshot is None:
+            snapshot = misc.ModelSnapshot(model)
+        self._snapshot = snapshot
+        self._sbtab_index = None
+
         if sbtab is not None:
             [global_params, local_params] = self._pack_parameters(mode)
         else:
@@ -176,13 +210,93 @@ SBO Terms not supported for this document.\n')
         '''
         kl = reaction.createKineticLaw()
         kl.setSBOTerm(self._kinetic_law_sbo)
+        # the new kinetic law has no parameters yet
+        self._param_ids[reaction.getId()] = set()
         # create the local parameters
         self._create_local_params(reaction, params, mode)
+        self._write_formula(reaction, mode)
+        self._kineticized.append(reaction.getId())
+
+    def _write_formula(self, reaction, mode):
+        '''
+        write the formula of the kinetic law of the given reaction; the
+        parameters of the kinetic law must exist already
+        @type  reaction:  libsbml.reaction
+        @param reaction:  the reaction
+        @type  mode:      string
+        @param mode:      parametrisation type ('cat' | 'weg' | 'hal')
+        '''
+        kl = reaction.getKineticLaw()
+
+        # get the regulation types of the modifiers
+        reg_types = self._get_regulation_types(reaction)
+
+        # generate the kinetic formula
+        formula = None
+        if self._use_templates:
+            formula = self._get_formula_from_template(reaction, mode,
+                                                      reg_types)
+        if formula is None:
+            formula = self._get_formula(reaction, mode, reg_types)
+
+        if self._enzyme_prefac:
+            # include enzyme as prefactor to kinetic law
+            enz_fac = self._enzyme_factors.get(reaction.getId())
+            if enz_fac is None:
+                concentration = self._get_sbtab_entry('enz_conc', reaction)
+                compartment = 1.
+                enz_fac = '( %s / %s)' % (concentration, compartment)
+                self._enzyme_factors[reaction.getId()] = enz_fac
+            formula = enz_fac + ' * ' + formula
+
+        kl.setFormula(formula)
 
+    def variant(self, kineticizer_class, model=None):
+        '''
+        write the kinetic laws of another rate law class to a copy of the
+        kineticized model. the parameters, the concentrations and the
+        enzyme prefactors are taken over, so that only the formulas are
+        written again
+        @type  kineticizer_class: class
+        @param kineticizer_class: rate law class (e.g. KineticizerMS)
+        @type  model:             libsbml.Model
+        @param model:             copy of the kineticized model (by default
+                                  it is cloned)
+        @return:                  the model with the kinetic laws of the
+                                  rate law class
+        '''
+        if model is None:
+            model = self._model.clone()
+        kin = kineticizer_class.__new__(kineticizer_class)
+        kin.__dict__.update(self.__dict__)
+        kin._model = model
+        kin._param_ids = {}
+        # the templates contain the denominator of the rate law class
+        kin._templates = {}
+        for r_id in self._kineticized:
+            reaction = model.getReaction(r_id)
+            reaction.getKineticLaw().setSBOTerm(kin._kinetic_law_sbo)
+            kin._write_formula(reaction, self._mode)
+        return model
+
+    def _get_formula(self, reaction, mode, reg_types=None):
+        '''
+        generate the formula of the kinetic law for the given reaction
+        (without the enzyme prefactor)
+        @type  reaction:   libsbml.reaction
+        @param reaction:   the reaction
+        @type  mode:       string
+        @param mode:       parametrisation type ('cat' | 'weg' | 'hal')
+        @type  reg_types:  list
+        @param reg_types:  regulation types as returned by
+                           _get_regulation_types (determined if None)
+        @rtype:            string
+        @return:           formula of the kinetic law
+        '''
         # generate numerator, denominator, regulational prefactors
         numer = self._get_numerator(reaction, mode)
         denom = self._get_denominator(reaction, mode)
-        prefac, denom_term = self._get_regulation(reaction)
+        prefac, denom_term = self._get_regulation(reaction, reg_types)
 
         # add regulation to denominator, if there is
         if denom_term != '':
@@ -193,14 +307,73 @@ SBO Terms not supported for this document.\n')
         if prefac != '':
             formula = '(%s) * %s' % (prefac, formula)
 
-        if self._enzyme_prefac:
-            # include enzyme as prefactor to kinetic law
-            concentration = self._get_sbtab_entry('enz_conc', reaction)
-            compartment = 1.
-            enz_fac = '( %s / %s)' % (concentration, compartment)
-            formula = enz_fac + ' * ' + formula
+        return formula
 
-        kl.setFormula(formula)
+    def _get_formula_from_template(self, reaction, mode, reg_types):
+        '''
+        generate the formula of the kinetic law for the given reaction from
+        a template. reactions of the same shape (stoichiometries, regulation
+        types and coinciding IDs) share one template, which is assembled
+        from its terms once and then only filled with the IDs of each
+        reaction
+        @type  reaction:   libsbml.reaction
+        @param reaction:   the reaction
+        @type  mode:       string
+        @param mode:       parametrisation type ('cat' | 'weg' | 'hal')
+        @type  reg_types:  list
+        @param reg_types:  regulation types as returned by
+                           _get_regulation_types
+        @rtype:            string
+        @return:           formula of the kinetic law (None if the reaction
+                           cannot use a template)
+        '''
+        # collect all reaction specific names that can occur in the formula
+        r_id = reaction.getId()
+        reactants = [(s.getSpecies(), s.getStoichiometry())
+                     for s in reaction.getListOfReactants()]
+        products = [(s.getSpecies(), s.getStoichiometry())
+                    for s in reaction.getListOfProducts()]
+        species = [s_id for s_id, stoich in reactants + products] + \
+                  [m.getSpecies() for m, reg_type in reg_types]
+        names = [r_id] + species
+        for scope, deps, id_temp, required in self.param2options.values():
+            id_temp = id_temp.replace('$REAC$', r_id)
+            if '$SPECIES$' in id_temp:
+                names += [id_temp.replace('$SPECIES$', s_id)
+                          for s_id in species]
+            elif id_temp:
+                names.append(id_temp)
+
+        # names that clash with the constants or functions cannot be filled
+        # in safely; such reactions use _get_formula
+        for name in self.formula_constants:
+            if name in names:
+                return None
+
+        # the first position of each name; this also captures species that
+        # occur more than once in the reaction
+        slot_of = {}
+        pattern = tuple(slot_of.setdefault(name, i)
+                        for i, name in enumerate(names))
+        key = (mode,
+               tuple(repr(stoich) for s_id, stoich in reactants),
+               tuple(repr(stoich) for s_id, stoich in products),
+               tuple(reg_type for m, reg_type in reg_types),
+               pattern)
+
+        template = self._templates.get(key)
+        if template is None:
+            # replace the names in the formula of this reaction by the
+            # positions of the names
+            formula = self._get_formula(reaction, mode, reg_types)
+            formula = formula.replace('{', '{{').replace('}', '}}')
+            template = re.sub(r'(?<![\w.])[A-Za-z_]\w*',
+                              lambda match: '{%s}' % slot_of[match.group(0)]
+                              if match.group(0) in slot_of
+                              else match.group(0), formula)
+            self._templates[key] = template
+
+        return template.format(*names)
 
     def _add_param(self, p_type, value, reaction=None, species=None):
         '''
@@ -217,39 +390,65 @@ SBO Terms not supported for this document.\n')
         @param species:    the spiecies if parameter is associated with
                            a species
         '''
-        # get the options for this parameter
-        scope, deps, id_temp, required = self.param2options[p_type]
-        # add reaction_id and species_id to parameter id, if possible
-        if reaction:
-            id_temp = id_temp.replace('$REAC$', reaction.getId())
-        if species:
-            try: s_id = species.getSpecies()
-            except: s_id = species.getId()
-            id_temp = id_temp.replace('$SPECIES$', s_id)
-
-        # add parameter to reaction (local scope) of to mode (global scope)
-        if scope == 'local':
-            kl = reaction.getKineticLaw()
-            # before creating a parameter,
-            # check if such a parameter already exists
-            if id_temp in [p.getId() for p in kl.getListOfParameters()]:
-                return
-            p = kl.createParameter()
-        else:
-            # before creating a parameter,
-            # check if such a parameter already exists
-            if id_temp in [p.getId() for p in self._model.getListOfParameters()]:
-                return
-            p = self._model.createParameter()
+        self._add_params(p_type, [(value, reaction, species)])
 
-        p.setId(id_temp)
-        p.setName(id_temp)
+    def _add_params(self, p_type, entries):
+        '''
+        adds the parameters of one type in bulk; parameters that already
+        exist are skipped
+        @type  p_type:     string
+        @param p_type:     type of the parameters (key of self.param2options)
+        @type  entries:    iterable
+        @param entries:    (value, reaction, species) tuples, see _add_param
+        '''
+        # get the options for this parameter type
+        scope, deps, id_template, required = self.param2options[p_type]
+        sbo = self.type2sbo.get(p_type)
+
+        for value, reaction, species in entries:
+            # add reaction_id and species_id to parameter id, if possible
+            id_temp = id_template
+            if reaction:
+                id_temp = id_temp.replace('$REAC$', reaction.getId())
+            if species:
+                try: s_id = species.getSpecies()
+                except: s_id = species.getId()
+                id_temp = id_temp.replace('$SPECIES$', s_id)
+
+            # add parameter to reaction (local scope) of to mode (global scope)
+            # if such a parameter does not exist yet
+            if scope == 'local':
+                param_ids = self._get_param_ids(reaction)
+                if id_temp in param_ids: continue
+                p = reaction.getKineticLaw().createParameter()
+            else:
+                param_ids = self._get_param_ids()
+                if id_temp in param_ids: continue
+                p = self._model.createParameter()
+            param_ids.add(id_temp)
 
-        try:
-            p.setSBOTerm(self.type2sbo[p_type])
-        except: pass
+            p.setId(id_temp)
+            p.setName(id_temp)
+
+            if sbo is not None:
+                try: p.setSBOTerm(sbo)
+                except: pass
+
+            p.setValue(float(value))
 
-        p.setValue(float(value))
+    def _get_param_ids(self, reaction=None):
+        '''
+        returns the set of parameter IDs of the kinetic law of a reaction (or
+        of the model if no reaction is given); it is read from the SBML once
+        and then kept up to date by _add_params
+        '''
+        key = reaction.getId() if reaction else None
+        if key not in self._param_ids:
+            if reaction:
+                parameters = reaction.getKineticLaw().getListOfParameters()
+            else: parameters = self._model.getListOfParameters()
+            self._param_ids[key] = set(p.getId() for p in parameters)
+        return self._param_ids[key]
 
     def _create_local_params(self, reaction, params, mode):
         '''
@@ -279,8 +478,8 @@ SBO Terms not supported for this document.\n')
             if deps == '':
                 self._add_param(p_type, p_value, reaction)
             elif deps == 's':
-                for i, s in enumerate(misc.get_participants(reaction)):
-                    self._add_param(p_type, p_value[i], reaction, s)
+                self._add_params(p_type, [(p_value[i], reaction, s) for i, s in
+                                          enumerate(misc.get_participants(reaction))])
             elif deps == 'k':      # here go the k_i_vec and k_a_vec
                 for i, s in enumerate(misc.get_modifiers(reaction)):
                     sboterm = s.getSBOTerm()
@@ -326,13 +525,10 @@ SBO Terms not supported for this document.\n')
             global_param_count += 1
             # decide whether parameter depends on species / reaction and add it
             if deps == 's' or deps == 'k':
-                i = 0
-                for s in self._model.getListOfSpecies():
-                    if misc.is_enzyme(s):
-                        continue
-                    self._add_param(p_type, p_value[i], reaction=None,
-                                    species=s)
-                    i += 1
+                species = [s for s in self._model.getListOfSpecies()
+                           if not misc.is_enzyme(s)]
+                self._add_params(p_type, [(p_value[i], None, s) for i, s in
+                                          enumerate(species)])
             elif deps == 'r':
                 for i, r in enumerate(self._model.getListOfReactions):
                     self._add_param(p_type, p_value[i], reaction=r,
@@ -351,48 +547,52 @@ SBO Terms not supported for this document.\n')
         @rtype:             float or None
         @return:            return value of None if not found
         '''
-        def get_sbtab_entry(sbtab, **arg_dict):
-            # generic function to get any sbtab entry
-            # iterates over all rows in the sbtab and checks wehter all given
-            # keys are right            
-            for row in sbtab.value_rows:
-                if len(row) == len(sbtab.columns):
-                    r_column = ''
-                    c_column = ''
-
-                    for key in arg_dict:
-                        if key == 'Reaction':
-                            r_column = sbtab.columns_dict['!Reaction:SBML:reaction:id']
-                        if key == 'QuantityType':
-                            qt_column = sbtab.columns_dict['!QuantityType']
-                        if key == 'Compound':
-                            c_column = sbtab.columns_dict['!Compound:SBML:species:id']
-                        m_column = sbtab.columns_dict['!Mode']
-
-                        
-                    if len(arg_dict) > 2 and row[qt_column] == arg_dict['QuantityType']:
-                        if row[r_column] == arg_dict['Reaction']:
-                            if row[c_column] == arg_dict['Compound']:
-                                return row[m_column]
-                            '''
-                            # this here turned out to mess up reactions with multiple modifiers
-                            elif row[qt_column] == 'inhibitory constant' or row[qt_column] == 'activation constant':
-                                return row[m_column]
-                            '''
-                        elif arg_dict['Reaction'] is None:
-                            if row[c_column] == arg_dict['Compound']:
-                                return row[m_column]
-                    else:
-                        if row[qt_column] == arg_dict['QuantityType'] and row[r_column] == arg_dict['Reaction']:
-                            return row[m_column]
-
         # get the reaction and species IDs
         r_id = s_id = None
         try: r_id = reaction.getId()
         except: pass
         try: s_id = species.getId()
         except: pass
+        return self._get_sbtab_value(param_type, r_id, s_id)
 
+    def _get_sbtab_index(self):
+        '''
+        index the values of the sbtab rows by (quantity type, reaction ID,
+        species ID), (quantity type, reaction ID) and (quantity type, None,
+        species ID); like in a scan over the rows, the first matching row
+        wins
+        '''
+        if self._sbtab_index is None:
+            sbtab = self._sbtab
+            qt_column = sbtab.columns_dict['!QuantityType']
+            r_column = sbtab.columns_dict['!Reaction:SBML:reaction:id']
+            c_column = sbtab.columns_dict['!Compound:SBML:species:id']
+            m_column = sbtab.columns_dict['!Mode']
+            index = {}
+            for row in sbtab.value_rows:
+                if len(row) != len(sbtab.columns):
+                    continue
+                qt, r_id, s_id = row[qt_column], row[r_column], row[c_column]
+                value = row[m_column]
+                index.setdefault((qt, r_id, s_id), value)
+                index.setdefault((qt, r_id), value)
+                index.setdefault((qt, None, s_id), value)
+            self._sbtab_index = index
+        return self._sbtab_index
+
+    def _get_sbtab_value(self, param_type, r_id=None, s_id=None):
+        '''
+        get sbtab entry for reaction and species IDs (see _get_sbtab_entry)
+        @type  param_type:  string
+        @param param_type:  type of parameters (the left side
+                            of self.internal2external)
+        @type  r_id:        string
+        @param r_id:        reaction ID
+        @type  s_id:        string
+        @param s_id:        species ID
+        @rtype:             float or None
+        @return:            return value of None if not found
+        '''
         # check whether this parameter is required
         required = self.param2options[param_type][-1] == 'req'
         
@@ -403,16 +603,13 @@ SBO Terms not supported for this document.\n')
         try:
             if s_id is not None:
                 try:
-                    value = float(get_sbtab_entry(self._sbtab,
-                                                  QuantityType=self.internal2external[param_type],
-                                                  Reaction=r_id,
-                                                  Compound=s_id))
+                    value = float(self._get_sbtab_index().get(
+                        (self.internal2external[param_type], r_id, s_id)))
                 except:
                     value = None
             else:
-                value = float(get_sbtab_entry(self._sbtab,
-                                              QuantityType=self.internal2external[param_type],
-                                              Reaction=r_id))
+                value = float(self._get_sbtab_index().get(
+                    (self.internal2external[param_type], r_id)))
         except AttributeError:
             # if no value is given, raise error or continue
             if required:
@@ -436,6 +633,7 @@ SBO Terms not supported for this document.\n')
                       for each param type) and local_parameter is the list of
                       local params (1 entry for each reaction)
         '''
+        snapshot = self._snapshot
         # get the global params
         global_params = []
         # get global params for all parameters specified for this mode
@@ -447,47 +645,34 @@ SBO Terms not supported for this document.\n')
             # if param. depends on species, get one param for each species, if
             # it depends on reaction get one for each reaction
             if deps == 's' or deps == 'k':
-                for s in self._model.getListOfSpecies():
-                    if misc.is_enzyme(s):
+                for s_id, enzyme in zip(snapshot.species_ids,
+                                        snapshot.is_enzyme().tolist()):
+                    if enzyme:
                         continue
-                    p_value = self._get_sbtab_entry(p_type, species=s)
+                    p_value = self._get_sbtab_value(p_type, s_id=s_id)
                     p_vec.append(p_value)
             elif deps == 'r':
-                for r in self._model.getListOfReactions():
-                    p_value = self._get_sbtab_entry(p_type, reaction=r)
+                for r_id in snapshot.reaction_ids:
+                    p_value = self._get_sbtab_value(p_type, r_id=r_id)
                     p_vec.append(p_value)
             global_params.append(p_vec)
 
         # get local parameters (one set for each reaction)
         local_params = []
-        for r in self._model.getListOfReactions():
+        for j, r_id in enumerate(snapshot.reaction_ids):
             reaction_params = []
             for p_type in self.mode2params[mode]:
                 scope, deps, dummy, required = self.param2options[p_type]
                 if scope == 'global':
                     continue
                 if deps == '':
-                    p_vec = self._get_sbtab_entry(p_type, reaction=r)
+                    p_vec = self._get_sbtab_value(p_type, r_id=r_id)
                 elif deps == 's':
-                    p_vec = []
-                    for s in misc.get_participants(r):
-                        p_value = self._get_sbtab_entry(p_type, reaction=r,
-                                                        species=self._model.getSpecies(s.getSpecies()))
-                        p_vec.append(p_value)
-                elif deps == 'k':
-                    p_vec = []
-                    for s in misc.get_modifiers(r):
-
-                                            
-                        p_value = self._get_sbtab_entry(p_type, reaction=r,
-                                                        species=self._model.getSpecies(s.getSpecies()))
-                        p_vec.append(p_value)
-                elif deps == 'm':
-                    p_vec = []
-                    for m in r.getListOfModifiers():
-                        p_value = self._get_sbtab_entry(p_type, reaction=r,
-                                                        species=self._model.getSpecies(m.getSpecies()))
-                        p_vec.append(p_value)
+                    p_vec = [self._get_sbtab_value(p_type, r_id, s_id)
+                             for s_id, stoich in snapshot.participants(j)]
+                elif deps == 'k' or deps == 'm':
+                    p_vec = [self._get_sbtab_value(p_type, r_id, s_id)
+                             for s_id, sbo in snapshot.modifiers(j)]
                 reaction_params.append(p_vec)
             local_params.append(reaction_params)
             
@@ -697,20 +882,17 @@ SBO Terms not supported for this document.\n')
         '''
         raise Exception('Implement me')
 
-    def _get_regulation(self, reaction):
+    def _get_regulation_types(self, reaction):
         '''
-        get regulational term for a reaction
+        get the regulation type of each modifier of a reaction (and set the
+        SBO term of the kinetic law accordingly)
         @type  reaction:  libsbml.reaction
         @param reaction:  reaction
-        @rtype:           tuple
-        @return:          (prefactor, denominator_term), where prefactor is a
-                          list of prefactors to the kinetic law and denominator
-                          term is a list of terms added to the denominator (one
-                          list entry per modifier)
+        @rtype:           list
+        @return:          (modifier, regulation type) tuples; enzymes and
+                          modifiers without regulation parameters are left out
         '''
-        prefacs = []
-        denom_terms = []
-        # generate one term for each modifier
+        reg_types = []
         for m in reaction.getListOfModifiers():
             if misc.is_enzyme(self._model.getSpecies(m.getSpecies())):
                 continue
@@ -727,8 +909,6 @@ SBO Terms not supported for this document.\n')
             inh_ratio = self.param2options['inh_ratio_vec'][2].replace('$REAC$',
                                                                        reaction.getId()).replace('$SPECIES$',
                                                                                                  m.getSpecies())
-            act_term = '(%s/%s)' % (m.getSpecies(), ka)
-            inh_term = '(%s/%s)' % (m.getSpecies(), ki)
 
             # decide for regulation type
             sbo = m.getSBOTerm()
@@ -756,6 +936,51 @@ SBO Terms not supported for this document.\n')
                     raise Exception('Parameter %s not given' % inh_ratio)
             reaction.getKineticLaw().setSBOTerm(self.type2sbo[reg_type])
 
+            if reg_type not in ['partial_act', 'partial_inh', 'complete_act',
+                                'complete_inh', 'specific_act',
+                                'specific_inh']:
+                raise Exception("Unknown regulation type: typo in code")
+            reg_types.append((m, reg_type))
+
+        return reg_types
+
+    def _get_regulation(self, reaction, reg_types=None):
+        '''
+        get regulational term for a reaction
+        @type  reaction:  libsbml.reaction
+        @param reaction:  reaction
+        @type  reg_types: list
+        @param reg_types: regulation types as returned by
+                          _get_regulation_types (determined if None)
+        @rtype:           tuple
+        @return:          (prefactor, denominator_term), where prefactor is a
+                          list of prefactors to the kinetic law and denominator
+                          term is a list of terms added to the denominator (one
+                          list entry per modifier)
+        '''
+        if reg_types is None:
+            reg_types = self._get_regulation_types(reaction)
+
+        prefacs = []
+        denom_terms = []
+        # generate one term for each modifier
+        for m, reg_type in reg_types:
+            # get the ids for the possiby involved parameters
+            ka = self.param2options['k_a_vec'][2].replace('$REAC$',
+                                                          reaction.getId()).replace('$SPECIES$',
+                                                                                    m.getSpecies())
+            ki = self.param2options['k_i_vec'][2].replace('$REAC$',
+                                                          reaction.getId()).replace('$SPECIES$',
+                                                                                    m.getSpecies())
+            act_ratio = self.param2options['act_ratio_vec'][2].replace('$REAC$',
+                                                                       reaction.getId()).replace('$SPECIES$',
+                                                                                                 m.getSpecies())
+            inh_ratio = self.param2options['inh_ratio_vec'][2].replace('$REAC$',
+                                                                       reaction.getId()).replace('$SPECIES$',
+                                                                                                 m.getSpecies())
+            act_term = '(%s/%s)' % (m.getSpecies(), ka)
+            inh_term = '(%s/%s)' % (m.getSpecies(), ki)
+
             # generate the actual terms
             if reg_type == 'partial_act':
                 term = '(%s + (1 - %s) * ( (%s) / (1 + %s)))' % (act_ratio,
@@ -777,8 +1002,6 @@ SBO Terms not supported for this document.\n')
             elif reg_type == 'specific_inh':
                 denom_terms.append(inh_term)
                 continue
-            else:
-                raise Exception("Unknown regulation type: typo in code")
             prefacs.append(term)
 
         prefac = ' * '.join(prefacs)
@@ -860,8 +1083,46 @@ class KineticizerRP(Kineticizer):
         return '(1)'
 
 
+rate_law2class = {'CS': KineticizerCS,
+                  'MS': KineticizerMS,
+                  'DS': KineticizerDS,
+                  'FD': KineticizerFD,
+                  'RP': KineticizerRP}
+
+
+def kineticize_all(model, sbtab=None, rate_laws=('CS', 'MS', 'DS', 'FD', 'RP'),
+                   mode='cat', enzyme_prefac=True, default_inh='complete_inh',
+                   default_act='complete_act', overwrite_existing=True,
+                   writer=sys.stderr, use_templates=True, snapshot=None):
+    '''
+    write the kinetic laws of several rate law classes in one pass. the
+    parameters are read from the SBtab and written to the SBML once; every
+    further rate law class gets a copy of the kineticized model with its own
+    formulas (see Kineticizer.variant)
+    @type  model:     libsbml.Model
+    @param model:     the model; it gets the kinetic laws of the first rate
+                      law class
+    @type  rate_laws: list
+    @param rate_laws: rate law classes (keys of rate_law2class)
+    @return:          dictionary of the rate law classes and their models
+    the other arguments are the ones of the Kineticizer
+    '''
+    for rate_law in rate_laws:
+        if rate_law not in rate_law2class:
+            raise Exception('Unknown rate law %s' % rate_law)
+    kin = rate_law2class[rate_laws[0]](model, sbtab, mode, enzyme_prefac,
+                                       default_inh, default_act,
+                                       overwrite_existing, writer,
+                                       use_templates, snapshot)
+    models = {rate_laws[0]: model}
+    for rate_law in rate_laws[1:]:
+        models[rate_law] = kin.variant(rate_law2class[rate_law])
+    return models
+
+
 if __name__ == '__main__':
 
+    import libsbml
     d = libsbml.readSBML(sys.argv[1])
     m = d.getModel()
 
@@ -4,11 +4,6 @@ A collection of useful tools and functions for the manipulation of SBtab tables
 '''
 import re
 import string
-import libsbml
-import numpy
-import scipy
-import scipy.linalg
-import scipy.optimize
 import random
 import copy
 import math
@@ -227,6 +222,7 @@ def size_warning(sbml_file):
     check whether a given sbml file has more than 250 reactions and 
     then yield a warning message for the online interface
     '''
+    import libsbml
     reader = libsbml.SBMLReader()
     sbml = reader.readSBMLFromString(sbml_file)
     sbml_model = sbml.getModel()
@@ -264,6 +260,140 @@ def is_enzyme(species):
         or species.getSBOTerm() == 460
 
 
+class ModelSnapshot(object):
+    '''
+    Compact copy of the structure of an SBML model. The model is read in a
+    single pass, so that the consumers of the structure (balancing,
+    kineticizer, ID checks) do not call into libsbml over and over.
+
+    The participants (first the reactants, then the products) and the
+    modifiers of all reactions are stored in arrays sorted by reaction:
+    the participants of reaction j are entry_ptr[j]:entry_ptr[j + 1], of
+    which the first num_reactants[j] are reactants, and its modifiers are
+    modifier_ptr[j]:modifier_ptr[j + 1].
+    '''
+    __slots__ = ('species_ids', 'species_names', 'species_sbo',
+                 'species_index', 'reaction_ids', 'reaction_names',
+                 'reaction_index', 'entry_species', 'entry_stoich',
+                 'entry_ptr', 'num_reactants', 'modifier_species',
+                 'modifier_sbo', 'modifier_ptr')
+
+    def __init__(self, model):
+        '''
+        Parameters
+        ----------
+        model: libsbml.Model
+            SBML model.
+        '''
+        import numpy
+
+        self.species_ids = []
+        self.species_names = []
+        species_sbo = []
+        for species in model.getListOfSpecies():
+            self.species_ids.append(species.getId())
+            self.species_names.append(species.getName())
+            species_sbo.append(species.getSBOTerm())
+
+        self.reaction_ids = []
+        self.reaction_names = []
+        self.entry_species = []
+        self.modifier_species = []
+        entry_stoich = []
+        entry_ptr = [0]
+        num_reactants = []
+        modifier_sbo = []
+        modifier_ptr = [0]
+        for reaction in model.getListOfReactions():
+            self.reaction_ids.append(reaction.getId())
+            self.reaction_names.append(reaction.getName())
+            reactants = reaction.getListOfReactants()
+            num_reactants.append(len(reactants))
+            for refs in (reactants, reaction.getListOfProducts()):
+                for ref in refs:
+                    self.entry_species.append(ref.getSpecies())
+                    entry_stoich.append(ref.getStoichiometry())
+            entry_ptr.append(len(self.entry_species))
+            for modifier in reaction.getListOfModifiers():
+                self.modifier_species.append(modifier.getSpecies())
+                modifier_sbo.append(modifier.getSBOTerm())
+            modifier_ptr.append(len(self.modifier_species))
+
+        self.species_sbo = numpy.array(species_sbo, dtype=int)
+        self.entry_stoich = numpy.array(entry_stoich, dtype=float)
+        self.entry_ptr = numpy.array(entry_ptr, dtype=int)
+        self.num_reactants = numpy.array(num_reactants, dtype=int)
+        self.modifier_sbo = numpy.array(modifier_sbo, dtype=int)
+        self.modifier_ptr = numpy.array(modifier_ptr, dtype=int)
+        self.species_index = dict((s_id, i) for i, s_id in
+                                  enumerate(self.species_ids))
+        self.reaction_index = dict((r_id, j) for j, r_id in
+                                   enumerate(self.reaction_ids))
+
+    def _entries(self, start, stop):
+        return list(zip(self.entry_species[start:stop],
+                        self.entry_stoich[start:stop].tolist()))
+
+    def reactants(self, j):
+        '''
+        Returns the (species ID, stoichiometry) pairs of the reactants of
+        reaction j.
+        '''
+        start = int(self.entry_ptr[j])
+        return self._entries(start, start + int(self.num_reactants[j]))
+
+    def products(self, j):
+        '''
+        Returns the (species ID, stoichiometry) pairs of the products of
+        reaction j.
+        '''
+        return self._entries(int(self.entry_ptr[j] + self.num_reactants[j]),
+                             int(self.entry_ptr[j + 1]))
+
+    def participants(self, j):
+        '''
+        Returns the (species ID, stoichiometry) pairs of the reactants and
+        products of reaction j.
+        '''
+        return self._entries(int(self.entry_ptr[j]), int(self.entry_ptr[j + 1]))
+
+    def modifiers(self, j):
+        '''
+        Returns the (species ID, SBO term) pairs of the modifiers of
+        reaction j.
+        '''
+        start = int(self.modifier_ptr[j])
+        stop = int(self.modifier_ptr[j + 1])
+        return list(zip(self.modifier_species[start:stop],
+                        self.modifier_sbo[start:stop].tolist()))
+
+    def is_enzyme(self):
+        '''
+        Returns a Boolean array that marks the enzyme species (see
+        is_enzyme).
+        '''
+        import numpy
+        starts = numpy.array([s_id.startswith('enzyme') for s_id in
+                              self.species_ids], dtype=bool)
+        return (self.species_sbo == 14) | (self.species_sbo == 460) | starts
+
+    def stoichiometric_matrix(self):
+        '''
+        Returns the stoichiometric matrix (species x reactions); reactants
+        have negative coefficients, participants that are not species of
+        the model are left out.
+        '''
+        import numpy
+        matrix = numpy.zeros((len(self.species_ids), len(self.reaction_ids)))
+        for j in range(len(self.reaction_ids)):
+            for sign, entries in ((-1., self.reactants(j)),
+                                  (1., self.products(j))):
+                for s_id, stoich in entries:
+                    i = self.species_index.get(s_id)
+                    if i is not None: matrix[i, j] += sign * stoich
+        return matrix
+
+
 def get_enzyme_for_reaction(reaction, create=False):
     is_enzyme = lambda s: s.getSBOTerm() == 14 \
                 or s.getId().startswith('enzyme') or s.getSBOTerm() == 460
@@ -289,215 +419,156 @@ def get_enzyme_for_reaction(reaction, create=False):
     raise Exception('No enzyme was found for reaction %s' % reaction.getId())
 
 
+def _local_optimize(objective, indiv, maxiter=20):
+    '''
+    refines one individual of the genetic optimiser with a few BFGS steps;
+    defined on module level so that it can be shipped to worker processes
+    '''
+    import scipy.optimize
+    better_indiv = scipy.optimize.fmin_bfgs(objective, indiv, disp=0,
+                                            maxiter=maxiter)
+    return [better_indiv, objective(better_indiv)]
+
+
 def fmin_gen(f, x0, population_size=100, survivors=20, generations=20000,
              bounds=None, variable_is_logarithmic=None, intruders=0,
-             use_pp=True, convenience_class=None, disp=1):
-    import struct
+             convenience_class=None, disp=1, f_population=None,
+             workers=None, executor='process', tol=1e-8, patience=50):
+    '''
+    genetic minimisation of f within the given bounds
 
-    f = open('medians.txt', 'r')
-    medians_no = []
-    content = f.read()
-    for elem in content.split(','):
-        medians_no.append(float(elem))
-    f.close()
-
-    g = open('cpost.txt', 'r')
-    content2 = g.read()
-    C_post_no = []
-    for line in content2.split('\n'):
-        if line != '':
-            linecontent = line.split(',')
-            single_line = []
-            for elem in linecontent:
-                single_line.append(float(elem))
-            C_post_no.append(single_line)
-
-    medians = numpy.array(medians_no)
-    C_post = numpy.array(C_post_no)
-
-    def local_optimize(indiv, convenience_class=None):
-        better_indiv = indiv
-        if convenience_class:
-            better_indiv = scipy.optimize.fmin_bfgs(convenience_class.f,
-                                                    better_indiv, disp=0,
-                                                    maxiter=20)
-            fval = convenience_class.f_opt(better_indiv, medians, C_post)
-        else:
-            fval = f_opt(better_indiv, medians, C_post)
-        return [better_indiv, fval]
+    Parameters
+    ----------
+    f: function
+        Objective for a single individual (1d array).
+    x0: numpy.array
+        Start individual.
+    f_population: function
+        Optional vectorised objective; receives the whole population as
+        2d array (one individual per row) and returns one value per row.
+        If given, the population is rated with a single call.
+    convenience_class: object
+        If it provides a function f, every new individual is refined
+        locally with BFGS steps on convenience_class.f before rating.
+    workers: int
+        Number of workers for the local optimisation; None or 1 runs it
+        in the calling process.
+    executor: str
+        'process' or 'thread'; the process backend requires
+        convenience_class.f to be picklable.
+    tol, patience: float, int
+        The optimisation stops early if the best objective value did not
+        improve by more than tol (relative) for patience generations.
+    '''
+    import concurrent.futures
+    import struct
+    import numpy
 
     def float_to_bits(value):
-        if type(value) == float:
-            return (str(struct.unpack('Q',
-                                      struct.pack('d',
-                                                  value))[0])).rjust(20, "0")
-        else:
-            return ",".join([float_to_bits(x) for x in value.tolist()])
+        return ",".join([(str(struct.unpack('Q', struct.pack('d', x))[0])).rjust(20, "0")
+                         for x in value.tolist()])
 
     def bits_to_float(bits):
-        if "," in bits:
-            return scipy.array([bits_to_float(x) for x in bits.split(",")])
-        else:
-            return struct.unpack('d', struct.pack('Q', int(bits)))[0]
+        return numpy.array([struct.unpack('d', struct.pack('Q', int(x)))[0]
+                            for x in bits.split(",")])
 
     def new_individual():
-        x = []
-        for i in range(indiv_size):
-            if variable_is_logarithmic[i]:
-                logmin = scipy.log(bounds[i][0])
-                logmax = scipy.log(bounds[i][1])
-                x.append(scipy.exp(scipy.rand() * (logmax - logmin) + logmin))
-            else:
-                x.append(scipy.rand() * (bounds[i][1] - bounds[i][0]) +
-                         bounds[i][0])
-        return scipy.array(x)
-
-    def bool_mate(mother, father):
-        ms = float_to_bits(mother)
-        fs = float_to_bits(father)
-        l = random.sample(range(len(ms)), 3)
-        l.sort()
-        [i1, i2, i3] = l
-        cs = ms[:i1] + fs[i1:i2] + ms[i2:i3] + fs[i3:]
-        child = bits_to_float(cs)
-        if child.size != mother.size or None in child or scipy.inf in child \
-           or -scipy.inf in child: raise ValueError()
-        return child
+        x = numpy.random.rand(indiv_size) * (upper - lower) + lower
+        x[is_log] = numpy.exp(numpy.random.rand(is_log.sum()) *
+                              (log_upper - log_lower) + log_lower)
+        return x
 
     def mate(mflist):
         return mflist[0] + mflist[1] - mflist[2]
 
     def mutate(indiv):
-        if not False:
-            bi = float_to_bits(indiv)
-            number = int(math.ceil(float(len(bi)) / 100.))
-            change_indices = random.sample([x for x in range(3, len(bi))],
-                                           number)
-            for ci in change_indices:
-                new = bi[:ci] + str(random.choice(range(10))) + bi[(ci + 1):]
-                try:
-                    bits_to_float(new)
-                    bi = new
-                except struct.error:
-                    # dont accept change
-                    pass
-            return scipy.absolute(bits_to_float(bi))
-        else:
-            return scipy.exp(scipy.log(indiv) + wolf["mutation_factor"] *
-                             scipy.array([random.normalvariate(0, 1) for x in range(indiv_size)]))
+        bi = float_to_bits(indiv)
+        number = int(math.ceil(float(len(bi)) / 100.))
+        change_indices = random.sample(range(3, len(bi)), number)
+        for ci in change_indices:
+            new = bi[:ci] + str(random.choice(range(10))) + bi[(ci + 1):]
+            try:
+                bits_to_float(new)
+                bi = new
+            except (struct.error, ValueError):
+                # dont accept change
+                pass
+        return numpy.absolute(bits_to_float(bi))
 
     def bound(vector):
-        global correct_vector
-
-        if len(vector) == indiv_size:
-            correct_vector = vector
-
-        if len(vector) != indiv_size:
-            print('im doing it right now!')
-            vector = correct_vector
-
-        for i in range(indiv_size):
-            if vector[i] < bounds[i][0]:
-                vector[i] = bounds[i][0]
-                correct_vector = vector
-            elif vector[i] > bounds[i][1]:
-                vector[i] = bounds[i][1]
-                correct_vector = vector
+        vector = numpy.clip(vector, lower, upper)
+        # mutations can produce nan; these are replaced by a new individual
+        if not numpy.all(numpy.isfinite(vector)):
+            return new_individual()
         return vector
 
+    def rate(individuals):
+        if not individuals:
+            return [], []
+        if convenience_class:
+            if pool:
+                jobs = [pool.submit(_local_optimize, convenience_class.f,
+                                    indiv) for indiv in individuals]
+                results = [job.result() for job in jobs]
+            else:
+                results = [_local_optimize(convenience_class.f, indiv)
+                           for indiv in individuals]
+            return [r[0] for r in results], [r[1] for r in results]
+        if f_population is not None:
+            values = f_population(numpy.array(individuals))
+        else:
+            values = [f(indiv) for indiv in individuals]
+        return individuals, list(values)
+
     if bounds is None:
         bounds = [[1e-4, 1e4]] * len(x0)
     if len(bounds) != len(x0):
         raise Exception('Length of x0 and length of bounds do not fit!')
     if variable_is_logarithmic is None:
-        variable_is_logarithmic = [[True]] * len(x0)
+        variable_is_logarithmic = [True] * len(x0)
     if len(variable_is_logarithmic) != len(x0):
         raise Exception('Length of variable_is_logarithmic and x0 do not fit!')
 
-    if use_pp:
-        import pp
-        # get pp servers
-        servers = []
-        fi = file("servers", "r")
-        for l in fi:
-            if l.startswith("#"): continue
-            servers.append(l.split(",")[1])
-        fi.close()
-        # read secret file
-        try:
-            fi = open("secret", "r")
-            secret = fi.readlines()[0]
-            fi.close()
-        except:
-            import sys
-            print('''Please create a file called \"secret\" with one long
-            string in the first line.''')
-            sys.exit(1)
-        if disp == 1:
-            print("starting servers", servers)
-        job_server = pp.Server(ppservers=tuple(servers), secret=secret)
-        print(job_server.get_active_nodes())
+    indiv_size = x0.size
+    lower = numpy.array([float(b[0]) for b in bounds])
+    upper = numpy.array([float(b[1]) for b in bounds])
+    is_log = numpy.array([bool(v) for v in variable_is_logarithmic])
+    log_lower = numpy.log(lower[is_log])
+    log_upper = numpy.log(upper[is_log])
+
+    pool = None
+    if convenience_class and workers and workers > 1:
+        if executor == 'thread':
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        else:
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
 
     population = [x0]
-    indiv_size = x0.size
-    quality = []
     for i in range(population_size - len(population)):
         population.append(new_individual())
+    quality = []
     best_indiv = copy.deepcopy(x0)
+    best_quality = None
+    stagnant = 0
 
     try:
         for i in range(generations):
-            # rate individuals
-            local_optimization_results = []
+            # rate the individuals that have no quality yet
             pre_computed_qualities = len(quality)
-
-            for j in range(pre_computed_qualities, population_size):
-                if use_pp:
-                    if convenience_class:
-                        local_optimization_results.append(job_server.submit(local_optimize,
-                                                                            (population[j],
-                                                                             convenience_class),
-                                                                            modules=("scipy",
-                                                                                     "scipy.optimize",
-                                                                                     "scipy.linalg",
-                                                                                     "bounded"),
-                                                                            globals=globals()))
-                    else:
-                        local_optimization_results.append(job_server.submit(local_optimize,
-                                                                            (population[j],),
-                                                                            modules=("scipy",
-                                                                                     "scipy.optimize",
-                                                                                     "scipy.linalg",
-                                                                                     "bounded"),
-                                                                            globals=globals()))
-                else:
-                    local_optimization_results.append(local_optimize(population[j]))
-
-            if use_pp:
-                for j in range(len(local_optimization_results)):
-                    local_optimization_results[j] = local_optimization_results[j]()
-            for j in range(len(local_optimization_results)):
-                [better_indiv, fval] = local_optimization_results[j]
-                population[pre_computed_qualities + j] = better_indiv
-                quality.append(fval)
+            rated, values = rate(population[pre_computed_qualities:])
+            population[pre_computed_qualities:] = rated
+            quality.extend(values)
 
             # replace None results
             for j in range(len(population)):
-                while quality[j] is None or scipy.isnan(quality[j]):
+                while quality[j] is None or numpy.isnan(quality[j]):
                     population[j] = new_individual()
-                    quality[j] = f_opt(population[j], medians, C_post)
+                    quality[j] = rate([population[j]])[1][0]
 
             # sort
-            sorted_quality = list(zip(quality, population))
-            sorted_quality.sort(key=lambda x: x[0])
-            new_population = []
-            new_quality = []
-            for j in range(survivors):
-                f_val, indiv = sorted_quality[j]
-                new_population.append(indiv)
-                new_quality.append(f_val)
-            population = new_population
-            quality = new_quality
+            order = numpy.argsort(quality, kind='stable')[:survivors]
+            population = [population[j] for j in order]
+            quality = [quality[j] for j in order]
 
             # intrude
             for j in range(intruders):
@@ -512,13 +583,25 @@ def fmin_gen(f, x0, population_size=100, survivors=20, generations=20000,
             if disp == 1:
                 print("generation", str(i + 1).rjust(7), "     f =",
                       quality[0])
-                print(best_indiv)
+
+            # convergence check
+            if best_quality is not None and \
+               best_quality - quality[0] <= tol * max(1., abs(best_quality)):
+                stagnant += 1
+            else:
+                stagnant = 0
+            best_quality = quality[0]
+            if stagnant >= patience:
+                if disp == 1:
+                    print("converged after", i + 1, "generations")
+                break
     except KeyboardInterrupt:
         if disp == 1:
             print("Stopping computation")
+    finally:
+        if pool:
+            pool.shutdown()
 
-    if use_pp:
-        job_server.print_stats()
     if disp == 1:
         print("generation goodbye      f =", quality[0])
 
@@ -529,27 +612,7 @@ def fmin_differential_evolution(f, x0, population_size=100, generations=20000,
                                 bounds=None, variable_is_logarithmic=None,
                                 crossover_factor=0.2, disp=0):
     import struct
-
-    p = open('medians.txt', 'r')
-    medians_no = []
-    content = p.read()
-    for elem in content.split(','):
-        medians_no.append(float(elem))
-    p.close()
-
-    g = open('cpost.txt', 'r')
-    content2 = g.read()
-    C_post_no = []
-    for line in content2.split('\n'):
-        if line != '':
-            linecontent = line.split(',')
-            single_line = []
-            for elem in linecontent:
-                single_line.append(float(elem))
-            C_post_no.append(single_line)
-
-    medians = numpy.array(medians_no)
-    C_post = numpy.array(C_post_no)
+    import numpy
 
     def float_to_bits(value):
         if type(value) == float:
@@ -561,21 +624,21 @@ def fmin_differential_evolution(f, x0, population_size=100, generations=20000,
 
     def bits_to_float(bits):
         if "," not in bits:
-            return struct.unpack('d', struct.pack('Q', long(bits)))[0]
+            return struct.unpack('d', struct.pack('Q', int(bits)))[0]
         else:
-            return scipy.array([bits_to_float(x) for x in bits.split(",")])
+            return numpy.array([bits_to_float(x) for x in bits.split(",")])
 
     def new_individual():
         x = []
         for i in range(indiv_size):
             if variable_is_logarithmic[i]:
-                logmin = scipy.log(bounds[i][0])
-                logmax = scipy.log(bounds[i][1])
-                x.append(scipy.exp(scipy.rand() * (logmax - logmin) + logmin))
+                logmin = numpy.log(bounds[i][0])
+                logmax = numpy.log(bounds[i][1])
+                x.append(numpy.exp(numpy.random.rand() * (logmax - logmin) + logmin))
             else:
-                x.append(scipy.rand() * (bounds[i][1] - bounds[i][0]) +
+                x.append(numpy.random.rand() * (bounds[i][1] - bounds[i][0]) +
                          bounds[i][0])
-        return scipy.array(x)
+        return numpy.array(x)
 
     def crossover(orig, crossing_vector):
         for i in range(len(orig.tolist())):
@@ -680,7 +743,24 @@ def split_sbtabs(sbtab_strings):
     return sbtabs
 
 
-def sbtab_to_html(sbtab, filename=None, mode='sbtab_online', template = [], put_links = True, title_string='', show_header_row = True, show_table_name = False, show_table_text = False, definitions_file=''):
+def _page_window(rows, page=None, page_size=1000):
+    '''
+    returns the rows of a page and the HTML navigation to the neighbouring
+    pages (all rows and no navigation if page is None)
+    '''
+    if page is None or len(rows) <= page_size: return (rows, '')
+    pages = (len(rows) - 1) // page_size + 1
+    page = max(0, min(page, pages - 1))
+    start = page * page_size
+    stop = min(start + page_size, len(rows))
+    links = []
+    if page > 0: links.append('<a href="?page=%s">previous</a>' % (page - 1))
+    if page < pages - 1: links.append('<a href="?page=%s">next</a>' % (page + 1))
+    navigation = '<p>Rows %s to %s of %s (page %s of %s) %s</p>' % (start + 1, stop, len(rows), page + 1, pages, ' '.join(links))
+    return (rows[start:stop], navigation)
+
+
+def sbtab_to_html(sbtab, filename=None, mode='sbtab_online', template = [], put_links = True, title_string='', show_header_row = True, show_table_name = False, show_table_text = False, definitions_file='', page=None, page_size=1000):
     '''
     Generates html view out of SBtab table or SBtab document object.
 
@@ -693,6 +773,11 @@ def sbtab_to_html(sbtab, filename=None, mode='sbtab_online', template = [], put_
     mode: str
         Defines the type of HTML to be generated ('sbtab_online' for the SBtab online
         interface or 'standalone' for a sole HTML page without online binding).
+    page: int
+        If given, only this page of the value rows is rendered, with links to the
+        neighbouring pages (for large tables).
+    page_size: int
+        Number of value rows per page.
 
     Returns: str
         SBtab object as HTML string.
@@ -706,12 +791,13 @@ def sbtab_to_html(sbtab, filename=None, mode='sbtab_online', template = [], put_
             return True
         except: return False
         
+    no_link = ['(',')','+','-','<=>','or','and','FbcOr','FbcAnd']
+
     def _build_main(sbtab, sbtab_def):
         '''
         builds main body of HTML, which needs to be repeated
         for SBtab Documents
         '''
-        no_link = ['(',')','+','-','<=>','or','and','FbcOr','FbcAnd']
         # get column descriptions for this table type and possible shortname links
         try: (col2description,col2link) = find_descriptions(sbtab_def, sbtab.table_type)
         except:
@@ -719,77 +805,97 @@ def sbtab_to_html(sbtab, filename=None, mode='sbtab_online', template = [], put_
             col2link = False
         
         # start main
-        html = '<table class="table-striped">'
+        html = ['<table class="table-striped">']
 
         # table name
         if show_table_name:
-            html += '<center><h2>%s</h2></center>' % (sbtab.get_attribute('TableName'))
+            html.append('<center><h2>%s</h2></center>' % (sbtab.get_attribute('TableName')))
 
         if show_table_text:
             if len(sbtab.get_attribute('Text')):
-                html += '<center><p>%s</p></center>' % (sbtab.get_attribute('Text'))
+                html.append('<center><p>%s</p></center>' % (sbtab.get_attribute('Text')))
 
         # header row
         #html += '<thead><tr><th colspan="%s">%s</th></tr></thead>' % (len(sbtab.columns), sbtab.header_row)
         if show_header_row:
-            html += '<h4>%s</h4>' % (sbtab.header_row)
+            html.append('<h4>%s</h4>' % (sbtab.header_row))
 
         # columns
-        html += '<thead>'
-        html += '<tr style="line-height:2;">'
+        html.append('<thead>')
+        html.append('<tr style="line-height:2;">')
         for col in sbtab.columns:
             try: title = col2description[col[1:]]
             except: title = ''
-            html += '<th title="%s">%s</th>' % (title, col)
-        html += '</tr>'
-        html += '</thead>'
-        html += '<tbody>'
+            html.append('<th title="%s">%s</th>' % (title, col))
+        html.append('</tr>')
+        html.append('</thead>')
+        html.append('<tbody>')
+
+        # the way a cell is rendered only depends on its column, so it is
+        # decided once per column instead of once per cell
+        renderers = [_column_renderer(col, col2link) for col in sbtab.columns]
+        id_column = sbtab.columns_dict.get('!ID')
 
         # value rows
-        for row in sbtab.value_rows:
+        (rows, navigation) = _page_window(sbtab.value_rows, page, page_size)
+        for row in rows:
             # set anchor for internal jump links
-            try: html += '<tr id="%s" style="line-height:1.5;">' % row[sbtab.columns_dict['!ID']]
-            except: html += '<tr style="line-height:1.5;">'
-            for i,col in enumerate(row):
-                # try and set internal jump links via shortnames
-                try:
-                    col2link[sbtab.columns[i]]
-                    if col2link[sbtab.columns[i]] == 'True' and col != '' and col != False:
-                        try:
-                            html += '<td>'
-                            split_column = col.split(' ')
-                            for element in split_column:
-                                if element not in no_link and not _is_float(element) and put_links:
-                                    #html += '<a href="#%s">%s</a> ' % (element, element)    #internal links
-                                    html += element
-                                else:
-                                    html += element + ' '
-                            html += '</td>'
-                        except: html += '<td>%s</td>' % (col)
-                    else:
-                        html += '<td>%s</td>' % (col)
-                except:
-                    if '!Identifiers' in sbtab.columns[i]:
-                        try:
-                            db = re.search('Identifiers:(.*)',sbtab.columns[i])
-                            url = 'http://identifiers.org/%s/%s' % (db.group(1), col)                        
-                            html += '<td><a href="%s">%s</a></td>' % (url, col)
-                        except: html += '<td>%s</td>' % (col)
-                    else:
-                        html += '<td>%s</td>' % (col)
-            html += '</tr>'
+            if id_column is not None and id_column < len(row):
+                html.append('<tr id="%s" style="line-height:1.5;">' % row[id_column])
+            else: html.append('<tr style="line-height:1.5;">')
+            for i, col in enumerate(row):
+                if i < len(renderers): html.append(renderers[i](col))
+                else: html.append('<td>%s</td>' % (col))
+            html.append('</tr>')
 
         # comment rows
         for row in sbtab.comments:
-            html += '<tr>'
+            html.append('<tr>')
             for col in row:
-                html += '<td>%s</td>' % col
-            html += '</tr>'
+                html.append('<td>%s</td>' % col)
+            html.append('</tr>')
 
         # close table
-        html += '</tbody></table>'
+        html.append('</tbody></table>')
+        html.append(navigation)
+
+        return ''.join(html)
+
+    def _column_renderer(column, col2link):
+        '''
+        returns the function that renders the cells of a column
+        '''
+        def plain(col):
+            return '<td>%s</td>' % (col)
 
-        return html
+        def shortname(col):
+            # set internal jump links via shortnames
+            if col == '' or col == False: return plain(col)
+            try:
+                cell = ['<td>']
+                for element in col.split(' '):
+                    if element not in no_link and not _is_float(element) and put_links:
+                        #html += '<a href="#%s">%s</a> ' % (element, element)    #internal links
+                        cell.append(element)
+                    else:
+                        cell.append(element + ' ')
+                cell.append('</td>')
+                return ''.join(cell)
+            except: return plain(col)
+
+        def identifier(col):
+            url = 'http://identifiers.org/%s/%s' % (db, col)
+            return '<td><a href="%s">%s</a></td>' % (url, col)
+
+        if col2link and column in col2link:
+            if col2link[column] == 'True': return shortname
+            return plain
+        if '!Identifiers' in column:
+            match = re.search('Identifiers:(.*)', column)
+            if match:
+                db = match.group(1)
+                return identifier
+        return plain
     
     ##############################################################################
     # read in header and footer from HTML template
@@ -985,10 +1091,11 @@ def tab_to_xlsx(sbtab_object):
     sbtab_object: SBtab.SBtabTable
         SBtab table object.
 
-    Returns: xlsx file object
-        SBtab table as xlsx file object.
+    Returns: bytes
+        SBtab table as xlsx file content.
     '''
     import openpyxl
+    from io import BytesIO
 
     wb = openpyxl.Workbook()
     ws = wb.active
@@ -998,32 +1105,28 @@ def tab_to_xlsx(sbtab_object):
     for row in sbtab_object.value_rows:
         ws.append(row)
 
-    wb.save('transition.xlsx')
-    
-    f = open('transition.xlsx','rb')
-    fileobject = f.read()
-    f.close()
+    # the workbook is built in memory, so that parallel requests do not
+    # share a file on disk
+    fileobject = BytesIO()
+    wb.save(fileobject)
 
-    return fileobject
+    return fileobject.getvalue()
 
 def id_checker(sbtab, sbml):
     '''
     this function checks, whether all the entries of the SBML ID columns of the SBtab file can also be
     found in the SBML file. If not, these are omitted during the balancing. But there should be a warning
-    to raise user awareness.
+    to raise user awareness. sbml is the libsbml model or its ModelSnapshot.
     '''
     sbtabid2sbmlid = []
 
-    reaction_ids_sbml = []
-    species_ids_sbml  = []
-
     s_id = None
     r_id = None
 
-    for reaction in sbml.getListOfReactions():
-        reaction_ids_sbml.append(reaction.getId())
-    for species in sbml.getListOfSpecies():
-        species_ids_sbml.append(species.getId())
+    if not isinstance(sbml, ModelSnapshot):
+        sbml = ModelSnapshot(sbml)
+    reaction_ids_sbml = sbml.reaction_index
+    species_ids_sbml = sbml.species_index
 
     for row in sbtab.value_rows:
         if len(row) < 3: continue
@@ -1069,9 +1172,10 @@ def xml_to_html(sbml_file):
     return new_sbml
 
 
-def tsv_to_html(sbtab, filename=None):
+def tsv_to_html(sbtab, filename=None, page=None, page_size=1000):
     '''
-    generates html view out of tsv file
+    generates html view out of tsv file (only one page of the rows if
+    page is given)
     '''
     sbtab_html = '''
     <html lang="en">
@@ -1129,7 +1233,7 @@ def tsv_to_html(sbtab, filename=None):
         sbtab_html += '<h2 style="padding-top:50px" align="center"><small>%s</small></h2></div></header>' % filename
         delimiter = check_delimiter(sbtab)
     else:
-        ugly_sbtab = sbtab.return_table_string().split('\n')
+        ugly_sbtab = sbtab.to_str().split('\n')
         #nice_sbtab = '<p><h2><b>'+sbtab.filename+'</b></h2></p>'
         sbtab_html += '<h2 style="padding-top:50px" align="center"><small>'+sbtab.filename+'</small></h2></div></header>'
         delimiter = sbtab.delimiter
@@ -1142,52 +1246,44 @@ def tsv_to_html(sbtab, filename=None):
     <div class="col-sm-10">
     <table class="table-striped" style="font-size:13px;background-color:#fff;padding:3px;">'''
         
+    # the declaration and column header rows are kept on every page
+    (window, navigation) = _page_window(range(len(ugly_sbtab)), page, page_size)
+    html = [sbtab_html]
     first = True
     for i, row in enumerate(ugly_sbtab):
         # declaration of first SBtab in document
         if row.startswith('!!') and first:
-            sbtab_html += '<tr><th colspan="%s" style="padding:3px;">%s</th></tr>' % (len(ugly_sbtab[i+2]), row)
+            html.append('<tr><th colspan="%s" style="padding:3px;">%s</th></tr>' % (len(ugly_sbtab[i+2]), row))
             first = False
 
         # conclusion of SBtab and beginning of new SBtab (if there are more than one)
         elif row.startswith('!!'):
-            sbtab_html += '</table><br><table class="table-striped" style="font-size:13px;background-color:#fff;">'
-            sbtab_html += '<tr><th colspan="%s" style="padding:3px;">%s</th></tr>' % (len(ugly_sbtab[i+2]), row)
+            html.append('</table><br><table class="table-striped" style="font-size:13px;background-color:#fff;">')
+            html.append('<tr><th colspan="%s" style="padding:3px;">%s</th></tr>' % (len(ugly_sbtab[i+2]), row))
 
         # column header row
         elif row.startswith('!'):
-            splitrow = row.split(delimiter)
-            sbtab_html += '<tr>'
-            for col in splitrow:
-                sbtab_html += '<th style="padding:3px;">%s</th>' % col
-            sbtab_html += '</tr>'
+            html.append('<tr><th style="padding:3px;">' + '</th><th style="padding:3px;">'.join(row.split(delimiter)) + '</th></tr>')
+
+        # rows outside of the requested page
+        elif i not in window: continue
 
         # comment row
         elif row.startswith('%'):
-            sbtab_html += '<tr bgcolor="#C0C0C0">%s</tr>' % row
+            html.append('<tr bgcolor="#C0C0C0">%s</tr>' % row)
 
         # log file header
         elif row.startswith('Parameter balancing log file'):
-            sbtab_html += '<tr>%s</tr>'
+            html.append('<tr>%s</tr>')
 
         # normal row
         else:
-            splitrow = row.split(delimiter)
-            sbtab_html += '<tr>'
-            for col in splitrow:
-                sbtab_html += '<td style="padding:3px;">%s</td>' % col
-            sbtab_html += '</tr>'
+            html.append('<tr><td style="padding:3px;">' + '</td><td style="padding:3px;">'.join(row.split(delimiter)) + '</td></tr>')
 
-        '''
-        # normal row
-        for i,thing in enumerate(row.split(delimiter)):
-            if thing.startswith('!!'): continue
-            #new_row = '<td>'+str(thing)+'</td>'
-            #nice_sbtab += new_row
-        #nice_sbtab += '</tr>'
-        '''
+    html.append('\n    </table>')
+    html.append(navigation)
+    sbtab_html = ''.join(html)
     sbtab_html += '''
-    </table>
     </div>
     <div class="col-sm-1"></div>
     </div>
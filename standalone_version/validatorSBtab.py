@@ -15,6 +15,7 @@ except:
     import misc
 import re
 import collections
+import hashlib
 import sys
 import os
 
@@ -30,11 +31,158 @@ class SBtabError(Exception):
         return self.message
 
 
+def _is_float(entry):
+    try:
+        float(entry)
+        return True
+    except ValueError:
+        return False
+
+boolean_values = frozenset(['True', 'False', 'TRUE', 'FALSE', '0', '1'])
+sign_values = frozenset(['+', '-', '0'])
+
+# validators for the column formats of the definition table; columns with
+# other formats (e.g. string) are not checked
+format2validator = {'Boolean': boolean_values.__contains__,
+                    'float': _is_float,
+                    '{+,-,0}': sign_values.__contains__}
+# spellings of these formats in the definitions file
+format_aliases = {'Float': 'float', "Enum('+','-','0')": '{+,-,0}'}
+
+# most float notations are matched by this pattern; the (rare) others are
+# double-checked with float() in the column-wise validation
+float_pattern = re.compile(r'\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*$')
+format2values = {'Boolean': boolean_values, '{+,-,0}': sign_values}
+
+
+def column_failures(req_format, column):
+    '''
+    Checks a whole column against a format.
+
+    Parameters
+    ----------
+    req_format: str
+        Column format of the definition table (Boolean, float or {+,-,0}).
+    column: list
+        Column entries as strings; empty entries are not checked.
+
+    Returns: list
+        Indices of the entries that do not conform with the format.
+    '''
+    if req_format != 'float':
+        # membership test against the set of allowed values
+        allowed = format2values[req_format]
+        if set(column) <= allowed | {''}: return []
+        return [i for i, entry in enumerate(column)
+                if entry and entry not in allowed]
+    # fast path: the whole column converts at once
+    try:
+        collections.deque(map(float, filter(None, column)), maxlen=0)
+        return []
+    except ValueError: pass
+    match = float_pattern.match
+    return [i for i, entry in enumerate(column)
+            if entry and not match(entry) and not _is_float(entry)]
+
+
+# compiled schemas by definitions content (None for the default definitions)
+_schema_cache = {}
+
+
+class ValidationSchema:
+    '''
+    Compiled SBtab definition table: sets of table types and columns and the
+    per-column format validators, built once and shared by all validations.
+    '''
+    def __init__(self, sbtab_def):
+        '''
+        Parameters
+        ----------
+        sbtab_def: SBtab.SBtabTable
+            SBtab definition table as SBtab table object.
+        '''
+        self.sbtab_def = sbtab_def
+        self.definitions = sbtab_def.create_list()
+        self.allowed_table_types = set()
+        self.allowed_columns = {}
+        self.column2format = {}
+        format_column = sbtab_def.columns_dict.get('!Format', 3)
+        for row in self.definitions[2]:
+            self.allowed_table_types.add(row[2])
+            self.allowed_columns.setdefault(row[2], set()).add(row[0])
+            try: req_format = row[format_column]
+            except IndexError: req_format = ''
+            req_format = format_aliases.get(req_format, req_format)
+            self.column2format.setdefault(row[2], {})[row[0]] = req_format
+        self._validators = {}
+
+    def column_validators(self, table_type, columns):
+        '''
+        Returns the validators for the columns of a table.
+
+        Parameters
+        ----------
+        table_type: str
+            TableType of the table.
+        columns: list
+            Column names of the table (with exclamation marks).
+
+        Returns: list
+            List of (column index, column name, format, validator) for all
+            columns whose format can be checked.
+        '''
+        key = (table_type, tuple(columns))
+        if key not in self._validators:
+            column2format = self.column2format.get(table_type, {})
+            validators = []
+            for i, column in enumerate(columns):
+                name = column[1:]
+                if name.startswith('Identifier'): continue
+                req_format = column2format.get(name)
+                if req_format in format2validator:
+                    validators.append((i, name, req_format,
+                                       format2validator[req_format]))
+            self._validators[key] = validators
+        return self._validators[key]
+
+
+def get_schema(def_table=None):
+    '''
+    Returns the compiled schema of a definition table from the cache or
+    compiles it.
+
+    Parameters
+    ----------
+    def_table: SBtab.SBtabTable
+        SBtab definition table as SBtab table object; if None, the default
+        definitions file is used.
+
+    Returns: ValidationSchema
+        Compiled definition table.
+    '''
+    if def_table:
+        content = '\n'.join('\t'.join(row) for row in def_table.value_rows)
+        key = hashlib.sha1(content.encode('utf-8')).hexdigest()
+    else:
+        key = None
+    if key not in _schema_cache:
+        if def_table:
+            _schema_cache[key] = ValidationSchema(def_table)
+        else:
+            sbtab_def = misc.open_definitions_file()
+            if not sbtab_def:
+                raise SBtabError('The default definition file could not be '\
+                                 'loaded.')
+            _schema_cache[key] = ValidationSchema(sbtab_def)
+    return _schema_cache[key]
+
+
 class ValidateTable:
     '''
     Validates SBtabTable object.
     '''
-    def __init__(self, sbtab, def_table=None):
+    def __init__(self, sbtab, def_table=None, schema=None, mode='cell',
+                 max_examples=5):
         '''
         Initialises validator and starts check for file and table format.
 
@@ -44,34 +192,39 @@ class ValidateTable:
             SBtab data file as SBtab table object.
         def_table: SBtab.SBtabTable
             SBtab definition table as SBtab table object.
+        schema: ValidationSchema
+            Compiled definition table; if None, it is taken from the cache
+            (see get_schema).
+        mode: str
+            'cell' reports every entry that does not conform with its column
+            format; 'column' checks whole columns at once and reports one
+            aggregated warning per column (see self.findings).
+        max_examples: int
+            Number of offending rows that are listed per column in the
+            column mode.
         '''
         # initialize warning string
         self.warnings = []
+        self.findings = []
+        self.mode = mode
+        self.max_examples = max_examples
         # define self variables
         self.sbtab = sbtab
         try: self.filename = sbtab.filename
         except: raise SBtabError('The SBtab object cannot be validated. Please set the filename first and try again.')
 
-        # read definition table
-        self.read_definition(def_table)
-
-        # create set of valid table types
-        self.allowed_table_types = list(set([row[2] for row in self.definitions[2:][0]]))
-
-        # create dict of valid column names per table type
-        self.allowed_columns = {}
-        for table_type in self.allowed_table_types:
-            self.allowed_columns[table_type] = [row[0] for row in self.definitions[2:][0] if row[2] == table_type]
+        # read (compiled) definition table
+        if schema: self.schema = schema
+        else: self.read_definition(def_table)
+        self.sbtab_def = self.schema.sbtab_def
+        self.definitions = self.schema.definitions
+        self.allowed_table_types = self.schema.allowed_table_types
+        self.allowed_columns = self.schema.allowed_columns
 
         # check file format and header row
         try: self.check_general_format()
         except: raise SBtabError('The SBtab object cannot be validated. Please add content to it first and try again.')
-        self.column2format = {}
-        defs = self.definitions[2]
-
-        for row in defs:
-            if row[2] == self.sbtab.table_type:
-                self.column2format[row[0]] = row[3]
+        self.column2format = self.schema.column2format.get(self.sbtab.table_type, {})
 
         # remove empty column headers
         columns = []
@@ -91,16 +244,14 @@ class ValidateTable:
         # read in provided definition table or open default
         if def_table:
             try:
-                self.sbtab_def = def_table
-                self.definitions = self.sbtab_def.create_list()
+                self.schema = get_schema(def_table)
             except:
                 print('Provided definition file could not be read, so the validation'\
                       'could not be started.')
                 sys.exit() 
         else:
             try:
-                self.sbtab_def = misc.open_definitions_file()
-                self.definitions = self.sbtab_def.create_list()
+                self.schema = get_schema()
             except:
                 print('''Definition file could not be loaded, so the validation
                 could not be started. Please provide definition file
@@ -172,24 +323,24 @@ class ValidateTable:
         # 2nd: very important: check if the identifiers start with a digit;
         # this is not allowed in SBML!
         # also check if the identifiers are unique throughout the table
-        unique = []
+        unique = set()
         for row in self.sbtab.value_rows:
+            # the column-wise mode aggregates these checks (see below)
+            if self.mode == 'column': break
             try: identifier = row[self.sbtab.columns_dict['!ID']]
             except: break
             
-            if identifier not in unique: unique.append(identifier)
+            if identifier not in unique: unique.add(identifier)
             else:
                 warning = 'Warning: There is an identifier that is not unique'\
                           '. Please change that: %s' % identifier
                 self.warnings.append(warning)
 
-            try:
-                int(identifier[0])
+            if identifier[:1].isdecimal():
                 self.warnings.append('Warning: There is an identifier that st'\
                                      'arts with a digit; this is not permitte'\
                                      'd for the SBML conversion:'\
                                      '%s' % (identifier))
-            except: pass
 
         # if the SBtab is TableType="Reaction", check if there is at least a
         # SumFormula or an identifier column to characterise the reaction
@@ -214,8 +365,9 @@ class ValidateTable:
                 self.warnings.append(warning)
 
         # 3rd: check the validity of the given column names
+        allowed_columns = self.allowed_columns[self.sbtab.table_type]
         for column in self.sbtab.columns:
-            if column.replace('!', '') not in self.allowed_columns[self.sbtab.table_type] \
+            if column.replace('!', '') not in allowed_columns \
                and ('Identifiers:') not in column \
                and ('ID:urn.') not in column:
                 self.warnings.append('Warning: The SBtab file has an unknown '\
@@ -223,52 +375,36 @@ class ValidateTable:
                                      'column types!' % (column))
 
         # 4th: check the length of the different rows
+        id_column = self.sbtab.columns_dict.get('!ID')
+        formula_column = self.sbtab.columns_dict.get('!ReactionFormula')
+        validators = self.schema.column_validators(self.sbtab.table_type,
+                                                   self.sbtab.columns)
+        if self.mode == 'column':
+            self.check_column_formats(validators, id_column, formula_column)
+
         for row in self.sbtab.value_rows:
+            if self.mode == 'column': break
             # check the rows for entries starting with + or -
-            if '!ID' in self.sbtab.columns_dict:
-                if str(row[self.sbtab.columns_dict['!ID']]).startswith('+') \
-                   or str(row[self.sbtab.columns_dict['!ID']]).startswith('-'):
+            if id_column is not None:
+                if str(row[id_column]).startswith(('+', '-')):
                     self.warnings.append('Warning: An identifier for a data r'\
                                          'ow must not begin with "+" or "-": '\
                                          '\n%s''' % (row))
-            if '!ReactionFormula' in self.sbtab.columns_dict:
-                if '<=>' not in row[self.sbtab.columns_dict['!ReactionFormula']]:
+            if formula_column is not None:
+                if '<=>' not in row[formula_column]:
                     warning = 'There is a sum formula that does not adhere to'\
                               ' the sum formula syntax from the SBtab specifi'\
-                              'cation: %s' % (str(row[self.sbtab.columns_dict['!ReactionFormula']]))
+                              'cation: %s' % (str(row[formula_column]))
                     self.warnings.append(warning)
 
-            for i, entry in enumerate(row):
-                if entry == '': continue
-                if self.sbtab.columns[i][1:].startswith('Identifier'):
-                    req_format = 'string'
-                else:
-                    try:
-                        req_format = self.column2format[self.sbtab.columns[i][1:]]
-                    except: continue
-                if req_format == 'Boolean':
-                    if entry != 'True' and entry != 'False' and entry != 'TRUE' \
-                       and entry != 'FALSE' and entry != '0' and entry != '1':
-                        warning = 'Warning: The column %s holds a value that '\
-                                  'does not conform with the assigned column '\
-                                  'format %s: %s' % (self.sbtab.columns[i][1:],
-                                                     req_format, entry)
-                        self.warnings.append(warning)
-                elif req_format == 'float':
-                    try: float(entry)
-                    except:
-                        warning = 'Warning: The column %s holds a value that '\
-                                  'does not conform with the assigned column '\
-                                  'format %s: %s' % (self.sbtab.columns[i][1:],
-                                                     req_format, entry)
-                        self.warnings.append(warning)
-                elif req_format == '{+,-,0}':
-                    if entry != '+' and entry != '-' and entry != '0':
-                        warning = 'Warning: The column %s holds a value that '\
-                                  'does not conform with the assigned column '\
-                                  'format %s: %s' % (self.sbtab.columns[i][1:],
-                                                     req_format, entry)
-                        self.warnings.append(warning)
+            for (i, name, req_format, validator) in validators:
+                try: entry = row[i]
+                except IndexError: continue
+                if entry == '' or validator(entry): continue
+                warning = 'Warning: The column %s holds a value that '\
+                          'does not conform with the assigned column '\
+                          'format %s: %s' % (name, req_format, entry)
+                self.warnings.append(warning)
 
         # 5th: are there duplicate columns?
         for column in collections.Counter(self.sbtab.columns).items():
@@ -277,7 +413,75 @@ class ValidateTable:
                                      n this SBtab file. Please remove it:
                                      %s''' % (str(column[0])))
 
-                
+
+    def check_column_formats(self, validators, id_column=None,
+                             formula_column=None):
+        '''
+        Validates the table column-wise and adds one finding and one warning
+        per column and problem: column formats, identifiers starting with
+        + or -, and reaction formulas without <=>.
+
+        Parameters
+        ----------
+        validators: list
+            Column validators as returned by ValidationSchema.column_validators.
+        id_column: int
+            Index of the !ID column (if any).
+        formula_column: int
+            Index of the !ReactionFormula column (if any).
+        '''
+        value_rows = self.sbtab.value_rows
+
+        def get_column(i):
+            try: return [row[i] for row in value_rows]
+            except IndexError:
+                return [row[i] if i < len(row) else '' for row in value_rows]
+
+        if id_column is not None:
+            column = get_column(id_column)
+            seen = set()
+            duplicates, digits, signs = [], [], []
+            for j, entry in enumerate(column):
+                if entry in seen: duplicates.append(j)
+                else: seen.add(entry)
+                first = entry[:1]
+                if first.isdecimal(): digits.append(j)
+                elif first in ('+', '-'): signs.append(j)
+            self._add_finding('ID', 'unique identifiers', column, duplicates)
+            self._add_finding('ID', 'identifier must not start with a digit',
+                              column, digits)
+            self._add_finding('ID', 'identifier must not begin with "+" or '\
+                              '"-"', column, signs)
+        if formula_column is not None:
+            column = get_column(formula_column)
+            failures = [j for j, entry in enumerate(column)
+                        if '<=>' not in entry]
+            self._add_finding('ReactionFormula', 'sum formula with <=>',
+                              column, failures)
+        for (i, name, req_format, validator) in validators:
+            column = get_column(i)
+            self._add_finding(name, req_format, column,
+                              column_failures(req_format, column))
+
+    def _add_finding(self, name, req_format, column, failures):
+        '''
+        Registers the offending entries of a column as one finding/warning.
+        '''
+        if not failures: return
+        finding = {'column': name,
+                   'format': req_format,
+                   'count': len(failures),
+                   'rows': [f + 1 for f in failures[:self.max_examples]],
+                   'values': [column[f] for f in failures[:self.max_examples]]}
+        self.findings.append(finding)
+        examples = ', '.join('%s (%s)' % (row, value) for row, value
+                             in zip(finding['rows'], finding['values']))
+        if finding['count'] > self.max_examples: examples += ', ...'
+        self.warnings.append('Warning: The column %s holds %s value(s) '\
+                             'that do not conform with the assigned column'\
+                             ' format %s; rows: %s' % (name, finding['count'],
+                                                      req_format, examples))
+
     def return_output(self):
         '''
         Returns the warnings from the validation process.
@@ -288,6 +492,89 @@ class ValidateTable:
         return self.warnings
 
 
+def _validate_table(sbtab, schema, mode='cell', max_examples=5):
+    '''
+    validates one SBtab table against a compiled schema and returns a
+    report of the warnings and findings (module level, so that it can be
+    run on a process pool)
+    '''
+    validator = ValidateTable(sbtab, schema=schema, mode=mode,
+                              max_examples=max_examples)
+    return {'file': sbtab.filename,
+            'table_id': sbtab.table_id,
+            'table_type': sbtab.table_type,
+            'warnings': validator.return_output(),
+            'findings': validator.findings}
+
+
+def _validate_file(filename, schema, mode='cell', max_examples=5):
+    '''
+    reads an SBtab file and validates all of its tables; problems with
+    reading the file are reported in the 'error' field
+    '''
+    report = {'file': filename, 'tables': [], 'error': None}
+    try:
+        sbtab_doc = SBtab.read_csv(filename, os.path.basename(filename),
+                                   xlsx=filename.endswith('.xlsx'))
+        for sbtab in sbtab_doc.sbtabs:
+            report['tables'].append(_validate_table(sbtab, schema, mode,
+                                                    max_examples))
+    except Exception as e:
+        report['error'] = str(e)
+    return report
+
+
+def _pool_map(function, items, workers=None, executor='thread'):
+    '''
+    maps the function over the items, on a thread or process pool if more
+    than one worker is requested; the order of the items is kept
+    '''
+    if not workers or workers < 2 or len(items) < 2:
+        return [function(*item) for item in items]
+    import concurrent.futures
+    if executor == 'process':
+        pool_class = concurrent.futures.ProcessPoolExecutor
+    else:
+        pool_class = concurrent.futures.ThreadPoolExecutor
+    with pool_class(max_workers=workers) as pool:
+        return list(pool.map(function, *zip(*items)))
+
+
+def validate_files(filenames, def_table=None, workers=None,
+                   executor='process', mode='cell', max_examples=5):
+    '''
+    Validates many SBtab files with one compiled definition table.
+
+    Parameters
+    ----------
+    filenames: list
+        Paths of the SBtab files (tsv, csv or xlsx).
+    def_table: SBtab.SBtabTable
+        SBtab definition table as SBtab table object (default definitions
+        if None).
+    workers: int
+        Number of parallel workers (sequential if None).
+    executor: str
+        'process' or 'thread' pool.
+    mode: str
+        Validation mode of the tables ('cell' or 'column').
+    max_examples: int
+        Number of offending rows that are listed per column in the
+        column mode.
+
+    Returns: dict
+        Merged report with one entry per file and the total numbers of
+        warnings and of files that could not be validated.
+    '''
+    schema = get_schema(def_table)
+    items = [(filename, schema, mode, max_examples) for filename in filenames]
+    reports = _pool_map(_validate_file, items, workers, executor)
+    return {'files': reports,
+            'warnings': sum(len(table['warnings']) for report in reports
+                            for table in report['tables']),
+            'errors': sum(1 for report in reports if report['error'])}
+
+
 class ValidateDocument:
     '''
     Validates SBtabDocument object
@@ -308,25 +595,72 @@ class ValidateDocument:
         if len(self.sbtab_doc.sbtabs) == 0:
             raise SBtabError('This SBtab Document cannot be validated. It is empty.')
         self.sbtab_def = def_table
+        try: self.schema = get_schema(def_table)
+        except: raise SBtabError('The definition file could not be read, so the validation could not be started.')
+        self.reports = []
         # self.validate_document()
 
-    def validate_document(self):
+    def validate_document(self, workers=None, executor='thread', mode='cell'):
         '''
-        Validates SBtabDocument.
+        Validates SBtabDocument; all tables share the compiled definition
+        table.
+
+        Parameters
+        ----------
+        workers: int
+            Number of tables that are validated in parallel (sequential if
+            None).
+        executor: str
+            'thread' or 'process' pool.
+        mode: str
+            Validation mode of the tables ('cell' or 'column').
 
         Returns: list
             List of lists with warnings for each of the SBtab tables comprised in the SBtab document.
         '''
+        items = [(sbtab, self.schema, mode) for sbtab in self.sbtab_doc.sbtabs]
+        try: self.reports = _pool_map(_validate_table, items, workers, executor)
+        except SBtabError: raise
+        except Exception as e:
+            raise SBtabError('SBtab document cannot be validated: %s' % e)
+
         warnings = []
-        for sbtab in self.sbtab_doc.sbtabs:
-            warnings_s = ['Warnings for %s:\n' % sbtab.filename]
-            self.vt = ValidateTable(sbtab, self.sbtab_def)
-            try:
-                warnings_s.append(self.vt.return_output())
-            except:
-                raise SBtabError('SBtab %s cannot be validated.' % (sbtab.filename))
-            warnings.append(warnings_s)
-            
+        for report in self.reports:
+            warnings.append(['Warnings for %s:\n' % report['file'],
+                             report['warnings']])
         return warnings
 
 
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('files', nargs='+', help='Path(s) to SBtab file(s) (tsv, csv or xlsx).')
+    parser.add_argument('-d', '--definitions', help='Path to a custom definitions file.')
+    parser.add_argument('-w', '--workers', type=int, help='Number of parallel workers.')
+    parser.add_argument('-e', '--executor', choices=['process', 'thread'], default='process', help='Type of the worker pool.')
+    parser.add_argument('-m', '--mode', choices=['cell', 'column'], default='column', help='Report every invalid entry or aggregate them per column.')
+    parser.add_argument('-o', '--output', help='Path of the JSON report (default: standard output).')
+
+    args = parser.parse_args()
+
+    def_table = None
+    if args.definitions:
+        def_table = misc.open_definitions_file(args.definitions)
+        if not def_table:
+            print('The definitions file %s could not be read.' % args.definitions)
+            sys.exit(1)
+
+    report = validate_files(args.files, def_table, args.workers,
+                            args.executor, args.mode)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print('Validated %s file(s): %s warning(s), %s file(s) could not be '\
+              'validated.' % (len(args.files), report['warnings'],
+                              report['errors']))
+    else:
+        print(json.dumps(report, indent=2))
+    if report['errors']: sys.exit(1)
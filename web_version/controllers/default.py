@@ -10,12 +10,23 @@
 import libsbml
 import misc
 import copy
+import os
 import balancer
 import kineticizer
 import SBtab
 import validatorSBtab
 import sbtab2sbml
 import sbml2sbtab
+import result_cache
+import balancing_jobs
+import blob_store
+import downloads
+
+# balancing results by content hash of their inputs (see result_cache)
+result_cache_dir = os.path.join(request.folder, 'cache', 'results')
+# the session only holds the keys of the uploaded files and results; the
+# files themselves are kept in the blob store (see blob_store)
+blobs = blob_store.BlobStore(os.path.join(request.folder, 'cache', 'blobs'))
 
 
 def index():
@@ -31,6 +42,15 @@ def clearsession():
     the session. It basically just resets all session variables to empty,
     False, or None, depending on the type.
     '''
+    reset_session()
+    redirect('http://www.parameterbalancing.net')
+
+
+def reset_session(warning=None):
+    '''
+    resets all session variables to empty, False, or None, depending on the
+    type; the warning is shown on the upload page
+    '''
     session.warnings_sbml = []
     session.warnings_sbtab = []
     session.warnings_prior = []
@@ -60,7 +80,38 @@ def clearsession():
     session.config_file = None
     session.config_filename = None
     session.parameter_dict = {}
-    redirect('http://www.parameterbalancing.net')
+    session.job = None
+    if warning: session.warnings_sbml.append(warning)
+
+
+def get_blob(key):
+    '''
+    returns an uploaded file or result of the session from the blob store.
+    blobs that have not been used for a day are evicted (see
+    cron/evict_blobs.py); then the session has expired, so it is reset and
+    the user is sent back to the upload page
+    '''
+    try: return blobs.get(key)
+    except KeyError:
+        reset_session('Your session has expired. Please upload your files '
+                      'again.')
+        try: redirect(URL('../default/balancing'))
+        except: redirect(URL('../balancing'))
+
+
+def restore_result(cached, model_name, parameters_name, bundle_name):
+    '''
+    puts a cached balancing result (see result_cache) into the session
+    '''
+    session.log = blobs.put(cached['log'])
+    session.result_sbml = [blobs.put(cached['sbml'])]
+    session.result_sbml_name = [model_name]
+    sbtab_final = SBtab.SBtabTable(cached['sbtab'], cached['sbtab_filename'])
+    session.result_sbtab = [blobs.put(sbtab_final)]
+    session.result_sbtab_name = [parameters_name]
+    if cached['sbtab_all'] is not None:
+        session.result_sbtab.append(blobs.put(cached['sbtab_all']))
+        session.result_sbtab_name.append(bundle_name)
 
 
 def balancing():
@@ -105,11 +156,12 @@ def balancing():
                                              'model with the .xml extension'
                                              '.' % (filename))
             else:
-                session.sbml = request.vars.File.value.decode('utf-8')
+                sbml_string = request.vars.File.value.decode('utf-8')
+                session.sbml = blobs.put(sbml_string)
                 session.sbml_name = filename
                 session.sbmls.append(session.sbml)
                 session.sbml_names.append(filename)
-                size_warning = misc.size_warning(session.sbml)
+                size_warning = misc.size_warning(sbml_string)
                 if size_warning:
                     session.warnings_sbml.append(size_warning)
         except:
@@ -141,6 +193,7 @@ def balancing():
                                           'remove the file with the same name '
                                           'before uploading.')
         sbtab_file = request.vars.File.value
+        sbml_string = get_blob(session.sbml)
         try:
             sbtab_data = SBtab.SBtabTable(sbtab_file.decode('utf-8'), filename)
             if sbtab_data.table_type != 'Quantity':
@@ -157,15 +210,15 @@ def balancing():
                                               'with the .tsv extension.')
             else:
                 try:
-                    session.sbtab = sbtab_data
+                    session.sbtab = blobs.put(sbtab_data)
                     session.sbtab_name = sbtab_data.filename
-                    session.sbtabs.append(sbtab_data)
+                    session.sbtabs.append(session.sbtab)
                     session.sbtab_names.append(sbtab_data.filename)
                     # upon upload we check whether the SBtab file holds any IDs
                     # which cannot be found in the SBML file
-                    if session.sbml:
+                    if sbml_string:
                         reader = libsbml.SBMLReader()
-                        sbml = reader.readSBMLFromString(session.sbml)
+                        sbml = reader.readSBMLFromString(sbml_string)
                         sbml_model = sbml.getModel()
                         sbtabid2sbmlid = misc.id_checker(sbtab_data,
                                                          sbml_model)
@@ -266,7 +319,7 @@ def balancing():
                     validity = misc.valid_prior(sbtab_prior)
                     for warning in validity:
                         session.warnings_prior.append(warning)
-                    session.priors.append(sbtab_prior)
+                    session.priors.append(blobs.put(sbtab_prior))
                     session.prior_names.append(sbtab_prior.filename)
                 except:
                     session.warnings_prior.append('Error: The prior file is no'
@@ -308,7 +361,7 @@ def balancing():
                                                'SBtab file with the .tsv exten'
                                                'sion.' % (filename))
             else:
-                session.config_file = sbtab_config
+                session.config_file = blobs.put(sbtab_config)
                 session.config_filename = sbtab_config.filename
                 try:
                     def_file_open = open('./applications/pb/static/files/defau'
@@ -377,7 +430,7 @@ def balancing():
                               '_prior.tsv')
             prior_file = prior_open.read()
             sbtab_prior = SBtab.SBtabTable(prior_file, 'pb_prior.tsv')
-            session.prior = sbtab_prior
+            session.prior = blobs.put(sbtab_prior)
             session.prior_name = 'pb_prior.tsv'
             session.priors.append(session.prior)
             session.prior_names.append(session.prior_name)
@@ -395,7 +448,7 @@ def balancing():
                                            ' remove the file with the same nam'
                                            'e before uploading.')
             elif valid_extension:
-                session.sbtab_fls.append(sbtab_file.decode('utf-8'))
+                session.sbtab_fls.append(blobs.put(sbtab_file.decode('utf-8')))
                 session.sbtab_fl_names.append(sbtab_fl.filename)
         except:
             session.warnings_fl.append('Error: The file %s is not compliant wi'
@@ -469,18 +522,18 @@ def balancing():
                               '_prior.tsv')
             prior_file = prior_open.read()
             sbtab_prior = SBtab.SBtabTable(prior_file, 'pb_prior.tsv')
-            session.prior = sbtab_prior
+            session.prior = blobs.put(sbtab_prior)
             session.prior_name = 'pb_prior.tsv'
             session.priors.append(session.prior)
             session.prior_names.append(session.prior_name)
 
         # get SBML
-        sbml_file = session.sbml
+        sbml_file = get_blob(session.sbml)
         sbml_filename = session.sbml_name
         # get SBtab or produce empty SBtab
         if 'sbtab' in session:
             if session.sbtab is not None:
-                sbtab_file = session.sbtab
+                sbtab_file = get_blob(session.sbtab)
                 sbtab_filename = session.sbtab_name
                 session.emptysbtab = False
             else: session.emptysbtab = True
@@ -489,7 +542,7 @@ def balancing():
         # get prior file or open default
         if 'prior' in session:
             if session.prior is not None:
-                sbtab_prior = session.prior
+                sbtab_prior = get_blob(session.prior)
                 prior_filename = session.prior_name
                 emptyprior = False
             else: emptyprior = True
@@ -501,7 +554,7 @@ def balancing():
                                   's/pb_prior.tsv')
                 prior_file = prior_open.read()
                 sbtab_prior = SBtab.SBtabTable(prior_file, 'pb_prior.tsv')
-                session.prior = sbtab_prior
+                session.prior = blobs.put(sbtab_prior)
                 session.prior_name = sbtab_prior.filename
                 session.priors.append(session.prior)
                 session.prior_names.append(session.prior_name)
@@ -513,7 +566,7 @@ def balancing():
         # get config file if provided
         if 'config' in session:
             if session.config is not None:
-                sbtab_config = session.config_file
+                sbtab_config = get_blob(session.config_file)
                 config_filename = session.config_filename
                 if sbtab_config.table_type != 'Config':
                     session.warnings_config.append('Error: The SBtab file has '
@@ -568,173 +621,81 @@ def balancing():
             try: redirect(URL('../default/balancing'))
             except: redirect(URL('../balancing'))
 
-        # 2: makeSBtab (either from an empty SBtab or from a given SBtab)
-        if session.emptysbtab:
-            try:
-                reader = libsbml.SBMLReader()
-                sbml = reader.readSBMLFromString(sbml_file)
-                sbml_model = sbml.getModel()
-                pb = balancer.ParameterBalancing(sbml_model)
-                sbtab_data = pb.make_empty_sbtab(pmin, pmax,
-                                                    session.parameter_dict)
-            except:
-                session.warnings_sbml.append('Error: The SBML file %s could no'
-                                             't be processed properly'
-                                             '.' % (sbml_filename))
-                try: redirect(URL('../default/balancing'))
-                except: redirect(URL('../balancing'))
-        else:
-            try:
-                reader = libsbml.SBMLReader()
-                sbml = reader.readSBMLFromString(sbml_file)
-                sbml_model = sbml.getModel()
-                pb = balancer.ParameterBalancing(sbml_model)
-                sbtab_data = pb.make_sbtab(sbtab_file, sbtab_file.filename,
-                                           'All organisms', 43,
-                                           pmin, pmax, session.parameter_dict)
-            except:
-                session.warnings_sbml.append('Error: The SBML file %s could no'
-                                             't be processed properly'
-                                             '.' % (sbml_filename))
-                session.warnings_sbtab.append('Error: The SBtab file %s could no'
-                                             't be processed properly'
-                                             '.' % (sbtab_filename))
-                try: redirect(URL('../default/balancing'))
-                except: redirect(URL('../balancing'))
-
-        # 2b: update prior information for model if alternate prior is used
-        try:
-            pb.get_parameter_information(sbtab_prior)
-        except:
-            session.warnings_prior.append('The alternate prior could not'
-                                          ' be loaded.')
-                       
-        # 3: fill them in the SBtab file
-        try:
-            if 'use_pseudo_values' in session.parameter_dict and \
-               session.parameter_dict['use_pseudo_values'] == 'True':
-                sbtab_old = copy.deepcopy(sbtab_data)
-                sbtab_new = pb.fill_sbtab(sbtab_old, pseudos, priors)
-                pseudo_flag = 'pseudos'
-            else:
-                sbtab_new = pb.fill_sbtab(sbtab_data)
-                pseudo_flag = 'no_pseudos'
-        except:
-                session.warnings_sbtab.append('Error: The SBtab data could not'
-                                              'be processed correctly.')
-                try: redirect(URL('../default/balancing'))
-                except: redirect(URL('../balancing'))
-
-        # 4: construct parameter dictionary
-        if 'temperature' not in session.parameter_dict.keys():
-            session.parameter_dict['temperature'] = 300
-        if 'ph' not in session.parameter_dict.keys():
-            session.parameter_dict['ph'] = 7
-
-        types = ['standard chemical potential',
-                 'catalytic rate constant geometric mean', 'Michaelis constant',
-                 'activation constant', 'inhibitory constant', 'concentration',
-                 'concentration of enzyme', 'equilibrium constant',
-                 'substrate catalytic rate constant',
-                 'forward maximal velocity', 'product catalytic rate constant',
-                 'reverse maximal velocity', 'chemical potential',
-                 'reaction affinity']
-
-        for typ in types:
-            session.parameter_dict[typ] = True
-
-        # 5: BALANCE PARAMETERS
-        try:
-            (sbtab_final, mean_vector, mean_vector_inc, c_post,
-                c_post_inc, r_matrix, shannon,
-                log, concat) = pb.make_balancing(sbtab_new, sbtab_data,
-                                        pmin, pmax, session.parameter_dict)
-            session.log = log
-        except:
-            session.warnings_sbml.append('Error: The balancing process was err'
-                                         'oneous. Please check your input file'
-                                         's for validity.')
-            try: redirect(URL('../default/balancing'))
-            except: redirect(URL('../balancing'))
-
-        # 7: fill the model with the parameters and the kinetics
-        try: param = session.parameter_dict['parametrisation']
-        except: param = 'hal'
-        try: prefac = session.parameter_dict['enzyme_prefactor']
-        except: prefac = True
-        try: inh = session.parameter_dict['default_inh']
-        except: inh = 'complete_inh'
-        try: act = session.parameter_dict['default_act']
-        except: act = 'complete_act'
-        try: overwrite = session.parameter_dict['overwrite_kinetics']
-        except: overwrite = True
-
-        try:
-            kineticizer_cs = kineticizer.KineticizerCS(sbml_model, sbtab_final,
-                                                       param, prefac, inh, act,
-                                                       overwrite)
-        except:
-            session.warnings_sbtab.append('Error: The parameters and kinetics '
-                                          'could not be written to the output '
-                                          'model.')
-            try: redirect(URL('../default/balancing'))
-            except: redirect(URL('../balancing'))
-
-        # 8: post production of SBtab and SBML formats
-        # 8.1: SBML
-        try:
-            ### model_name
-            model_name = str(sbml_filename)[:-4] + '_balanced_model.xml'
-            sbml_code = '<?xml version="1.0" encoding="UTF-8"?>\n' + \
-                        sbml_model.toSBML()
-            session.result_sbml = [sbml_code]
-            session.result_sbml_name = [model_name]
-        except:
-            session.warnings_sbml.append('Error: The new SBML model could not '
-                                         'be produced.')
-            try: redirect(URL('../default/balancing'))
-            except: redirect(URL('../balancing'))
-
-        # 8.2: SBtab
-        #try:
-        sbtab_file_new = open(sbtab_final.filename + '.tsv', 'w')
-        sbtab_file_new.write(sbtab_final.to_str())
-        sbtab_file_new.close()
-        session.result_sbtab = [sbtab_final]
-        session.result_sbtab_name = [sbtab_final.filename[:-4] + \
-                                        '_balanced_parameters.tsv']
-        #except:
-        #    session.warnings_sbtab.append('Error: The new SBtab file could not'
-        #                                  ' be produced.')
-        #    try: redirect(URL('../default/balancing'))
-        #    except: redirect(URL('../balancing'))
-
-        # 8.3: SBtab (for all)
-        # Fix this as soon as we have the SBtab Document Class
-        # Currently, we only save a string with all the single SBtabs in it,
-        # but we need a list of SBtab objects and a proper show-function for it
-        try:
-            document = sbml2sbtab.SBMLDocument(sbml_model, model_name)
-            sbtab_string = ''
-            (sbtab_all, warnings) = document.makeSBtabs()
-            for sbtab in sbtab_all:
-                sbtab_string += sbtab.to_str() + '\n\n'
-            sbtab_string += sbtab_final.to_str() + '\n\n'
-            if 'prior' in session:
-                sbtab_string += session.prior.to_str() + '\n\n'
-            if 'config_file' in session and session.config_file is not None:
-                sbtab_string += session.config_file.to_str() + \
-                                '\n\n'
-            session.result_sbtab.append(sbtab_string)
-            session.result_sbtab_name.append(sbml_filename[:-4] + \
-                                             '_balanced_model.tsv')
-        except:
-            session.warnings_sbtab.append('Error: It was not possible to save '
-                                          'the model and parameters in one SBt'
-                                          'ab file for download.')
+        # 1b: return the result right away if these inputs were balanced before
+        result_store = result_cache.ResultCache(result_cache_dir)
+        if session.emptysbtab: sbtab_key = None
+        else: sbtab_key = sbtab_file
+        if 'config_file' in session: config_key = session.config_file
+        else: config_key = None
+        cache_key = result_cache.content_key(result_cache.normalise_sbml(sbml_file),
+                                             sbtab_key, sbtab_prior, config_key,
+                                             session.parameter_dict)
+        cached = result_store.get(cache_key)
+        if cached:
+            restore_result(cached, str(sbml_filename)[:-4] + '_balanced_model.xml',
+                           cached['sbtab_filename'][:-4] + '_balanced_parameters.tsv',
+                           sbml_filename[:-4] + '_balanced_model.tsv')
+            session.priors = []
+            session.prior_names = []
+            session.config_file = None
+            session.config_filename = None
             try: redirect(URL('../default/balanced'))
             except: redirect(URL('../balanced'))
 
+        # 2-8: balance the model on the job queue (see balancing_jobs); the
+        # job page polls its status and shows the results
+        if 'use_pseudo_values' in session.parameter_dict and \
+           session.parameter_dict['use_pseudo_values'] == 'True':
+            use_pseudos = True
+        else: use_pseudos = False
+        appendix = []
+        if 'prior' in session and session.prior is not None:
+            appendix.append(get_blob(session.prior))
+        if 'config_file' in session and session.config_file is not None:
+            appendix.append(get_blob(session.config_file))
+        model_name = str(sbml_filename)[:-4] + '_balanced_model.xml'
+        model_errors = [('warnings_sbml', 'Error: The SBML file %s could not '
+                         'be processed properly.' % (sbml_filename))]
+        if not session.emptysbtab:
+            model_errors.append(('warnings_sbtab', 'Error: The SBtab file %s '
+                                 'could not be processed properly'
+                                 '.' % (sbtab_filename)))
+        job_id = balancing_jobs.get_queue().submit(cache_key,
+                                                   balancing_jobs.run_job,
+                                                   result_cache_dir, cache_key,
+                                                   sbml_file, sbtab_key,
+                                                   sbtab_prior,
+                                                   session.parameter_dict,
+                                                   pseudos, priors, pmin, pmax,
+                                                   use_pseudos, model_name,
+                                                   None, appendix)
+        session.job = {'id': job_id,
+                       'fastlane': False,
+                       'model_name': model_name,
+                       'parameters_name': None,
+                       'bundle_name': sbml_filename[:-4] + '_balanced_model.tsv',
+                       'errors': {'model': model_errors,
+                                  'prior': [('warnings_prior', 'The alternate '
+                                             'prior could not be loaded.')],
+                                  'fill': [('warnings_sbtab', 'Error: The SBtab '
+                                            'data could not be processed '
+                                            'correctly.')],
+                                  'balancing': [('warnings_sbml', 'Error: The '
+                                                 'balancing process was erroneo'
+                                                 'us. Please check your input f'
+                                                 'iles for validity.')],
+                                  'kinetics': [('warnings_sbtab', 'Error: The '
+                                                'parameters and kinetics could '
+                                                'not be written to the output '
+                                                'model.')],
+                                  'sbml': [('warnings_sbml', 'Error: The new '
+                                            'SBML model could not be produced'
+                                            '.')],
+                                  'bundle': [('warnings_sbtab', 'Error: It was '
+                                              'not possible to save the model '
+                                              'and parameters in one SBtab file'
+                                              ' for download.')]}}
+
         # remove prior again to not have it shown initially on balancing screen
         prior_file = None
         prior_filename = None
@@ -742,8 +703,8 @@ def balancing():
         session.prior_names = []
         session.config_file = None
         session.config_filename = None
-        try: redirect(URL('../default/balanced'))
-        except: redirect(URL('../balanced'))
+        try: redirect(URL('../default/job'))
+        except: redirect(URL('../job'))
 
     if request.vars.clearsession:
         clearsession()
@@ -755,6 +716,7 @@ def balancing():
     if request.vars.balance_fastlane:
         session.sbtab_fl = session.sbtab_fls[0]
         session.sbtab_fl_name = session.sbtab_fl_names[0]
+        sbtab_fl = get_blob(session.sbtab_fl)
         sbtab_data = False
         sbtab_q = False
         sbtab_c = False
@@ -762,7 +724,7 @@ def balancing():
 
         # check out which sbtabs are available
         try:
-            sbtabs = misc.cut_tabs(session.sbtab_fl)
+            sbtabs = misc.cut_tabs(sbtab_fl)
             for sbtab in sbtabs:
                 if 'Quantity' in sbtab and '!MathematicalType' in sbtab:
                     sbtab_prior = SBtab.SBtabTable(sbtab,
@@ -785,10 +747,10 @@ def balancing():
 
         # convert sbtab to sbml
         try:
-            Conversion_class = sbtab2sbml.SBtabDocument(session.sbtab_fl,
+            Conversion_class = sbtab2sbml.SBtabDocument(sbtab_fl,
                                                         session.sbtab_fl_name)
             (sbml_file, warnings) = Conversion_class.makeSBML()
-            session.sbmls.append(sbml_file)
+            session.sbmls.append(blobs.put(sbml_file))
             session.sbml_names.append(session.sbtab_fl_name[:-4] + '.xml')
             if sbml_file is False:
                 print('The SBML file was not computed correctly from the bundl'
@@ -809,9 +771,9 @@ def balancing():
             if validity != []:
                 for v in validity:
                     session.warnings_fl.append(v)
-            session.priors.append(sbtab_prior)
+            session.priors.append(blobs.put(sbtab_prior))
             session.prior_names.append('embedded_prior.tsv')
-            session.prior = sbtab_prior
+            session.prior = blobs.put(sbtab_prior)
             session.prior_name = 'embedded_prior.tsv'
         except:
             prior_open = open('./applications/pb/static/files/default_files/pb'
@@ -819,11 +781,11 @@ def balancing():
             prior_file = prior_open.read()
             session.prior_name = 'pb_prior.tsv'
             sbtab_prior = SBtab.SBtabTable(prior_file, session.prior_name)
-            session.prior = sbtab_prior
+            session.prior = blobs.put(sbtab_prior)
             session.priors = []
             session.prior_names = []
             try:
-                session.priors.append(sbtab_prior)
+                session.priors.append(blobs.put(sbtab_prior))
                 session.prior_names.append(session.prior_name)
             except:
                 session.warnings_fl.append('Error loading the default prior table.')
@@ -832,7 +794,7 @@ def balancing():
 
         # 0: config:
         if sbtab_config:
-            session.config_file = sbtab_config
+            session.config_file = blobs.put(sbtab_config)
             session.config_filename = 'embedded_options.tsv'
             try:
                 def_file_open = open('./applications/pb/static/files/default_f'
@@ -868,69 +830,11 @@ def balancing():
             session.parameter_dict = {'config': False}
 
         # 1: extract priors and pseudos
+        sbtab_prior = get_blob(session.prior)
         try:
             (pseudos,
              priors, pmin,
-             pmax) = misc.extract_pseudos_priors(session.prior)
-        except:
-            session.warnings_fl.append('Error: The prior table %s could not be'
-                                       ' processed properly'
-                                       '.' % (session.prior_name))
-            try: redirect(URL('../default/balancing'))
-            except: redirect(URL('../balancing'))
-
-        # 2: makeSBtab (either from an empty SBtab or from a given SBtab)
-        if not sbtab_data:
-            try:
-                reader = libsbml.SBMLReader()
-                sbml = reader.readSBMLFromString(sbml_file)
-                sbml_model = sbml.getModel()
-                pb = balancer.ParameterBalancing(sbml_model)
-                sbtab_data = pb.make_empty_sbtab(pmin, pmax,
-                                                 session.parameter_dict)
-            except:
-                session.warnings_fl.append('Error: The model information of %s'
-                                           ' could not be processed properly'
-                                           '.' % (session.sbtab_fl_name))
-                try:
-                    redirect(URL('../default/balancing'))
-                except:
-                    redirect(URL('../balancing'))
-        else:
-            try:
-                reader = libsbml.SBMLReader()
-                sbml = reader.readSBMLFromString(sbml_file)
-                sbml_model = sbml.getModel()
-                pb = balancer.ParameterBalancing(sbml_model)
-                sbtab_data = pb.make_sbtab(sbtab_data, sbtab_data.filename,
-                                           'All organisms', 43,
-                                           pmin, pmax, session.parameter_dict)
-            except:
-                session.warnings_fl.append('Error: The model information of %s'
-                                           ' could not be processed properly'
-                                           '.' % (session.sbtab_fl_name))
-                try: redirect(URL('../default/balancing'))
-                except: redirect(URL('../balancing'))
-
-        # 2b: update prior information for model if alternate prior is used
-        try:
-            pb.get_parameter_information(sbtab_prior)
-        except:
-            session.warnings_prior.append('The alternate prior could not'
-                                          ' be loaded.')
-                                
-        # 3: fill them in the SBtab file
-        try: pseudo = bool(session.parameter_dict['use_pseudo_values'])
-        except: pseudo = True
-
-        try:
-            if pseudo:
-                sbtab_old = copy.deepcopy(sbtab_data)
-                sbtab_new = pb.fill_sbtab(sbtab_old, pseudos, priors)
-                pseudo_flag = 'pseudos'
-            else:
-                sbtab_new = pb.fill_sbtab(sbtab_data)
-                pseudo_flag = 'no_pseudos'
+             pmax) = misc.extract_pseudos_priors(sbtab_prior)
         except:
             session.warnings_fl.append('Error: The prior table %s could not be'
                                        ' processed properly'
@@ -938,109 +842,71 @@ def balancing():
             try: redirect(URL('../default/balancing'))
             except: redirect(URL('../balancing'))
 
-        # 4: construct parameter dictionary
-        if 'temperature' not in session.parameter_dict.keys():
-            session.parameter_dict['temperature'] = 300
-        else: session.parameter_dict['temperature'] = \
-            float(session.parameter_dict['temperature'])
-        if 'ph' not in session.parameter_dict.keys():
-            session.parameter_dict['ph'] = 7
-        else:
-            session.parameter_dict['ph'] = float(session.parameter_dict['ph'])
-
-        types = ['standard chemical potential',
-                 'catalytic rate constant geometric mean',
-                 'Michaelis constant', 'activation constant',
-                 'inhibitory constant', 'concentration',
-                 'concentration of enzyme', 'equilibrium constant',
-                 'substrate catalytic rate constant',
-                 'forward maximal velocity', 'product catalytic rate constant',
-                 'reverse maximal velocity', 'chemical potential',
-                 'reaction affinity']
-
-        for typ in types: session.parameter_dict[typ] = True
-
-        #####
-        # 5: BALANCE PARAMETERS
-        try:
-            (sbtab_final, mean_vector, mean_vector_inc, c_post, c_post_inc,
-                r_matrix, shannon, log, concat) = pb.make_balancing(sbtab_new,
-                                                            sbtab_data,
-                                                            pmin, pmax,
-                                                            session.parameter_dict)
-            session.log = log
-        except:
-            session.warnings_fl.append('Error: The balancing process was erron'
-                                       'eous. Please check validity of input f'
-                                       'iles.')
-            try: redirect(URL('../default/balancing'))
-            except: redirect(URL('../balancing'))
-
-        # 7: fill the model with the parameters and the kinetics
-        try:
-            try: param = session.parameter_dict['parametrisation']
-            except: param = 'hal'
-            try: prefac = session.parameter_dict['enzyme_prefactor']
-            except: prefac = True
-            try: inh = session.parameter_dict['default_inh']
-            except: inh = 'complete_inh'
-            try: act = session.parameter_dict['default_act']
-            except: act = 'complete_act'
-            try: overwrite = session.parameter_dict['overwrite_kinetics']
-            except: overwrite = True
-            kineticizer_cs = kineticizer.KineticizerCS(sbml_model, sbtab_final,
-                                                       param, prefac, inh, act,
-                                                       overwrite)
-        except:
-            session.warnings_fl.append('Error: The parameters and kinetics cou'
-                                       'ld not be written to the model.')
-            try: redirect(URL('../default/balancing'))
-            except: redirect(URL('../balancing'))
-
-        # 8.1: Output SBML
-        try:
-            ### model_name
-            model_name = str(session.sbtab_fl_name)[:-4] + \
-                         '_balanced_model.xml'
-            sbml_code = '<?xml version="1.0" encoding="UTF-8"?>\n' + \
-                        sbml_model.toSBML()
-            session.result_sbml = [sbml_code]
-            session.result_sbml_name = [model_name]
-        except:
-            session.warnings_fl.append('Error: The new SBML model could not be'
-                                       ' produced.')
-            try: redirect(URL('../default/balancing'))
-            except: redirect(URL('../balancing'))
-
-        # 8.2: Output SBtab
-        try:
-            session.result_sbtab = [sbtab_final]
-            session.result_sbtab_name = [session.sbtab_fl_name[:-4] + \
-                                         '_balanced_parameters.tsv']
-        except:
-            session.warnings_fl.append('Error: The new SBtab file could not be'
-                                       ' produced.')
-            try: redirect(URL('../default/balancing'))
-            except: redirect(URL('../balancing'))
-
-        # 8.3: Output SBtab (for all)
-        try:
-            sbtabs_all = ''
-            for sbtab in sbtabs:
-                sbtabs_all += sbtab + '\n'
-            sbtabs_all += sbtab_final.to_str() + '\n'
-            session.result_sbtab.append(sbtabs_all)
-            session.result_sbtab_name.append(session.sbtab_fl_name[:-4] + \
-                                             '_balanced_model.tsv')
-            session.result_sbtab_string = sbtabs_all
+        # 1b: return the result right away if this bundle was balanced before
+        result_store = result_cache.ResultCache(result_cache_dir)
+        cache_key = result_cache.content_key(session.sbtab_fl, session.prior,
+                                             session.parameter_dict)
+        cached = result_store.get(cache_key)
+        if cached:
+            restore_result(cached, str(session.sbtab_fl_name)[:-4] + \
+                           '_balanced_model.xml',
+                           session.sbtab_fl_name[:-4] + \
+                           '_balanced_parameters.tsv',
+                           session.sbtab_fl_name[:-4] + '_balanced_model.tsv')
+            session.result_sbtab_string = blobs.put(cached['sbtab_all'])
             session.result_sbtab_string_name = session.sbtab_fl_name[:-4] + \
                                                '_balanced_model.tsv'
-        except:
-            session.warnings_fl.append('Error: It was not possible to save the'
-                                       ' model and parameters in one SBtab fil'
-                                       'e for download.')
-            try: redirect(URL('../default/balancing'))
-            except: redirect(URL('../balancing'))
+            session.priors = []
+            session.prior_names = []
+            session.config_file = None
+            session.config_filename = None
+            try: redirect(URL('../default/balanced'))
+            except: redirect(URL('../balanced'))
+
+        # 2-8: balance the model on the job queue (see balancing_jobs); the
+        # job page polls its status and shows the results
+        try: use_pseudos = bool(session.parameter_dict['use_pseudo_values'])
+        except: use_pseudos = True
+        if not sbtab_data: sbtab_data = None
+        model_name = str(session.sbtab_fl_name)[:-4] + '_balanced_model.xml'
+        job_id = balancing_jobs.get_queue().submit(cache_key,
+                                                   balancing_jobs.run_job,
+                                                   result_cache_dir, cache_key,
+                                                   sbml_file, sbtab_data,
+                                                   sbtab_prior,
+                                                   session.parameter_dict,
+                                                   pseudos, priors, pmin, pmax,
+                                                   use_pseudos, model_name,
+                                                   sbtabs)
+        session.job = {'id': job_id,
+                       'fastlane': True,
+                       'model_name': model_name,
+                       'parameters_name': session.sbtab_fl_name[:-4] + \
+                                          '_balanced_parameters.tsv',
+                       'bundle_name': session.sbtab_fl_name[:-4] + \
+                                      '_balanced_model.tsv',
+                       'errors': {'model': [('warnings_fl', 'Error: The model '
+                                             'information of %s could not be '
+                                             'processed properly'
+                                             '.' % (session.sbtab_fl_name))],
+                                  'prior': [('warnings_prior', 'The alternate '
+                                             'prior could not be loaded.')],
+                                  'fill': [('warnings_fl', 'Error: The prior '
+                                            'table %s could not be processed '
+                                            'properly.' % (session.prior_name))],
+                                  'balancing': [('warnings_fl', 'Error: The bal'
+                                                 'ancing process was erroneous.'
+                                                 ' Please check validity of inp'
+                                                 'ut files.')],
+                                  'kinetics': [('warnings_fl', 'Error: The para'
+                                                'meters and kinetics could not '
+                                                'be written to the model.')],
+                                  'sbml': [('warnings_fl', 'Error: The new SBML'
+                                            ' model could not be produced.')],
+                                  'bundle': [('warnings_fl', 'Error: It was not'
+                                              ' possible to save the model and '
+                                              'parameters in one SBtab file for'
+                                              ' download.')]}}
 
         # remove prior and config again to not have it shown initially on
         # balancing screen
@@ -1050,8 +916,8 @@ def balancing():
         session.prior_names = []
         session.config_file = None
         session.config_filename = None
-        try: redirect(URL('../default/balanced'))
-        except: redirect(URL('../balanced'))
+        try: redirect(URL('../default/job'))
+        except: redirect(URL('../job'))
 
         ################################## BALANCING
 
@@ -1082,6 +948,96 @@ def balancing():
                 LOG_FILE=session.log_file)
 
 
+def job():
+    '''
+    waiting page of online balancing: polls the status of the balancing
+    job and forwards to the results once it is done
+    '''
+    response.title = T('Parameter Balancing for Kinetic Models of Cell '
+                       'Metabolism')
+    response.subtitle = T('Online Balancing')
+
+    if not session.job:
+        try: redirect(URL('../default/balancing'))
+        except: redirect(URL('../balancing'))
+
+    status = balancing_jobs.get_queue().status(session.job['id'])
+    if status not in ('queued', 'running'):
+        try: redirect(URL('../default/job_result'))
+        except: redirect(URL('../job_result'))
+
+    return dict(JOB_ID=session.job['id'], STATUS=status)
+
+
+def job_status():
+    '''
+    returns the status of a balancing job as JSON: queued, running,
+    finished, failed or unknown
+    '''
+    job_id = request.vars.job_id
+    if not job_id and session.job: job_id = session.job['id']
+    status = balancing_jobs.get_queue().status(job_id)
+    if status is None and job_id and \
+       job_id in result_cache.ResultCache(result_cache_dir):
+        status = 'finished'
+    return response.json({'job_id': job_id, 'status': status or 'unknown'})
+
+
+def job_result():
+    '''
+    retrieves the result of the balancing job: the output files are shown
+    on the results page, errors on the balancing page
+    '''
+    job = session.job
+    if not job:
+        try: redirect(URL('../default/balancing'))
+        except: redirect(URL('../balancing'))
+
+    queue = balancing_jobs.get_queue()
+    status = queue.status(job['id'])
+    if status in ('queued', 'running'):
+        try: redirect(URL('../default/job'))
+        except: redirect(URL('../job'))
+
+    result = None
+    failed_stage = None
+    if status is None:
+        # the job was run by another web worker or before a restart
+        result = result_cache.ResultCache(result_cache_dir).get(job['id'])
+    else:
+        try: result = queue.result(job['id'])
+        except balancing_jobs.BalancingError as e: failed_stage = e.stage
+        except: failed_stage = 'balancing'
+
+    session.job = None
+    stages = [failed_stage] if failed_stage else []
+    if result: stages += result['warnings']
+    for stage in stages:
+        for (warnings, message) in job['errors'][stage]:
+            if not session.get(warnings): session[warnings] = []
+            session[warnings].append(message)
+
+    if result is None and not failed_stage:
+        session.warnings_sbml = (session.warnings_sbml or []) + \
+                                ['Error: The balancing job could not be found'
+                                 '. Please start the balancing again.']
+    if failed_stage or result is None or \
+       (job['fastlane'] and result['sbtab_all'] is None):
+        try: redirect(URL('../default/balancing'))
+        except: redirect(URL('../balancing'))
+
+    if job['parameters_name']: parameters_name = job['parameters_name']
+    else: parameters_name = result['sbtab_filename'][:-4] + \
+                            '_balanced_parameters.tsv'
+    restore_result(result, job['model_name'], parameters_name,
+                   job['bundle_name'])
+    if job['fastlane']:
+        session.result_sbtab_string = blobs.put(result['sbtab_all'])
+        session.result_sbtab_string_name = job['bundle_name']
+    try: redirect(URL('../default/balanced'))
+    except: redirect(URL('../balanced'))
+
+
 def balanced():
     '''
     fourth and last page of online balancing:
@@ -1091,7 +1047,7 @@ def balanced():
                        'Metabolism')
     response.subtitle = T('Online Balancing')
 
-    if request.vars.download_button_sbml:
+    if request.vars.download_button_sbml or request.vars.download_button_sbml_gz:
         download_sbml()
         pass
 
@@ -1102,7 +1058,8 @@ def balanced():
         try: redirect(URL('../default/balanced'))
         except: redirect(URL('../balanced'))
 
-    if request.vars.download_button_sbtab:
+    if request.vars.download_button_sbtab or \
+       request.vars.download_button_sbtab_gz:
         download_sbtab()
         pass
 
@@ -1132,26 +1089,34 @@ def show_sbml():
     '''
     function that converts SBML file to HTML in order to display it in browser
     '''
-    return misc.xml2html(str(session.sbmls[int(request.args(0))]))
+    return misc.xml2html(str(get_blob(session.sbmls[int(request.args(0))])))
 
 
 def show_sbml2():
     '''
     function that converts SBML file to HTML in order to display it in browser
     '''
-    return misc.xml2html(session.result_sbml[int(request.args(0))])
+    return misc.xml2html(get_blob(session.result_sbml[int(request.args(0))]))
+
+
+def requested_page(default=0):
+    '''
+    returns the page of a large table that is requested via ?page=N
+    '''
+    try: return max(0, int(request.vars.page))
+    except: return default
 
 
 def show_sbtab():
     '''
     function that converts SBtab file to HTML in order to display it in browser
     '''
-    try:
-        sbtab = session.sbtabs[int(request.args(0))]
+    try: key = session.sbtabs[int(request.args(0))]
     except: return 'The requested SBtab file cannot be loaded.'
+    sbtab = get_blob(key)
 
     try:
-        return misc.tsv_to_html(sbtab)
+        return misc.tsv_to_html(sbtab, page=requested_page())
     except: return 'The requested SBtab file cannot be displayed.'
 
 
@@ -1160,12 +1125,13 @@ def show_sbtab2():
     function that converts SBtab file to HTML in order to display it in browser
     '''
     try:
-        sbtab = session.result_sbtab[int(request.args(0))]
+        key = session.result_sbtab[int(request.args(0))]
         filename = session.result_sbtab_name[int(request.args(0))]
     except: return 'The requested SBtab file cannot be loaded.'
+    sbtab = get_blob(key)
 
     try:
-        return misc.tsv_to_html(sbtab, filename)
+        return misc.tsv_to_html(sbtab, filename, page=requested_page())
     except: return 'The requested SBtab file cannot be displayed.'
 
 
@@ -1173,14 +1139,12 @@ def show_log():
     '''
     function that converts log file to HTML in order to display it in browser
     '''
-    try:
-        log_name = 'log_file.txt'
-        log_file = session.log
-    except: return 'The requested log file cannot be loaded.'
+    log_name = 'log_file.txt'
+    log_file = get_blob(session.log)
 
     try:
         delimiter = '\t'
-        return misc.tsv_to_html(log_file, log_name)
+        return misc.tsv_to_html(log_file, log_name, page=requested_page())
     except: return 'The requested log file cannot be displayed.'
 
 
@@ -1190,12 +1154,14 @@ def show_sbtab_fl():
     in order to display it in the browser
     '''
     try:
+        key = session.sbtab_fls[int(request.args(0))]
         file_name = session.sbtab_fl_names[int(request.args(0))]
     except: return 'The requested SBtab file cannot be loaded.'
+    sbtab_file = get_blob(key)
 
     # This needs to be updated when the SBtab Document class is at hand
     try:
-        return misc.tsv_to_html(sbtab_file, file_name)
+        return misc.tsv_to_html(sbtab_file, file_name, page=requested_page())
     except: return 'The requested SBtab file cannot be displayed.'
 
 
@@ -1204,12 +1170,12 @@ def show_prior():
     function that converts prior SBtab file to HTML
     in order to display it in the browser
     '''
-    try:
-        sbtab_prior = session.priors[int(request.args(0))]
+    try: key = session.priors[int(request.args(0))]
     except: return 'The requested prior table cannot be loaded.'
+    sbtab_prior = get_blob(key)
 
     try:
-        return misc.tsv_to_html(sbtab_prior)
+        return misc.tsv_to_html(sbtab_prior, page=requested_page())
     except: return 'The requested prior file cannot be displayed.'
 
 
@@ -1218,66 +1184,64 @@ def show_sbtab_conf():
     function that converts configure SBtab file to HTML
     in order to display it in the browser
     '''
-    try:
-        sbtab_config = session.config_file
-    except: return 'The requested config table cannot be loaded.'
+    sbtab_config = get_blob(session.config_file)
 
     try:
-        return misc.tsv_to_html(sbtab_config)
+        return misc.tsv_to_html(sbtab_config, page=requested_page())
     except: return 'The requested options file cannot be displayed.'
 
 
-def download_sbtab():
+def send_download(content, filename, content_type, compress=False):
     '''
-    function for download of SBtab files
+    streams a result in chunks (see downloads), gzip-compressed on request
     '''
-    response.headers['Content-Type'] = 'text/csv'
-    attachment = 'attachment;filename=' + \
-                 session.result_sbtab_name[int(request.vars.download_button_sbtab)]
+    attachment = 'attachment;filename=' + filename
+    if compress:
+        attachment += '.gz'
+        content_type = 'application/gzip'
+    response.headers['Content-Type'] = content_type
     response.headers['Content-Disposition'] = attachment
 
-    # fix the except part: we need something new, when we have
-    # the SBtab Document class
-    try:
-        content = \
-          session.result_sbtab[int(request.vars.download_button_sbtab)].to_str()
-    except:
-        content = \
-          session.result_sbtab[int(request.vars.download_button_sbtab)]
-
-    raise HTTP(200, str(content),
-               **{'Content-Type': 'text/csv',
+    raise HTTP(200, downloads.stream(content, compress),
+               **{'Content-Type': content_type,
                   'Content-Disposition': attachment + ';'})
 
 
-def download_sbml():
+def download_sbtab():
     '''
-    function for download of SBML files
+    function for download of SBtab files (gzip-compressed for
+    download_button_sbtab_gz or compress=1)
     '''
-    response.headers['Content-Type'] = 'text/xml'
-    attachment = 'attachment;filename=' + \
-                 session.sbml_names[int(request.vars.download_button_sbml)]
-    response.headers['Content-Disposition'] = attachment
-    content = session.sbmls[int(request.vars.download_button_sbml)]
+    compress = bool(request.vars.download_button_sbtab_gz or
+                    request.vars.compress)
+    index = int(request.vars.download_button_sbtab or
+                request.vars.download_button_sbtab_gz)
+    # SBtab tables are streamed line by line, bundles are strings
+    content = get_blob(session.result_sbtab[index])
+    send_download(content, session.result_sbtab_name[index], 'text/csv',
+                  compress)
 
-    raise HTTP(200, str(content),
-               **{'Content-Type': 'text/xml',
-                  'Content-Disposition': attachment + ';'})
+
+def download_sbml():
+    '''
+    function for download of SBML files (gzip-compressed for
+    download_button_sbml_gz or compress=1)
+    '''
+    compress = bool(request.vars.download_button_sbml_gz or
+                    request.vars.compress)
+    index = int(request.vars.download_button_sbml or
+                request.vars.download_button_sbml_gz)
+    content = get_blob(session.sbmls[index])
+    send_download(content, session.sbml_names[index], 'text/xml', compress)
 
 
 def download_log():
     '''
-    function for download of log files
+    function for download of log files (gzip-compressed for compress=1)
     '''
-    response.headers['Content-Type'] = 'text/csv'
-    attachment = 'attachment;filename=' + session.sbml_name[:-4] + \
-                 '_balancing_log.txt'
-    response.headers['Content-Disposition'] = attachment
-    content = session.log
-
-    raise HTTP(200, str(content),
-               **{'Content-Type': 'text/csv',
-                  'Content-Disposition': attachment + ';'})
+    content = get_blob(session.log)
+    send_download(content, session.sbml_name[:-4] + '_balancing_log.txt',
+                  'text/csv', bool(request.vars.compress))
 
 
 def user():
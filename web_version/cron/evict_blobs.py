@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+# removes the uploaded files and results of the online balancing (see
+# modules/blob_store.py) that have not been used for a day; this script
+# is run in the application environment from cron/crontab
+import os
+import blob_store
+
+max_age = 24 * 60 * 60
+blobs = blob_store.BlobStore(os.path.join(request.folder, 'cache', 'blobs'))
+print('Removed %s blob(s).' % blobs.evict(max_age))
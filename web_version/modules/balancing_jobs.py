@@ -0,0 +1,260 @@
+#!/usr/bin/python
+'''
+Background execution of the online balancing. The balancing pipeline runs
+on a local worker pool instead of inside the HTTP request; jobs are
+identified by the content hash of their inputs (see result_cache), and
+finished results are written to the result cache, from where every web
+worker can retrieve them.
+'''
+import copy
+import threading
+
+try:
+    from . import result_cache
+except:
+    import result_cache
+
+# quantity types that are balanced online
+balanced_types = ['standard chemical potential',
+                  'catalytic rate constant geometric mean',
+                  'Michaelis constant', 'activation constant',
+                  'inhibitory constant', 'concentration',
+                  'concentration of enzyme', 'equilibrium constant',
+                  'substrate catalytic rate constant',
+                  'forward maximal velocity', 'product catalytic rate constant',
+                  'reverse maximal velocity', 'chemical potential',
+                  'reaction affinity']
+
+
+class BalancingError(Exception):
+    '''
+    Raised if a step of the balancing pipeline fails; the stage is one of
+    model, fill, balancing, kinetics, sbml and bundle.
+    '''
+    def __init__(self, stage, message=''):
+        # pass the arguments on, so that the error survives the pickling
+        # from a worker process
+        Exception.__init__(self, stage, message)
+        self.stage = stage
+        self.message = message
+
+    def __str__(self):
+        return self.message or self.stage
+
+
+def balance(sbml_string, sbtab_data, sbtab_prior, parameter_dict, pseudos,
+            priors, pmin, pmax, use_pseudos=True, model_name='model.xml',
+            bundle=None, appendix=()):
+    '''
+    Runs the balancing pipeline: data table, balancing, kinetics and output.
+
+    Parameters
+    ----------
+    sbml_string: str
+        SBML model.
+    sbtab_data: SBtab.SBtabTable
+        Data table (None for balancing without data).
+    sbtab_prior: SBtab.SBtabTable
+        Prior table.
+    parameter_dict: dict
+        Balancing options (see misc.readout_config); it is not altered.
+    pseudos, priors, pmin, pmax: dict
+        Pseudo values, priors and bounds (see misc.extract_pseudos_priors).
+    use_pseudos: Boolean
+        Use pseudo values for derived quantities.
+    model_name: str
+        File name of the model for the bundled SBtab.
+    bundle: list
+        SBtab strings of the input bundle; they head the bundled output.
+        If None, the balanced model is converted to SBtab instead.
+    appendix: list
+        SBtab tables that are appended to the bundled output.
+
+    Returns: dict
+        Balanced SBML and SBtab strings, the bundled SBtab string (None if
+        it could not be produced), the log and the stages with non-fatal
+        problems.
+    '''
+    import libsbml
+    import balancer
+    import kineticizer
+    import sbml2sbtab
+
+    parameter_dict = copy.deepcopy(parameter_dict)
+    warnings = []
+
+    # 2: makeSBtab (either from an empty SBtab or from a given SBtab)
+    try:
+        reader = libsbml.SBMLReader()
+        sbml = reader.readSBMLFromString(sbml_string)
+        sbml_model = sbml.getModel()
+        pb = balancer.ParameterBalancing(sbml_model)
+        if sbtab_data is None:
+            sbtab_data = pb.make_empty_sbtab(pmin, pmax, parameter_dict)
+        else:
+            sbtab_data = pb.make_sbtab(sbtab_data, sbtab_data.filename,
+                                       'All organisms', 43, pmin, pmax,
+                                       parameter_dict)
+    except Exception as e: raise BalancingError('model', str(e))
+
+    # 2b: update prior information for model if alternate prior is used
+    try: pb.get_parameter_information(sbtab_prior)
+    except: warnings.append('prior')
+
+    # 3: fill them in the SBtab file
+    try:
+        if use_pseudos:
+            sbtab_old = copy.deepcopy(sbtab_data)
+            sbtab_new = pb.fill_sbtab(sbtab_old, pseudos, priors)
+        else:
+            sbtab_new = pb.fill_sbtab(sbtab_data)
+    except Exception as e: raise BalancingError('fill', str(e))
+
+    # 4: construct parameter dictionary
+    if 'temperature' not in parameter_dict:
+        parameter_dict['temperature'] = 300
+    else: parameter_dict['temperature'] = float(parameter_dict['temperature'])
+    if 'ph' not in parameter_dict:
+        parameter_dict['ph'] = 7
+    else: parameter_dict['ph'] = float(parameter_dict['ph'])
+    for typ in balanced_types:
+        parameter_dict[typ] = True
+
+    # 5: BALANCE PARAMETERS
+    try:
+        (sbtab_final, mean_vector, mean_vector_inc, c_post, c_post_inc,
+         r_matrix, shannon, log, concat) = pb.make_balancing(sbtab_new,
+                                                             sbtab_data,
+                                                             pmin, pmax,
+                                                             parameter_dict)
+    except Exception as e: raise BalancingError('balancing', str(e))
+
+    # 7: fill the model with the parameters and the kinetics
+    try:
+        kineticizer.KineticizerCS(sbml_model, sbtab_final,
+                                  parameter_dict.get('parametrisation', 'hal'),
+                                  parameter_dict.get('enzyme_prefactor', True),
+                                  parameter_dict.get('default_inh',
+                                                     'complete_inh'),
+                                  parameter_dict.get('default_act',
+                                                     'complete_act'),
+                                  parameter_dict.get('overwrite_kinetics',
+                                                     True),
+                                  snapshot=pb.get_snapshot())
+    except Exception as e: raise BalancingError('kinetics', str(e))
+
+    # 8.1: SBML
+    try:
+        sbml_code = '<?xml version="1.0" encoding="UTF-8"?>\n' + \
+                    sbml_model.toSBML()
+    except Exception as e: raise BalancingError('sbml', str(e))
+
+    # 8.3: SBtab (for all)
+    try:
+        if bundle is None:
+            document = sbml2sbtab.SBMLDocument(sbml_model, model_name)
+            (sbtab_all, conversion_warnings) = document.makeSBtabs()
+            sbtab_string = ''
+            for sbtab in sbtab_all:
+                sbtab_string += sbtab.to_str() + '\n\n'
+            sbtab_string += sbtab_final.to_str() + '\n\n'
+            for sbtab in appendix:
+                sbtab_string += sbtab.to_str() + '\n\n'
+        else:
+            sbtab_string = ''
+            for sbtab in bundle:
+                sbtab_string += sbtab + '\n'
+            sbtab_string += sbtab_final.to_str() + '\n'
+    except:
+        sbtab_string = None
+        warnings.append('bundle')
+
+    return {'sbml': sbml_code,
+            'sbtab': sbtab_final.to_str(),
+            'sbtab_filename': sbtab_final.filename,
+            'sbtab_all': sbtab_string,
+            'log': log,
+            'warnings': warnings}
+
+
+def run_job(cache_directory, key, *args, **kwargs):
+    '''
+    runs the balancing and stores its result in the result cache (module
+    level, so that it can be run on a process pool)
+    '''
+    result = balance(*args, **kwargs)
+    if result['sbtab_all'] is not None:
+        result_cache.ResultCache(cache_directory).put(key, result)
+    return result
+
+
+class JobQueue:
+    '''
+    Local worker pool for balancing jobs with status polling.
+    '''
+    def __init__(self, workers=2, executor='process'):
+        '''
+        Parameters
+        ----------
+        workers: int
+            Number of balancing jobs that run at the same time.
+        executor: str
+            'process' or 'thread' pool.
+        '''
+        import concurrent.futures
+        if executor == 'process':
+            self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, job_id, function, *args, **kwargs):
+        '''
+        Submits a job; a job with the same ID that is pending or finished
+        is not submitted again.
+
+        Returns: str
+            Job ID.
+        '''
+        with self.lock:
+            future = self.jobs.get(job_id)
+            if future is None or (future.done() and future.exception()):
+                self.jobs[job_id] = self.pool.submit(function, *args, **kwargs)
+        return job_id
+
+    def status(self, job_id):
+        '''
+        Returns the status of a job: queued, running, finished, failed or
+        None for unknown jobs.
+        '''
+        future = self.jobs.get(job_id)
+        if future is None: return None
+        if future.running(): return 'running'
+        if not future.done(): return 'queued'
+        if future.exception(): return 'failed'
+        return 'finished'
+
+    def result(self, job_id):
+        '''
+        Returns the result of a finished job and forgets the job; the
+        exception of a failed job is raised.
+        '''
+        with self.lock:
+            future = self.jobs.pop(job_id)
+        return future.result()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue(workers=2, executor='process'):
+    '''
+    Returns the job queue of this process (created on first use).
+    '''
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(workers, executor)
+    return _queue
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+'''
+Content-addressed store for the large payloads of the online balancing
+(SBML models, SBtab tables and results). The session only keeps the keys
+of the payloads, so that session I/O stays small; the payloads are
+pickled to one file per key and evicted once they have not been used for
+a while (see cron/crontab).
+'''
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+
+class BlobStore:
+    '''
+    Stores objects by the SHA-256 digest of their pickled content.
+    '''
+    def __init__(self, directory):
+        '''
+        Parameters
+        ----------
+        directory: str
+            Directory of the blob files (created if it does not exist).
+        '''
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def put(self, obj):
+        '''
+        Stores an object.
+
+        Parameters
+        ----------
+        obj: str | SBtab.SBtabTable | object
+            Picklable payload; None is not stored.
+
+        Returns: str
+            Key of the object (None for None).
+        '''
+        if obj is None: return None
+        data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+        if os.path.exists(path):
+            os.utime(path, None)
+        else:
+            (handle, temp_path) = tempfile.mkstemp(dir=self.directory,
+                                                   suffix='.tmp')
+            with os.fdopen(handle, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        return key
+
+    def get(self, key):
+        '''
+        Returns the object of a key.
+
+        Parameters
+        ----------
+        key: str
+            Key as returned by put (None yields None).
+
+        Returns: object
+            Stored object; a KeyError is raised if the blob was evicted.
+        '''
+        if not key: return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                obj = pickle.load(f)
+        except (IOError, OSError):
+            raise KeyError('The blob %s is not available.' % key)
+        os.utime(path, None)
+        return obj
+
+    def get_all(self, keys):
+        '''
+        Returns the objects of a list of keys.
+        '''
+        return [self.get(key) for key in keys or []]
+
+    def evict(self, max_age=86400):
+        '''
+        Removes the blobs that have not been used for max_age seconds.
+
+        Returns: int
+            Number of removed blobs.
+        '''
+        limit = time.time() - max_age
+        removed = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < limit:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError: pass
+        return removed
+
+
+if __name__ == '__main__':
+    # usage: python blob_store.py <directory> [max_age in seconds]
+    if len(sys.argv) < 2:
+        print('Please provide the blob directory.')
+        sys.exit()
+    try: max_age = float(sys.argv[2])
+    except: max_age = 86400
+    removed = BlobStore(sys.argv[1]).evict(max_age)
+    print('Removed %s blob(s).' % removed)
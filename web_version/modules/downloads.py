@@ -0,0 +1,73 @@
+#!/usr/bin/python
+'''
+Streamed downloads of the online balancing results. The results are sent
+in chunks that are generated from the stored SBML or SBtab on the fly,
+optionally gzip-compressed, so that a download never holds further
+copies of a large result in the memory of the web worker.
+'''
+import zlib
+
+chunk_size = 64 * 1024
+
+
+def iter_text(content, size=chunk_size):
+    '''
+    Yields a result in text chunks of roughly the given size.
+
+    Parameters
+    ----------
+    content: str | SBtab.SBtabTable
+        Result; SBtab tables are serialised line by line.
+    size: int
+        Number of characters per chunk.
+    '''
+    if hasattr(content, 'iter_lines'):
+        chunk = []
+        length = 0
+        for i, line in enumerate(content.iter_lines()):
+            if i: line = '\n' + line
+            chunk.append(line)
+            length += len(line)
+            if length >= size:
+                yield ''.join(chunk)
+                chunk = []
+                length = 0
+        if chunk: yield ''.join(chunk)
+    else:
+        content = str(content)
+        for start in range(0, len(content), size):
+            yield content[start:start + size]
+
+
+def iter_gzip(chunks, level=6):
+    '''
+    Compresses a sequence of byte chunks incrementally to the gzip format.
+    '''
+    # wbits=31 writes the gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data: yield data
+    yield compressor.flush()
+
+
+def stream(content, compress=False, size=chunk_size):
+    '''
+    Returns a generator of the UTF-8 encoded (and optionally gzip
+    compressed) chunks of a result.
+
+    Parameters
+    ----------
+    content: str | SBtab.SBtabTable
+        Result to be sent.
+    compress: Boolean
+        Compress the result with gzip.
+    size: int
+        Number of characters per chunk.
+
+    Returns: generator
+        Chunks as bytes.
+    '''
+    chunks = (text.encode('utf-8') for text in iter_text(content, size))
+    if compress: chunks = iter_gzip(chunks)
+    return chunks
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+'''
+Cache for the results of the online balancing. The results are stored on
+disk, one JSON file per input combination, keyed by a content hash of the
+SBML model, the data and prior SBtab tables and the balancing options.
+The least recently used results are evicted once the cache exceeds its
+size limit.
+'''
+import hashlib
+import json
+import os
+import tempfile
+
+
+def normalise_sbml(sbml_string):
+    '''
+    normalises line endings and surrounding whitespace of an SBML string, so
+    that identical models uploaded from different platforms hash equally
+    '''
+    lines = sbml_string.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.strip() for line in lines if line.strip())
+
+
+def content_key(*parts):
+    '''
+    Computes the cache key of a combination of balancing inputs.
+
+    Parameters
+    ----------
+    parts: str | SBtab.SBtabTable | dict | None
+        Inputs of the balancing; SBtab tables are hashed in their string
+        representation, dictionaries with sorted keys.
+
+    Returns: str
+        Hexadecimal SHA-256 digest of the inputs.
+    '''
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None: content = ''
+        elif isinstance(part, dict):
+            content = json.dumps(part, sort_keys=True, default=str)
+        elif isinstance(part, str): content = part
+        else: content = part.to_str()
+        # prefix the length so that the parts cannot run into each other
+        content = content.encode('utf-8')
+        digest.update(b'%d:' % len(content))
+        digest.update(content)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    '''
+    Disk cache of balancing results with size-based LRU eviction.
+    '''
+    def __init__(self, directory, max_size=200 * 1024 * 1024):
+        '''
+        Parameters
+        ----------
+        directory: str
+            Directory of the cache files (created if it does not exist).
+        max_size: int
+            Maximum size of the cache in bytes.
+        '''
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        '''
+        Returns the cached result of a key or None; a hit marks the result
+        as recently used.
+
+        Parameters
+        ----------
+        key: str
+            Cache key (see content_key).
+
+        Returns: dict
+            Cached result (see put).
+        '''
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                result = json.load(f)
+            os.utime(path, None)
+            return result
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put(self, key, result):
+        '''
+        Stores a result and evicts the least recently used results if the
+        cache grows too large.
+
+        Parameters
+        ----------
+        key: str
+            Cache key (see content_key).
+        result: dict
+            JSON-serialisable result, e.g. the balanced SBtab and SBML
+            strings and the log.
+        '''
+        # write to a temporary file first, so that concurrent readers never
+        # see half-written results
+        (handle, temp_path) = tempfile.mkstemp(dir=self.directory,
+                                               suffix='.tmp')
+        with os.fdopen(handle, 'w') as f:
+            json.dump(result, f)
+        os.replace(temp_path, self._path(key))
+        self.evict()
+
+    def evict(self, max_size=None):
+        '''
+        Removes the least recently used results until the cache is smaller
+        than max_size (default: the size limit of the cache).
+
+        Returns: int
+            Number of removed results.
+        '''
+        if max_size is None: max_size = self.max_size
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'): continue
+            try: stat = entry.stat()
+            except OSError: continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        removed = 0
+        for (mtime, size, path) in sorted(entries):
+            if total <= max_size: break
+            try: os.remove(path)
+            except OSError: continue
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        '''
+        Removes all cached results.
+        '''
+        return self.evict(0)
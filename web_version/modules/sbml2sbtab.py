@@ -9,10 +9,24 @@ See specification for further information.
 #!/usr/bin/env python
 import re, libsbml, numpy
 import SBtab
+import datetime
+import os
 import sys
 
 allowed_sbtabs = ['Compartment','Compound','Reaction','Rule','Quantity','Event']
 
+# patterns of the annotation resources and their identifiers.org namespaces
+pattern2urn = [(re.compile(pattern), urn) for (pattern, urn) in
+               [("CHEBI:\d+$","obo.chebi"),
+                ("C\d+$","kegg.compound"),
+                ("GO:\d{7}$","obo.go"),
+                ("((S\d+$)|(Y[A-Z]{2}\d{3}[a-zA-Z](\-[A-Z])?))$","sgd"),
+                ("SBO:\d{7}$","biomodels.sbo"),
+                ("\d+\.-\.-\.-|\d+\.\d+\.-\.-|\d+\.\d+\.\d+\.-|\d+\.\d+\.\d+\.(n)?\d+$","ec-code"),
+                ("K\d+$","kegg.orthology"),
+                ("([A-N,R-Z][0-9]([A-Z][A-Z, 0-9][A-Z, 0-9][0-9]){1,2})|([O,P,Q][0-9][A-Z, 0-9][A-Z, 0-9][A-Z, 0-9][0-9])(\.\d+)?$","uniprot")]]
+identifiers_org = re.compile('identifiers.org/(.*)/(.*)')
+
 class ConversionError(Exception):
     '''
     Base class for errors in the SBtab conversion class.
@@ -37,23 +51,11 @@ class SBMLDocument:
         filename : str
             Filename with extension.
         '''
-        #reader      = libsbml.SBMLReader()
-        #sbml_modelx = reader.readSBML(sbml_model)
-        #print sbml_modelx.getModel()
-
         self.model    = sbml_model
         self.filename = filename
-        if not self.filename.endswith('.xml') and not filename.endswith('.sbml'): 
+        if not self.filename.endswith('.xml') and not filename.endswith('.sbml'):
             raise ConversionError('The given file format is not supported: '+self.filename)
 
-        #for testing purposes:
-        '''
-        sbtabs = self.makeSBtabs()
-        for sbtab in sbtabs:
-            print sbtab
-            print '\n\n\n'
-        '''
-
     def makeSBtabs(self):
         '''
         Generates the SBtab files.
@@ -61,26 +63,14 @@ class SBMLDocument:
         self.warnings = []
         sbtabs        = []
 
-        #self.testForInconvertibles()
-
         for sbtab_type in allowed_sbtabs:
             try:
-                function_name = 'self.'+sbtab_type.lower()+'SBtab()'
-                new_sbtab = eval(function_name)
-                if new_sbtab != False: sbtabs.append(new_sbtab)
+                new_sbtab = getattr(self, sbtab_type.lower()+'SBtab')()
+                if new_sbtab: sbtabs.append(new_sbtab)
             except:
                 pass
 
-        sbtabs = self.getRidOfNone(sbtabs)
-        sbtabs = self.getRidOfEmptyColumns(sbtabs)
-
-        sbtab_objects = []
-        
-        for sbtab in sbtabs:
-            so = SBtab.SBtabTable(sbtab[0], self.filename[:-4]+'_%s.tsv' % sbtab[1])
-            sbtab_objects.append(so)
-        
-        return (sbtab_objects, self.warnings)
+        return (sbtabs, self.warnings)
 
     def testForInconvertibles(self):
         '''
@@ -91,71 +81,81 @@ class SBMLDocument:
             if len(rules)>0:
                 self.warnings.append('The SBML model contains rules. These cannot be translated to the SBtab files yet.')
         except: pass
-        
-    def getRidOfNone(self,sbtabs):
+
+    def getRidOfEmptyColumns(self,header,rows):
         '''
-        Removes empty SBtabs (if no values for an SBtab were provided by the SBML).
+        Removes empty columns.
 
         Parameters
         ----------
-        sbtabs : list
-           List of single SBtab files.
+        header : list
+           Column names of the SBtab.
+        rows : list
+           Value rows of the SBtab (rows that were built before an
+           identifier column was added are padded).
         '''
-        new_tabs = []
-        for element in sbtabs:
-            if element != None:
-                new_tabs.append(element)
-        return new_tabs
+        for row in rows:
+            if len(row) < len(header): row.extend(['']*(len(header)-len(row)))
+
+        # one pass over the columns; any() stops at the first value
+        keep = [j for j,column in enumerate(zip(*rows)) if any(column)]
+        if len(keep) == len(header): return (header,rows)
+
+        return ([header[j] for j in keep],
+                [[row[j] for j in keep] for row in rows])
 
-    def getRidOfEmptyColumns(self,sbtabs):
+    def makeTable(self,table_type,header,rows):
         '''
-        Removes empty columns.
+        Builds an SBtab table object directly from the value rows, without
+        writing and parsing a table string.
 
         Parameters
         ----------
-        sbtabs : list
-           List of single SBtab files.        
+        table_type : str
+           TableType (and TableName) of the SBtab.
+        header : list
+           Column names of the SBtab.
+        rows : list
+           Value rows as lists of strings.
+
+        Returns: SBtab.SBtabTable
+           SBtab table object (False if there are no rows).
+        '''
+        if not rows: return False
+        (header,rows) = self.getRidOfEmptyColumns(header,rows)
+
+        now = datetime.datetime.now()
+        date = '-'.join([str(now.year),str(now.month),str(now.day)])
+        document = self.filename.rstrip('.xml')
+
+        return SBtab.SBtabTable.from_rows([('SBtabVersion','1.0'),
+                                           ('Document',document),
+                                           ('TableType',table_type),
+                                           ('TableName',table_type),
+                                           ('TableID',table_type),
+                                           ('Date',date)],header,rows,
+                                          self.filename[:-4]+'_%s.tsv' % table_type.lower())
+
+    def addAnnotations(self,element,header,value_row,column2ident):
+        '''
+        Writes the annotations of an SBML element to its value row; an
+        identifier column is appended to the header for every new namespace.
         '''
-        sbtab2empty_columns = {}
-
-        for i,sbtab in enumerate(sbtabs):
-            tab   = sbtab[0]
-            sptab = tab.split('\n')[1]
-            empty_columns = list(range(0,len(sptab.split('\t'))))
-            for k,element in enumerate(empty_columns): empty_columns[k] = str(element)
-            for row in sbtab[0].split('\n')[2:]:
-                for j,element in enumerate(row.split('\t')):
-                    if element != '':
-                        try: empty_columns.remove(str(j))
-                        except: pass
-            for k,element in enumerate(empty_columns): empty_columns[k] = int(element)
-            sbtab2empty_columns[i] = empty_columns
-
-        new_tabs = []
-        
-        for i,sbtab in enumerate(sbtabs):
-            eliminate_columns = sbtab2empty_columns[i]
-            new_tab = [sbtab[0].split('\n')[0]]
-            #new_tab.append(sbtab[0].split('\n')[1])
-            tab = sbtab[0].split('\n')[1:]
-            for row in tab:
-                new_row = []
-                for j,element in enumerate(row.split('\t')):
-                    if not j in eliminate_columns:
-                        new_row.append(element)
-                new_tab.append('\t'.join(new_row))
-            new_tabs.append(('\n'.join(new_tab),sbtab[1]))
-
-        return new_tabs
-                
+        try:
+            for annotation,urn in self.getAnnotations(element):
+                if urn not in column2ident:
+                    column2ident[urn] = len(header)
+                    header.append('!Identifiers:'+urn)
+                    value_row.append('')
+                value_row[column2ident[urn]] = annotation
+        except: pass
 
     def compartmentSBtab(self):
         '''
         Builds a Compartment SBtab.
         '''
-        compartment  = [['!!SBtab SBtabVersion="1.0" Document="'+self.filename.rstrip('.xml')+'" TableType="Compartment" TableName="Compartment"'],['']]
         header       = ['!Compartment','!Name','!Size','!Unit','!SBOTerm']
-        identifiers  = []
+        rows         = []
         column2ident = {}
 
         for comp in self.model.getListOfCompartments():
@@ -165,37 +165,20 @@ class SBMLDocument:
             except: pass
             try: value_row[2] = str(comp.getSize())
             except: pass
-            try: value_row[3] = str(species.getUnits())
-            except: pass
-            if str(comp.getSBOTerm()) != '-1': value_row[5] ='SBO:%.7d'%comp.getSBOTerm()
-            try:
-                annot_tuples = self.getAnnotations(comp)
-                for i,annotation in enumerate(annot_tuples):
-                    if not ("!Identifiers:"+annotation[1]) in header:
-                        identifiers.append(annotation[1])
-                        column2ident[annotation[1]] = int(len(header)+1)
-                        header.append('!Identifiers:'+annotation[1])
-                        value_row.append('')
-                    if annotation[1] in identifiers:
-                        value_row[column2ident[annotation[1]]-1] = annotation[0]
+            try: value_row[3] = str(comp.getUnits())
             except: pass
-            compartment.append(value_row)
+            if str(comp.getSBOTerm()) != '-1': value_row[4] ='SBO:%.7d'%comp.getSBOTerm()
+            self.addAnnotations(comp,header,value_row,column2ident)
+            rows.append(value_row)
 
-        compartment[1] = header
-        compartment_SB = compartment[0]
-        for row in compartment[1:]:
-            compartment_SB.append('\t'.join(row))
-        compartment_SBtab = '\n'.join(compartment_SB)
+        return self.makeTable('Compartment',header,rows)
 
-        return [compartment_SBtab,'compartment']
-        
     def compoundSBtab(self):
         '''
         Builds a Compound SBtab.
         '''
-        compound = [['!!SBtab SBtabVersion="1.0" Document="'+self.filename.rstrip('.xml')+'" TableType="Compound" TableName="Compound"'],['']]
-        header   = ['!Compound','!Name','!Location','!Charge','!IsConstant','!SBOTerm','!InitialConcentration','!hasOnlySubstanceUnits']
-        identifiers  = []
+        header       = ['!Compound','!Name','!Location','!Charge','!IsConstant','!SBOTerm','!InitialConcentration','!hasOnlySubstanceUnits']
+        rows         = []
         column2ident = {}
 
         for species in self.model.getListOfSpecies():
@@ -213,26 +196,10 @@ class SBMLDocument:
             except: pass
             try: value_row[7] = str(species.getHasOnlySubstanceUnits())
             except: pass
-            try:
-                annot_tuples = self.getAnnotations(species)
-                for i,annotation in enumerate(annot_tuples):
-                    if not ("!Identifiers:"+annotation[1]) in header:
-                        identifiers.append(annotation[1])
-                        column2ident[annotation[1]] = int(len(header)+1)
-                        header.append('!Identifiers:'+annotation[1])
-                        value_row.append('')
-                    if annotation[1] in identifiers:
-                        value_row[column2ident[annotation[1]]-1] = annotation[0]
-            except: pass
-            compound.append(value_row)
+            self.addAnnotations(species,header,value_row,column2ident)
+            rows.append(value_row)
 
-        compound[1] = header
-        compound_SB = compound[0]
-        for row in compound[1:]:
-            compound_SB.append('\t'.join(row))
-        compound_SBtab = '\n'.join(compound_SB)
-            
-        return [compound_SBtab,'compound']
+        return self.makeTable('Compound',header,rows)
 
     def eventSBtab(self):
         '''
@@ -240,34 +207,21 @@ class SBMLDocument:
         '''
         if len(self.model.getListOfEvents()) == 0:
             return False
-            
-        event    = [['!!SBtab SBtabVersion="1.0" Document="'+self.filename.rstrip('.xml')+'" TableType="Event" TableName="Event"'],['']]
-        header   = ['!Event','!Name','!Assignments','!Trigger','!SBOterm','!Delay','!UseValuesFromTriggerTime']
-        identifiers  = []
+
+        header       = ['!Event','!Name','!Assignments','!Trigger','!SBOterm','!Delay','!UseValuesFromTriggerTime']
+        rows         = []
         column2ident = {}
 
         for eve in self.model.getListOfEvents():
             value_row = ['']*len(header)
             value_row[0] = eve.getId()
             value_row[1] = eve.getName()
-            if eve.getNumEventAssignments() > 1:
-                try:
-                    eas = eve.getListOfEventAssignments()
-                    ea_entry = ''
-                    for ea in eas:
-                        var       = ea.getVariable()
-                        ea_e      = ea.getMath()
-                        ea_entry += var+' = '+libsbml.formulaToL3String(ea_e)+' | '
-                    value_row[2] = ea_entry[:-3]
-                except: pass
-            else:
-                try:
-                    eas = eve.getListOfEventAssignments()
-                    for ea in eas:
-                        var          = ea.getVariable()
-                        vr           = ea.getMath()
-                        value_row[2] = var+' = '+libsbml.formulaToL3String(vr)
-                except: pass
+            try:
+                assignments = []
+                for ea in eve.getListOfEventAssignments():
+                    assignments.append(ea.getVariable()+' = '+libsbml.formulaToL3String(ea.getMath()))
+                value_row[2] = ' | '.join(assignments)
+            except: pass
             try:
                 trigger      = eve.getTrigger().getMath()
                 value_row[3] = libsbml.formulaToL3String(trigger)
@@ -277,26 +231,10 @@ class SBMLDocument:
             except: pass
             try: value_row[6] = str(eve.getUseValuesFromTriggerTime())
             except: pass
-            try:
-                annot_tuples = self.getAnnotations(eve)
-                for i,annotation in enumerate(annot_tuples):
-                    if not ("!Identifiers:"+annotation[1]) in header:
-                        identifiers.append(annotation[1])
-                        column2ident[annotation[1]] = int(len(header)+1)
-                        header.append('!Identifiers:'+annotation[1])
-                        value_row.append('')
-                    if annotation[1] in identifiers:
-                        value_row[column2ident[annotation[1]]-1] = annotation[0]
-            except: pass
-            event.append(value_row)
+            self.addAnnotations(eve,header,value_row,column2ident)
+            rows.append(value_row)
 
-        event[1] = header
-        event_SB = event[0]
-        for row in event[1:]:
-            event_SB.append('\t'.join(row))
-        event_SBtab = '\n'.join(event_SB)
-            
-        return [event_SBtab,'event']
+        return self.makeTable('Event',header,rows)
 
     def ruleSBtab(self):
         '''
@@ -304,10 +242,9 @@ class SBMLDocument:
         '''
         if len(self.model.getListOfRules()) == 0:
             return False
-            
-        rule     = [['!!SBtab SBtabVersion="1.0" Document="'+self.filename.rstrip('.xml')+'" TableType="Rule" TableName="Rule"'],['']]
-        header   = ['!Rule','!Name','!Formula','!Unit']
-        identifiers  = []
+
+        header       = ['!Rule','!Name','!Formula','!Unit']
+        rows         = []
         column2ident = {}
 
         for ar in self.model.getListOfRules():
@@ -320,63 +257,35 @@ class SBMLDocument:
                 value_row[2] = var+' = '+libsbml.formulaToL3String(vr)
             except: pass
             try: value_row[3] = ar.getUnits()
-            except: pass            
-            try:
-                annot_tuples = self.getAnnotations(ar)
-                for i,annotation in enumerate(annot_tuples):
-                    if not ("!Identifiers:"+annotation[1]) in header:
-                        identifiers.append(annotation[1])
-                        column2ident[annotation[1]] = int(len(header)+1)
-                        header.append('!Identifiers:'+annotation[1])
-                        value_row.append('')
-                    if annotation[1] in identifiers:
-                        value_row[column2ident[annotation[1]]-1] = annotation[0]
             except: pass
-            rule.append(value_row)
+            self.addAnnotations(ar,header,value_row,column2ident)
+            rows.append(value_row)
 
-        rule[1] = header
-        rule_SB = rule[0]
-        for row in rule[1:]:
-            rule_SB.append('\t'.join(row))
-        rule_SBtab = '\n'.join(rule_SB)
-            
-        return [rule_SBtab,'rule']
+        return self.makeTable('Rule',header,rows)
 
     def getAnnotations(self,element):
         '''
         Tries to extract an annotation from an SBML element.
         '''
         cvterms      = element.getCVTerms()
-        annotation   = False
-        urn          = False
         annot_tuples = []
 
-        pattern2urn = {"CHEBI:\d+$":"obo.chebi",\
-                       "C\d+$":"kegg.compound",\
-                       "GO:\d{7}$":"obo.go",\
-                       "((S\d+$)|(Y[A-Z]{2}\d{3}[a-zA-Z](\-[A-Z])?))$":"sgd",\
-                       "SBO:\d{7}$":"biomodels.sbo",\
-                       "\d+\.-\.-\.-|\d+\.\d+\.-\.-|\d+\.\d+\.\d+\.-|\d+\.\d+\.\d+\.(n)?\d+$":"ec-code",\
-                       "K\d+$":"kegg.orthology",\
-                       "([A-N,R-Z][0-9]([A-Z][A-Z, 0-9][A-Z, 0-9][0-9]){1,2})|([O,P,Q][0-9][A-Z, 0-9][A-Z, 0-9][A-Z, 0-9][0-9])(\.\d+)?$":"uniprot"}
         for i in range(element.getNumCVTerms()):
             cvterm   = cvterms.get(i)
             for j in range(cvterm.getNumResources()):
                 resource = cvterm.getResourceURI(j)
-                for pattern in pattern2urn.keys():
-                    try:
-                        search_annot = re.search(pattern,resource)
-                        annotation   = search_annot.group(0)
-                        urn          = pattern2urn[pattern]
-                        annot_tuples.append([annotation,urn])
-                        break
-                    except: pass
-                    try:
-                        search_annot = re.search('identifiers.org/(.*)/(.*)',resource)
-                        annotation   = search_annot.group(2)
-                        urn          = search_annot.group(1)
-                        annot_tuples.append([annotation,urn])
-                    except: pass
+                match    = None
+                for k,(pattern,urn) in enumerate(pattern2urn):
+                    match = pattern.search(resource)
+                    if match: break
+                # resources that do not match the first pattern are also
+                # read as identifiers.org URIs
+                if not match or k > 0:
+                    search_annot = identifiers_org.search(resource)
+                    if search_annot:
+                        annot_tuples.append([search_annot.group(2),search_annot.group(1)])
+                if match:
+                    annot_tuples.append([match.group(0),urn])
 
         return annot_tuples
 
@@ -384,9 +293,8 @@ class SBMLDocument:
         '''
         Builds a Reaction SBtab.
         '''
-        reaction     = [['!!SBtab SBtabVersion="1.0" Document="'+self.filename.rstrip('.xml')+'" TableType="Reaction" TableName="Reaction"'],['']]
         header       = ['!Reaction','!Name','!ReactionFormula','!Location','!Regulator','!KineticLaw','!SBOTerm','!IsReversible']
-        identifiers  = []
+        rows         = []
         column2ident = {}
 
         for react in self.model.getListOfReactions():
@@ -396,106 +304,44 @@ class SBMLDocument:
             value_row[2] = self.makeSumFormula(react)
             try: value_row[3] = str(react.getCompartment())
             except: pass
-            modifiers = react.getListOfModifiers()
-            if len(modifiers)>1:
-                modifier_list = ''
-                for i,modifier in enumerate(modifiers):
-                    if i != len(react.getListOfModifiers())-1: modifier_list += modifier.getSpecies() + '|'
-                    else: modifier_list += modifier.getSpecies()
-                value_row[4] = modifier_list
-            elif len(modifiers)==1:
-                for modifier in modifiers: value_row[4] = modifier.getSpecies()
-            else: pass
+            value_row[4] = '|'.join([modifier.getSpecies() for modifier in react.getListOfModifiers()])
             try:
                 fm = react.getKineticLaw().getFormula()
                 value_row[5] = fm.replace('\n','')
             except: pass
             if str(react.getSBOTerm()) != '-1': value_row[6] ='SBO:%.7d'%react.getSBOTerm()
             try: value_row[7] = str(react.getReversible())
-            except: pass            
-            try:
-                annot_tuples = self.getAnnotations(react)
-                for i,annotation in enumerate(annot_tuples):
-                    if not ("!Identifiers:"+annotation[1]) in header:
-                        identifiers.append(annotation[1])
-                        column2ident[annotation[1]] = int(len(header))
-                        header.append('!Identifiers:'+annotation[1])
-                        value_row.append('')
-                    if annotation[1] in identifiers:
-                        value_row[column2ident[annotation[1]]] = annotation[0]
             except: pass
-            reaction.append(value_row)
+            self.addAnnotations(react,header,value_row,column2ident)
+            rows.append(value_row)
 
-        reaction[1] = header
-        reaction_SB = reaction[0]
-        for row in reaction[1:]:
-            reaction_SB.append('\t'.join(row))
-        reaction_SBtab = '\n'.join(reaction_SB)
-        
-        return [reaction_SBtab,'reaction']
+        return self.makeTable('Reaction',header,rows)
 
     def quantitySBtab(self):
         '''
         Builds a Quantity SBtab.
         '''
-        pars = True
-        if len(self.model.getListOfParameters()) == 0:
-            pars = False
-            for reaction in self.model.getListOfReactions():
-                kinetic_law = reaction.getKineticLaw()
-                if len(kinetic_law.getListOfParameters()) != 0: pars = True
-
-        if not pars: return False
-        
-        quantity_SBtab = '!!SBtab SBtabVersion="1.0" Document="'+self.filename.rstrip('.xml')+'" TableType="Quantity" TableName="Quantity"\n!Quantity\t!Parameter:SBML:parameter:id\t!Value\t!Unit\t!Type'
-        identifiers = []
-        the_rows    = ''
+        header       = ['!Quantity','!Parameter:SBML:parameter:id','!Value','!Unit','!Type']
+        rows         = []
+        column2ident = {}
+
+        def value_row(quantity,parameter,parameter_type):
+            row = [quantity,parameter.getId(),str(parameter.getValue()),'',parameter_type]
+            try: row[3] = parameter.getUnits()
+            except: pass
+            self.addAnnotations(parameter,header,row,column2ident)
+            return row
 
         for reaction in self.model.getListOfReactions():
             kinetic_law = reaction.getKineticLaw()
             if kinetic_law:
-                value_row   = ''
                 for parameter in kinetic_law.getListOfParameters():
-                    value_row += parameter.getId()+'_'+reaction.getId()+'\t'
-                    value_row += parameter.getId()+'\t'
-                    value_row += str(parameter.getValue())+'\t'
-                    try: value_row += parameter.getUnits()+'\t'
-                    except: value_row += '\t'
-                    value_row += 'local parameter\t'
-                    #quantity_SBtab += value_row
-                    try:
-                        (annotation,urn) = self.getAnnotation(parameter)
-                        if urn in identifiers: value_row += annotation+'\n'
-                        else: value_row += '\n'
-                        if not "!Identifiers:" in quantity_SBtab:
-                            quantity_SBtab += '\t'+'!Identifiers:'+urn
-                            identifiers.append(urn)
-                    except:
-                        value_row += '\n'
-                the_rows += value_row
+                    rows.append(value_row(parameter.getId()+'_'+reaction.getId(),parameter,'local parameter'))
 
         for parameter in self.model.getListOfParameters():
-            value_row = parameter.getId()+'\t'
-            value_row += parameter.getId()+'\t'
-            value_row += str(parameter.getValue())+'\t'            
-            try: value_row += parameter.getUnits()+'\t'
-            except: value_row += '\t'            
-            value_row += 'global parameter\t'
-            try:
-                (annotation,urn) = self.getAnnotation(parameter)
-                if urn in identifiers: value_row += annotation+'\n'
-                else: value_row += '\n'
-                if not "!Identifiers:" in quantity_SBtab:
-                    quantity_SBtab += '\t'+'!Identifiers:'+urn
-                    identifiers.append(urn)
-            except:
-                value_row += '\n'
-            the_rows += value_row
+            rows.append(value_row(parameter.getId(),parameter,'global parameter'))
 
-        quantity_SBtab += '\n'
-        quantity_SBtab += the_rows
-            
-        return [quantity_SBtab,'quantity']
+        return self.makeTable('Quantity',header,rows)
 
     def makeSumFormula(self,reaction):
         '''
@@ -506,73 +352,111 @@ class SBMLDocument:
         reaction : libsbml object reaction
            Single reaction object from the SBML file.
         '''
-        sumformula = ''
-        id2name    = {}
-        
-        for species in self.model.getListOfSpecies():
-            id2name[species.getId()] = species.getName()
-
-        for i,reactant in enumerate(reaction.getListOfReactants()):
-            if i != len(reaction.getListOfReactants())-1:
-                if reactant.getStoichiometry() != 1.0:
-                    sumformula += str(float(reactant.getStoichiometry())) + ' ' + reactant.getSpecies()+' + '
+        sumformula = []
+        reactants  = reaction.getListOfReactants()
+        products   = reaction.getListOfProducts()
+
+        for i,reactant in enumerate(reactants):
+            stoichiometry = reactant.getStoichiometry()
+            if i != len(reactants)-1:
+                if stoichiometry != 1.0:
+                    sumformula.append(str(float(stoichiometry)) + ' ' + reactant.getSpecies()+' + ')
                 else:
-                    sumformula += reactant.getSpecies()+' + '
+                    sumformula.append(reactant.getSpecies()+' + ')
             else:
-                if numpy.isnan(reactant.getStoichiometry()):
-                    sumformula += '1 ' + reactant.getSpecies() + ' <=> '
-                elif reactant.getStoichiometry() != 1.0:
-                    sumformula += str(float(reactant.getStoichiometry())) + ' ' + reactant.getSpecies()+' <=> '
+                if numpy.isnan(stoichiometry):
+                    sumformula.append('1 ' + reactant.getSpecies() + ' <=> ')
+                elif stoichiometry != 1.0:
+                    sumformula.append(str(float(stoichiometry)) + ' ' + reactant.getSpecies()+' <=> ')
                 else:
-                    sumformula += reactant.getSpecies()+' <=> '
-        
-        if sumformula == '': sumformula += '<=> '
-        
-        for i,product in enumerate(reaction.getListOfProducts()):
-            if i != len(reaction.getListOfProducts())-1:
-                if product.getStoichiometry() != 1.0:
-                    sumformula += str(float(product.getStoichiometry())) + ' ' + product.getSpecies()+' + '
+                    sumformula.append(reactant.getSpecies()+' <=> ')
+
+        if not sumformula: sumformula.append('<=> ')
+
+        for i,product in enumerate(products):
+            stoichiometry = product.getStoichiometry()
+            if i != len(products)-1:
+                if stoichiometry != 1.0:
+                    sumformula.append(str(float(stoichiometry)) + ' ' + product.getSpecies()+' + ')
                 else:
-                    sumformula += product.getSpecies()+' + '
+                    sumformula.append(product.getSpecies()+' + ')
             else:
-                if numpy.isnan(product.getStoichiometry()):
-                    sumformula += '1 ' + product.getSpecies() + ' <=> '
-                elif product.getStoichiometry() != 1.0:
-                    sumformula += str(float(product.getStoichiometry())) + ' ' + product.getSpecies()
+                if numpy.isnan(stoichiometry):
+                    sumformula.append('1 ' + product.getSpecies() + ' <=> ')
+                elif stoichiometry != 1.0:
+                    sumformula.append(str(float(stoichiometry)) + ' ' + product.getSpecies())
                 else:
-                    sumformula += product.getSpecies()
-            
-        #if there is no product in the reaction (e.g. influxes), don't forget the tab
-        #if len(reaction.getListOfProducts()) < 1:
-        #    sumformula += '\t'
+                    sumformula.append(product.getSpecies())
 
-        return sumformula
-        
+        return ''.join(sumformula)
 
-if __name__ == '__main__':
 
-    try: sys.argv[1]
-    except:
-        print('You have not provided input arguments. Please start the script by also providing an SBML file and an optional SBtab output filename: >python sbml2sbtab.py SBMLfile.xml Output')
-        sys.exit()
+def _convert_file(filename):
+    '''
+    converts one SBML file (module level, so that it can be run on a
+    process pool); errors are returned as warnings
+    '''
+    try:
+        reader = libsbml.SBMLReader()
+        sbml = reader.readSBML(filename)
+        model = sbml.getModel()
+        if model is None:
+            raise ConversionError('The SBML file %s could not be read.' % filename)
+        document = SBMLDocument(model, os.path.basename(filename))
+        return document.makeSBtabs()
+    except Exception as e: return ([], [str(e)])
+
+
+def convert_files(filenames, workers=None, executor='process'):
+    '''
+    Converts many SBML files to SBtab tables.
+
+    Parameters
+    ----------
+    filenames: list
+        Paths of the SBML files.
+    workers: int
+        Number of parallel workers (sequential if None).
+    executor: str
+        'process' or 'thread' pool (libsbml holds the GIL for most of the
+        conversion, so processes are faster).
+
+    Returns: list
+        One (SBtab tables, warnings) tuple per file, in the order of the
+        files.
+    '''
+    if not workers or workers < 2 or len(filenames) < 2:
+        return [_convert_file(filename) for filename in filenames]
+    import concurrent.futures
+    if executor == 'process':
+        pool_class = concurrent.futures.ProcessPoolExecutor
+    else:
+        pool_class = concurrent.futures.ThreadPoolExecutor
+    with pool_class(max_workers=workers) as pool:
+        return list(pool.map(_convert_file, filenames))
+
 
-    file_name  = sys.argv[1]
-    try: output_name = sys.argv[2]+'.csv'
-    except: output_name = file_name[:-4]+'.csv'
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
 
-    reader     = libsbml.SBMLReader()
-    sbml       = reader.readSBML(file_name)
-    model      = sbml.getModel()
-    Sbml_class = SBMLDocument(model,file_name)
+    parser.add_argument('files', nargs='+', help='Path(s) to SBML file(s).')
+    parser.add_argument('-o', '--output', help='Output directory (default: directory of each SBML file).')
+    parser.add_argument('-w', '--workers', type=int, help='Number of parallel workers.')
+    parser.add_argument('-e', '--executor', choices=['process', 'thread'], default='process', help='Type of the worker pool.')
 
-    (sbtabs,warnings) = Sbml_class.makeSBtabs()
+    args = parser.parse_args()
 
-    #print warnings
+    results = convert_files(args.files, args.workers, args.executor)
 
-    for sbtab in sbtabs:
-        sbtab_name = output_name[:-4]+'_'+sbtab[1]+output_name[-4:]
-        sbtab_file = open(sbtab_name,'w')
-        sbtab_file.write(sbtab[0])
-        sbtab_file.close()
+    failed = 0
+    for file_name, (sbtabs, warnings) in zip(args.files, results):
+        for warning in warnings: print('%s: %s' % (file_name, warning))
+        if not sbtabs: failed += 1
+        directory = args.output or os.path.dirname(file_name)
+        for sbtab in sbtabs:
+            sbtab.write(os.path.join(directory, sbtab.filename))
 
     print('The SBtab file/s have been successfully written to your working directory or chosen output path.')
+    if failed: sys.exit(1)